@@ -0,0 +1,105 @@
+"""
+Bytes-per-frame and latency of the framer frame encodings.
+
+For every resolution and encoding this measures the published message size
+and the framer -> detect_person cost: encode + serialize on the framer,
+deserialize + decode on the detector, plus the wire time over a link of
+``--link-mbps``. Broker queueing is not included.
+
+    python benchmarks/bench_frame_codec.py --video sample.mp4
+    python benchmarks/bench_frame_codec.py --resolutions 1280x720 1920x1080
+
+Without ``--video`` a synthetic scene (gradients, shapes, sensor noise) is
+used; real camera footage compresses differently, so prefer a recording.
+"""
+import argparse
+import os
+import pickle
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from frame_codec import encoding_settings, encode_frame, decode_frame  # noqa: E402
+
+ENCODINGS = [
+    ("raw", {"type": "raw"}),
+    ("jpeg q90", {"type": "jpeg", "quality": 90}),
+    ("jpeg q75", {"type": "jpeg", "quality": 75}),
+    ("jpeg q75 @1280", {"type": "jpeg", "quality": 75, "max_long_edge": 1280}),
+    ("png c1", {"type": "png", "png_compression": 1}),
+    ("downscale @960", {"type": "downscale", "max_long_edge": 960}),
+]
+
+
+def synthetic_frame(width, height, seed=0):
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    frame = np.stack([x / width * 200, y / height * 200, (x + y) / (width + height) * 255], axis=-1)
+    frame = frame.astype(np.uint8)
+    for _ in range(40):
+        x1, y1 = int(rng.integers(0, width - 50)), int(rng.integers(0, height - 50))
+        x2, y2 = x1 + int(rng.integers(20, width // 6)), y1 + int(rng.integers(40, height // 3))
+        color = tuple(int(c) for c in rng.integers(0, 255, 3))
+        cv2.rectangle(frame, (x1, y1), (x2, y2), color, -1)
+    noise = rng.normal(0, 3, frame.shape)
+    return np.clip(frame + noise, 0, 255).astype(np.uint8)
+
+
+def video_frame(path, width, height):
+    cap = cv2.VideoCapture(path)
+    ok, frame = cap.read()
+    cap.release()
+    if not ok:
+        raise SystemExit(f"Could not read a frame from {path}")
+    return cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+
+
+def measure(frame, settings, repeat, link_mbps):
+    encode_s, decode_s, size = [], [], 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        payload, header = encode_frame(frame, settings)
+        body = pickle.dumps({"camera_id": 1, "frame": payload, **header})
+        mid = time.perf_counter()
+        message = pickle.loads(body)
+        decode_frame(message["frame"], message["encoding"])
+        end = time.perf_counter()
+        encode_s.append(mid - start)
+        decode_s.append(end - mid)
+        size = len(body)
+    wire_ms = size * 8 / (link_mbps * 1e6) * 1e3
+    encode_ms = float(np.median(encode_s)) * 1e3
+    decode_ms = float(np.median(decode_s)) * 1e3
+    return {
+        "bytes": size,
+        "encode_ms": encode_ms,
+        "decode_ms": decode_ms,
+        "wire_ms": wire_ms,
+        "total_ms": encode_ms + decode_ms + wire_ms,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--video", help="Take the test frame from this video instead of a synthetic scene")
+    parser.add_argument("--resolutions", nargs="+", default=["1280x720", "1920x1080"])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--link-mbps", type=float, default=1000.0, help="Network link used for the wire time")
+    args = parser.parse_args()
+
+    print(f"{'resolution':>10} {'encoding':>16} {'KB/frame':>9} {'encode ms':>9} {'decode ms':>9} "
+          f"{'wire ms':>8} {'total ms':>8}")
+    for resolution in args.resolutions:
+        width, height = map(int, resolution.lower().split("x"))
+        frame = video_frame(args.video, width, height) if args.video else synthetic_frame(width, height)
+        for name, encoding in ENCODINGS:
+            r = measure(frame, encoding_settings(encoding), args.repeat, args.link_mbps)
+            print(f"{resolution:>10} {name:>16} {r['bytes'] / 1024:9.0f} {r['encode_ms']:9.2f} "
+                  f"{r['decode_ms']:9.2f} {r['wire_ms']:8.2f} {r['total_ms']:8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+"""
+Offline replay benchmark of the whole framer -> detect_person pipeline.
+
+Every camera replays a video file (looped) or a synthetic scene through
+the real ``framer.process_video`` in a thread; frames travel through an
+in-memory stand-in for RabbitMQ (benchmarks/inmemory_broker.py) into the
+real detect_person consumer loop: mailbox, batched detection, per-camera
+tracking, ReID track cache and gallery, result publishing. No broker,
+cameras or display are needed.
+
+With ``--stub-models`` YOLO, BoT-SORT and FastReID are replaced by cheap
+stand-ins (benchmarks/pipeline_stubs.py) to measure the pipeline overhead
+on its own; without it the real models are loaded as in production.
+
+Each camera count runs in a fresh subprocess. The report is JSON: per run
+the processed fps, per-stage latency percentiles, end-to-end latency
+(capture to result published), mailbox and broker counters, gallery growth
+over time and RSS memory.
+
+    python benchmarks/bench_pipeline.py --stub-models --cameras 1 4 8
+    python benchmarks/bench_pipeline.py --video a.mp4 b.mp4 --cameras 2 --output run.json
+
+Framer threads share the process (and the GIL) with the detector, unlike
+production where each camera is its own process, so fps at high camera
+counts is a lower bound.
+With ``--transport shm`` the ring writer and reader share one process, so
+multiprocessing's resource tracker may print KeyErrors for the rings at exit.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+REPORT_SCHEMA = 1
+SAMPLE_INTERVAL_S = 0.5
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+class StageTimer:
+    """
+    Collects (time since start, milliseconds) samples per pipeline stage.
+    """
+
+    def __init__(self):
+        self.start = time.monotonic()
+        self.samples = {}
+
+    def record(self, stage, elapsed_ms, at=None):
+        at = time.monotonic() if at is None else at
+        self.samples.setdefault(stage, []).append((at - self.start, elapsed_ms))
+
+    def wrap(self, stage, fn):
+        def timed(*args, **kwargs):
+            start = time.monotonic()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                end = time.monotonic()
+                self.record(stage, (end - start) * 1e3, end)
+        return timed
+
+    def summary(self, since):
+        out = {}
+        for stage, samples in sorted(self.samples.items()):
+            values = np.array([ms for t, ms in samples if t >= since])
+            if not len(values):
+                continue
+            p50, p90, p99 = np.percentile(values, [50, 90, 99])
+            out[stage] = {"count": int(len(values)), "mean_ms": float(values.mean()), "p50_ms": float(p50),
+                          "p90_ms": float(p90), "p99_ms": float(p99), "max_ms": float(values.max())}
+        return out
+
+
+def run_single(args, num_cameras):
+    if args.stub_models:
+        from pipeline_stubs import install_stub_models
+        install_stub_models()
+    from inmemory_broker import InMemoryBroker, install
+    from pipeline_stubs import ReplayCapture, SyntheticScene
+    broker = install(InMemoryBroker())
+
+    import framer
+    import detect_person
+    logging.disable(logging.INFO)
+
+    width, height = map(int, args.resolution.lower().split("x"))
+    stop = threading.Event()
+    sources = {}
+    for i in range(num_cameras):
+        if args.video:
+            sources[f"replay://{i}"] = args.video[i % len(args.video)]
+        else:
+            sources[f"replay://{i}"] = SyntheticScene(i, width, height, people=args.people,
+                                                      identity_pool=max(args.people, args.people * num_cameras // 2))
+    framer.cv2 = types.SimpleNamespace(**{k: getattr(framer.cv2, k) for k in dir(framer.cv2) if not k.startswith("__")})
+    framer.cv2.VideoCapture = lambda url: ReplayCapture(sources[url], args.source_fps, stop)
+    # Camera threads can't install signal handlers; production cameras are processes
+    framer.signal = types.SimpleNamespace(signal=lambda *a: None, SIGTERM=None)
+    framer.FRAME_ROUTING = "fanout"
+    if args.max_batch:
+        detect_person.DETECT_MAX_BATCH = args.max_batch
+    target_fps = framer.DEFAULT_TARGET_FPS if args.target_fps is None else args.target_fps
+
+    timer = StageTimer()
+    framer.encode_frame = timer.wrap("framer_encode", framer.encode_frame)
+    framer.pack_frame = timer.wrap("framer_serialize", framer.pack_frame)
+    detect_person.load_frame = timer.wrap("load", detect_person.load_frame)
+    # Load and warm up before timing, as main() does before consuming
+    detect_person.load_models()
+    detector = detect_person.get_detector()
+    detector.predict = timer.wrap("detect", detector.predict)
+    detect_person.camera_trackers.update = timer.wrap("track", detect_person.camera_trackers.update)
+    detect_person.extract_reid_features = timer.wrap("reid_extract", detect_person.extract_reid_features)
+    detect_person.gallery.match = timer.wrap("reid_match", detect_person.gallery.match)
+    detect_person.resolve_reid_ids = timer.wrap("reid_total", detect_person.resolve_reid_ids)
+    detect_person.process_frames = timer.wrap("batch", detect_person.process_frames)
+
+    batch_sizes, results = [], {"count": 0, "detections": 0}
+    process_frames = detect_person.process_frames
+
+    def counted_process_frames(bodies, *rest):
+        batch_sizes.append(len(bodies))
+        return process_frames(bodies, *rest)
+    detect_person.process_frames = counted_process_frames
+
+    publish_results = timer.wrap("publish", detect_person.publish_results)
+
+    def timed_publish_results(queue_name, records):
+        now = time.time()
+        for record in records:
+            timer.record("end_to_end", (now - record["capture_time"]) * 1e3)
+            results["count"] += 1
+            results["detections"] += len(record["detections"])
+        return publish_results(queue_name, records)
+    detect_person.publish_results = timed_publish_results
+
+    # Consumer first, so no frame is published before its queue exists
+    connection, channel = detect_person.setup_rabbitmq_connection("all_frame", "localhost")
+    channel.basic_qos(prefetch_count=detect_person.FRAME_PREFETCH)
+    channel = detect_person.declare_frame_queue(connection, channel, "all_frame")
+    channel.basic_consume(queue=detect_person.FRAME_QUEUE_NAME,
+                          on_message_callback=detect_person.on_frame_message, auto_ack=False)
+    detect_person.results_publisher.declare_exchange("detect_person_object", "fanout")
+
+    cameras = []
+    for i in range(num_cameras):
+        thread = threading.Thread(
+            target=framer.process_video, name=f"camera-{i + 1}",
+            args=(f"replay://{i}", i + 1, "bench", "['person']", "localhost", target_fps),
+            kwargs={"retry_limit": 1, "transport": args.transport, "encoding": args.encoding,
+                    "motion": args.motion_gate},
+            daemon=True)
+        cameras.append(thread)
+
+    samples = []
+    rss_start = rss_mb()
+
+    def control():
+        deadline = timer.start + args.duration
+        while time.monotonic() < deadline:
+            samples.append({"t": round(time.monotonic() - timer.start, 3),
+                            "gallery_size": len(detect_person.gallery),
+                            "results": results["count"],
+                            "rss_mb": round(rss_mb(), 1)})
+            time.sleep(SAMPLE_INTERVAL_S)
+        stop.set()
+        for thread in cameras:
+            thread.join(5)
+        framer.rabbitmq_logger.close(1.0)
+        detect_person.rabbitmq_logger.close(1.0)
+        broker.close()
+
+    for thread in cameras:
+        thread.start()
+    controller = threading.Thread(target=control, name="bench-control", daemon=True)
+    controller.start()
+    detect_person.consume_frames(connection, channel, "detect_person_object", "localhost")
+    controller.join()
+
+    measured = args.duration - args.warmup
+    stages = timer.summary(since=args.warmup)
+    processed = stages.get("end_to_end", {}).get("count", 0)
+    return {
+        "cameras": num_cameras,
+        "duration_s": args.duration,
+        "warmup_s": args.warmup,
+        "fps": processed / measured if measured > 0 else None,
+        "fps_per_camera": processed / measured / num_cameras if measured > 0 else None,
+        "frames_published": broker.published_by_exchange.get("all_frame", 0),
+        "results_published": results["count"],
+        "detections": results["detections"],
+        "mean_batch_size": float(np.mean(batch_sizes)) if batch_sizes else 0.0,
+        "stages": stages,
+        "mailbox": detect_person.frame_mailbox.stats(),
+        "broker": dict(broker.counters),
+        "gallery": {"final_size": len(detect_person.gallery), "stats": detect_person.gallery.stats(),
+                    "growth": [[s["t"], s["gallery_size"]] for s in samples]},
+        "memory": {"rss_start_mb": round(rss_start, 1),
+                   "rss_peak_mb": round(max([s["rss_mb"] for s in samples] + [rss_mb()]), 1),
+                   "rss_end_mb": round(rss_mb(), 1)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cameras", type=int, nargs="+", default=[1, 4], help="Camera counts to run")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds per run")
+    parser.add_argument("--warmup", type=float, default=3.0, help="Seconds excluded from the statistics")
+    parser.add_argument("--video", nargs="+", help="Video files replayed by the cameras (round-robin)")
+    parser.add_argument("--resolution", default="1280x720", help="Synthetic scene resolution")
+    parser.add_argument("--people", type=int, default=4, help="People per synthetic camera")
+    parser.add_argument("--source-fps", type=float, default=25.0, help="Camera frame rate, 0 = unpaced")
+    parser.add_argument("--target-fps", type=float, default=None,
+                        help="Frames published per camera per second (framer default if unset, 0 = all)")
+    parser.add_argument("--encoding", default="raw", help="Frame encoding, see frame_codec")
+    parser.add_argument("--transport", default="inline", choices=["inline", "shm"])
+    parser.add_argument("--motion-gate", help="Motion gate method (diff, mog2), see motion_gate; off if unset")
+    parser.add_argument("--max-batch", type=int, help="Override detect_person.DETECT_MAX_BATCH")
+    parser.add_argument("--stub-models", action="store_true", help="Replace YOLO, BoT-SORT and FastReID with stubs")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--single", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single is not None:
+        report = run_single(args, args.single)
+        with open(args.output, "w") as f:
+            json.dump(report, f)
+        # Model and logger threads may linger; the report is written
+        os._exit(0)
+
+    runs = []
+    for count in args.cameras:
+        with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as tmp:
+            path = tmp.name
+        command = [sys.executable, os.path.abspath(__file__), *_child_args(args), "--single", str(count),
+                   "--output", path]
+        print(f"[bench] {count} camera(s) for {args.duration:.0f}s ...", file=sys.stderr)
+        proc = subprocess.run(command, stdout=subprocess.DEVNULL)
+        try:
+            if proc.returncode != 0:
+                runs.append({"cameras": count, "error": f"exit code {proc.returncode}"})
+                continue
+            with open(path) as f:
+                run = json.load(f)
+            runs.append(run)
+            print(f"[bench] {count} camera(s): {run['fps']:.1f} fps, "
+                  f"e2e p50 {run['stages'].get('end_to_end', {}).get('p50_ms', float('nan')):.1f} ms, "
+                  f"gallery {run['gallery']['final_size']}, peak RSS {run['memory']['rss_peak_mb']} MB",
+                  file=sys.stderr)
+        finally:
+            os.unlink(path)
+
+    report = {
+        "benchmark": "pipeline_replay",
+        "schema": REPORT_SCHEMA,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "cpu_count": os.cpu_count()},
+        "config": {k: v for k, v in vars(args).items() if k not in ("single", "output")},
+        "runs": runs,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+def _child_args(args):
+    argv = ["--duration", str(args.duration), "--warmup", str(args.warmup), "--resolution", args.resolution,
+            "--people", str(args.people), "--source-fps", str(args.source_fps), "--encoding", args.encoding,
+            "--transport", args.transport]
+    if args.video:
+        argv += ["--video", *args.video]
+    if args.target_fps is not None:
+        argv += ["--target-fps", str(args.target_fps)]
+    if args.max_batch:
+        argv += ["--max-batch", str(args.max_batch)]
+    if args.motion_gate:
+        argv += ["--motion-gate", args.motion_gate]
+    if args.stub_models:
+        argv.append("--stub-models")
+    return argv
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Speed and accuracy of the ReID inference backends against the eager model.
+
+Loads the FastReID model through reid_model.get_reid_model, builds each
+requested backend configuration and reports load/export time, crops per
+second at several batch sizes, and how closely its embeddings match the
+eager ones (mean / min cosine similarity and top-1 nearest-neighbour
+agreement, see reid_backend.compare_embeddings). Use it to pick the
+backend, quantize and fp16_output settings of the "reid" model
+(REID_BACKEND, REID_QUANTIZE, REID_FP16_OUTPUT) for a node.
+
+Configurations are written ``backend[:quantize][+fp16]``:
+
+    python benchmarks/bench_reid_backend.py
+    python benchmarks/bench_reid_backend.py --threads 4 --crops-dir crops/ \\
+        --configs eager torchscript onnx onnx:dynamic onnx:static+fp16
+
+Static INT8 needs --crops-dir (real person crops, also used for the
+accuracy check); without it the crops are cut from a synthetic or --video
+frame, which is fine for speed but less telling for accuracy.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from reid_backend import build_backend, compare_embeddings  # noqa: E402
+from reid_preprocess import REID_INPUT_SIZE, preprocess_crops  # noqa: E402
+import reid_model  # noqa: E402
+from bench_frame_codec import synthetic_frame, video_frame  # noqa: E402
+from bench_reid_preprocess import random_boxes  # noqa: E402
+
+
+def parse_config(text):
+    fp16 = text.endswith("+fp16")
+    backend, _, quantize = text[:-5 if fp16 else None].partition(":")
+    return backend, quantize or None, fp16
+
+
+def frame_crops(args):
+    width, height = map(int, args.resolution.lower().split("x"))
+    frame = video_frame(args.video, width, height) if args.video else synthetic_frame(width, height)
+    boxes = random_boxes(frame, args.crops, np.random.default_rng(0))
+    batch, _ = preprocess_crops(frame, boxes)
+    return batch.copy()
+
+
+def throughput(backend, crops, batch_size, repeat):
+    batches = [crops[i:i + batch_size] for i in range(0, len(crops), batch_size)]
+    backend(batches[0])  # warm-up
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for batch in batches:
+            backend(batch)
+        samples.append(time.perf_counter() - start)
+    return len(crops) / float(np.median(samples))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--configs", nargs="+", default=["eager", "torchscript", "onnx", "onnx:dynamic"])
+    parser.add_argument("--crops-dir", help="Directory of person crop images (calibration + accuracy set)")
+    parser.add_argument("--video", help="Cut crops from this video instead of a synthetic scene")
+    parser.add_argument("--resolution", default="1920x1080")
+    parser.add_argument("--crops", type=int, default=64, help="Crops cut from the frame without --crops-dir")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--threads", type=int, default=0, help="Inference threads, 0 for the library default")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--export-dir", help="Where to write exports (default: a temporary directory)")
+    args = parser.parse_args()
+
+    if args.crops_dir:
+        calibration = reid_model.load_calibration_batches(args.crops_dir)
+        crops = np.concatenate(calibration)
+    else:
+        crops = frame_crops(args)
+        calibration = [crops[i:i + 32] for i in range(0, len(crops), 32)]
+    export_dir = args.export_dir or tempfile.mkdtemp(prefix="reid-exports-")
+    reid = reid_model.get_reid_model()
+    model, cfg = reid.model, reid.cfg
+
+    def build(backend, quantize=None, fp16=False):
+        return build_backend(model, cfg.MODEL.DEVICE, reid.weights_path, REID_INPUT_SIZE,
+                             backend=backend, quantize=quantize, calibration=calibration,
+                             num_threads=args.threads, fp16_output=fp16, export_dir=export_dir)
+
+    reference = build("eager")
+    expected = np.concatenate([reference(batch) for batch in calibration])
+    print(f"{len(crops)} crops, device {cfg.MODEL.DEVICE}, threads {args.threads or 'default'}, "
+          f"exports in {export_dir}")
+    header = " ".join(f"{'crops/s @' + str(b):>12}" for b in args.batch_sizes)
+    print(f"{'config':<22} {'load s':>7} {header} {'mean cos':>9} {'min cos':>8} {'top-1':>6}")
+    for text in args.configs:
+        try:
+            backend = build(*parse_config(text))
+        except Exception as e:
+            print(f"{text:<22} failed: {e}")
+            continue
+        accuracy = compare_embeddings(expected, np.concatenate([backend(batch) for batch in calibration]))
+        rates = " ".join(f"{throughput(backend, crops, b, args.repeat):12.1f}" for b in args.batch_sizes)
+        print(f"{text:<22} {backend.load_seconds:7.1f} {rates} {accuracy['mean_cosine']:9.4f} "
+              f"{accuracy['min_cosine']:8.4f} {accuracy['top1_agreement']:6.3f}")
+
+
+if __name__ == "__main__":
+    main()
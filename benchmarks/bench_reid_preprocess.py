@@ -0,0 +1,124 @@
+"""
+Per-crop cost and equivalence of the ReID preprocessing paths.
+
+Compares reid_preprocess.preprocess_crops (cv2 resize straight from the
+frame into one preallocated NCHW batch) with the original per-crop path:
+cvtColor -> PIL Image -> Resize((256, 128)) -> ToTensor -> Normalize ->
+stack. torchvision is used for the reference when installed; otherwise
+its PIL steps are reproduced with PIL + NumPy, which is what torchvision
+does for PIL images.
+
+The check fails (exit code 1) if the mean or 99th percentile absolute
+difference exceeds its tolerance, in normalised units (1.0 ~ 57 grey
+levels). The max is reported but not gated: cv2's area filter and PIL's
+antialiased bilinear filter differ most right on hard edges.
+
+    python benchmarks/bench_reid_preprocess.py
+    python benchmarks/bench_reid_preprocess.py --video sample.mp4 --crops 16
+"""
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from reid_preprocess import REID_INPUT_SIZE, REID_PIXEL_MEAN, REID_PIXEL_STD, crop_box, preprocess_crops  # noqa: E402
+from bench_frame_codec import synthetic_frame, video_frame  # noqa: E402
+
+MEAN_TOLERANCE = 0.02
+P99_TOLERANCE = 0.15
+
+
+def reference_path():
+    try:
+        import torch
+        import torchvision.transforms as transforms
+    except ImportError:
+        mean = np.array(REID_PIXEL_MEAN, dtype=np.float32)
+        std = np.array(REID_PIXEL_STD, dtype=np.float32)
+
+        def transform(img):
+            img = img.resize(REID_INPUT_SIZE[::-1], Image.BILINEAR)
+            return ((np.asarray(img, dtype=np.float32) / 255.0 - mean) / std).transpose(2, 0, 1)
+        stack, name = np.stack, "PIL + NumPy"
+    else:
+        transform = transforms.Compose([
+            transforms.Resize(REID_INPUT_SIZE),
+            transforms.ToTensor(),
+            transforms.Normalize(mean=list(REID_PIXEL_MEAN), std=list(REID_PIXEL_STD)),
+        ])
+        stack, name = (lambda tensors: torch.stack(tensors).numpy()), "torchvision"
+
+    def preprocess(frame, boxes):
+        tensors = []
+        for box in boxes:
+            crop = crop_box(frame, box)
+            if crop is not None:
+                tensors.append(transform(Image.fromarray(cv2.cvtColor(crop, cv2.COLOR_BGR2RGB))))
+        return stack(tensors)
+    return preprocess, name
+
+
+def random_boxes(frame, count, rng):
+    """
+    Person-shaped boxes from far (smaller than the model input) to near.
+    """
+    h, w = frame.shape[:2]
+    boxes = []
+    for _ in range(count):
+        bh = int(rng.uniform(0.08, 0.9) * h)
+        bw = max(8, int(bh * rng.uniform(0.3, 0.5)))
+        x1, y1 = int(rng.integers(0, w - bw)), int(rng.integers(0, h - bh))
+        boxes.append((x1, y1, x1 + bw, y1 + bh))
+    return boxes
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return float(np.median(samples))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--video", help="Take the test frame from this video instead of a synthetic scene")
+    parser.add_argument("--resolution", default="1920x1080")
+    parser.add_argument("--crops", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--repeat", type=int, default=30)
+    args = parser.parse_args()
+
+    width, height = map(int, args.resolution.lower().split("x"))
+    frame = video_frame(args.video, width, height) if args.video else synthetic_frame(width, height)
+    reference, reference_name = reference_path()
+    rng = np.random.default_rng(0)
+
+    ok = True
+    print(f"reference: {reference_name}")
+    print(f"{'crops':>5} {'reference us/crop':>17} {'cv2 us/crop':>11} {'speedup':>7} {'mean diff':>9} "
+          f"{'p99 diff':>8} {'max diff':>8}")
+    for count in args.crops:
+        boxes = random_boxes(frame, count, rng)
+        expected = reference(frame, boxes)
+        actual, _ = preprocess_crops(frame, boxes)
+        diff = np.abs(actual - expected)
+        p99 = float(np.percentile(diff, 99))
+        ref_s = timed(lambda: reference(frame, boxes), args.repeat)
+        new_s = timed(lambda: preprocess_crops(frame, boxes), args.repeat)
+        print(f"{count:5d} {ref_s / count * 1e6:17.1f} {new_s / count * 1e6:11.1f} {ref_s / new_s:6.1f}x "
+              f"{diff.mean():9.4f} {p99:8.4f} {diff.max():8.4f}")
+        ok &= diff.mean() <= MEAN_TOLERANCE and p99 <= P99_TOLERANCE
+    if not ok:
+        print(f"FAIL: outputs differ by more than mean {MEAN_TOLERANCE} / p99 {P99_TOLERANCE}")
+        sys.exit(1)
+    print(f"OK: within mean {MEAN_TOLERANCE} / p99 {P99_TOLERANCE} of the reference")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Serialize/deserialize cost and size of the wire format against pickle.
+
+Covers every message kind the services exchange: raw and JPEG frames,
+shared-memory frame descriptors, camera commands, log records and
+detection results. Deserializing a frame includes touching its pixels
+once, so a lazy zero-copy view is not credited for work it only defers.
+
+    python benchmarks/bench_wire_format.py
+    python benchmarks/bench_wire_format.py --resolutions 1920x1080 --repeat 200
+"""
+import argparse
+import os
+import pickle
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from wire_format import (KIND_CAMERA_COMMAND, KIND_LOG, KIND_RESULT, pack_frame, pack_message,  # noqa: E402
+                         unpack_frame, unpack_message)
+
+
+def frame_message(frame):
+    return {
+        "camera_id": 21, "frame": frame, "user_id": "u-1", "date_time": "2026-01-01 10:00:00",
+        "capture_time": 1767261600.25, "object_list": "['person']", "seq": 1234, "stream": "a1b2c3d4",
+        "capture_ts_ms": 123456789.5, "host": "framer-01", "encoding": "raw",
+        "source_shape": list(frame.shape) if isinstance(frame, np.ndarray) else [1080, 1920, 3],
+    }
+
+
+def messages(resolutions):
+    rng = np.random.default_rng(0)
+    cases = []
+    for resolution in resolutions:
+        width, height = map(int, resolution.lower().split("x"))
+        frame = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+        cases.append((f"frame raw {resolution}", "frame", frame_message(frame)))
+        jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 75])[1].tobytes()
+        cases.append((f"frame jpeg {resolution}", "frame", dict(frame_message(jpeg), encoding="jpeg")))
+    shm = dict(frame_message(None), transport="shm", shm={
+        "shm_name": "mc_frames_21_ab12", "slots": 8, "slot_bytes": 6220800, "slot": 3, "seq": 1234,
+        "shape": [1080, 1920, 3], "dtype": "|u1", "timestamp": 1767261600.25})
+    cases.append(("frame shm descriptor", "frame", shm))
+    cases.append(("camera command", KIND_CAMERA_COMMAND, {
+        "CameraId": 21, "CameraUrl": "rtsp://10.0.0.21/stream1", "Running": True, "UserId": "u-1",
+        "ObjectList": "['person']", "Transport": "inline", "Encoding": {"type": "jpeg", "quality": 80},
+        "TargetFps": 3}))
+    cases.append(("log record", KIND_LOG, {
+        "log_level": "INFO", "Event_Type": "Numbper Plate detection event",
+        "Message": "Sent a frame from camera 21 (Process ID: 4242)", "datetime": "2026-01-01 10:00:00"}))
+    cases.append(("result (12 people)", KIND_RESULT, {
+        "camera_id": 21, "user_id": "u-1", "date_time": "2026-01-01 10:00:00", "capture_time": 1767261600.25,
+        "seq": 1234, "stream": "a1b2c3d4", "timestamp": 1767261600.41, "frame_shape": [1080, 1920],
+        "detections": [{"track_id": i, "reid_id": 1000 + i, "box": [10 * i, 20, 10 * i + 80, 220],
+                        "score": 0.8731, "class_name": "person"} for i in range(12)]}))
+    return cases
+
+
+def touch(frame):
+    if isinstance(frame, np.ndarray):
+        return int(frame[::64, ::64].sum())
+    if frame is not None:
+        return len(bytes(frame[:64]))
+    return 0
+
+
+def measure(kind, message, repeat):
+    if kind == "frame":
+        wire_dumps, wire_loads = pack_frame, lambda body: touch(unpack_frame(body)["frame"])
+    else:
+        wire_dumps, wire_loads = (lambda m: pack_message(kind, m)), unpack_message
+    pickle_loads = lambda body: touch(pickle.loads(body).get("frame"))  # noqa: E731
+    row = {}
+    for name, dumps, loads in (("pickle", pickle.dumps, pickle_loads), ("wire", wire_dumps, wire_loads)):
+        dump_s, load_s = [], []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            body = dumps(message)
+            mid = time.perf_counter()
+            loads(body)
+            end = time.perf_counter()
+            dump_s.append(mid - start)
+            load_s.append(end - mid)
+        row[name] = (len(body), float(np.median(dump_s)) * 1e6, float(np.median(load_s)) * 1e6)
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--resolutions", nargs="+", default=["1280x720", "1920x1080"])
+    parser.add_argument("--repeat", type=int, default=100)
+    args = parser.parse_args()
+
+    print(f"{'message':>22} {'pickle B':>9} {'wire B':>9} {'pickle dump us':>14} {'wire dump us':>12} "
+          f"{'pickle load us':>14} {'wire load us':>12}")
+    for name, kind, message in messages(args.resolutions):
+        row = measure(kind, message, args.repeat)
+        (p_size, p_dump, p_load), (w_size, w_dump, w_load) = row["pickle"], row["wire"]
+        print(f"{name:>22} {p_size:9d} {w_size:9d} {p_dump:14.1f} {w_dump:12.1f} {p_load:14.1f} {w_load:12.1f}")
+
+
+if __name__ == "__main__":
+    main()
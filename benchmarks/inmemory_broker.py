@@ -0,0 +1,255 @@
+"""
+In-process stand-in for the parts of pika's BlockingConnection the services use.
+
+``install(broker)`` replaces ``pika.BlockingConnection`` so every connection
+the framer, detect_person, the loggers and the publishers open talks to one
+shared ``InMemoryBroker`` instead of RabbitMQ. Exchanges (fanout, direct and
+the default exchange), queue bindings, ``x-max-length`` with drop-head,
+prefetch limits, manual acks and ``process_data_events`` are modelled;
+persistence, TTLs, confirms and heartbeats are not.
+"""
+import itertools
+import threading
+import time
+from collections import deque
+from types import SimpleNamespace
+
+import pika
+
+# Queues declared without x-max-length keep at most this many messages, so
+# queues nobody consumes in a benchmark (logs) don't grow without bound
+DEFAULT_RETAIN = 1000
+
+
+class InMemoryBroker:
+    """
+    Exchanges, queues and consumers shared by all in-memory connections.
+    """
+
+    def __init__(self, default_retain=DEFAULT_RETAIN):
+        self.default_retain = default_retain
+        self._cond = threading.Condition()
+        self._exchanges = {"": "direct"}
+        self._bindings = {}  # exchange -> set of (queue, routing_key)
+        self._queues = {}    # queue -> deque of (properties, body)
+        self._limits = {}    # queue -> max length
+        self._consumers = {}  # queue -> list of (channel, callback, auto_ack)
+        self._names = itertools.count(1)
+        self.closed = False
+        self.counters = {"published": 0, "unroutable": 0, "dropped": 0, "delivered": 0}
+        self.published_by_exchange = {}
+
+    def close(self):
+        """
+        Close every connection: channels report ``is_open`` False from now on.
+        """
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def declare_exchange(self, exchange, exchange_type):
+        with self._cond:
+            self._exchanges.setdefault(exchange, exchange_type)
+            self._bindings.setdefault(exchange, set())
+
+    def declare_queue(self, queue, arguments=None, passive=False):
+        with self._cond:
+            if not queue:
+                queue = f"amq.gen-{next(self._names)}"
+            if passive and queue not in self._queues:
+                raise pika.exceptions.ChannelClosedByBroker(404, f"NOT_FOUND - no queue '{queue}'")
+            if queue not in self._queues:
+                self._queues[queue] = deque()
+                self._limits[queue] = (arguments or {}).get("x-max-length", self.default_retain)
+            return queue
+
+    def bind(self, exchange, queue, routing_key):
+        with self._cond:
+            self._bindings.setdefault(exchange, set()).add((queue, routing_key or ""))
+
+    def unbind(self, exchange, queue, routing_key):
+        with self._cond:
+            self._bindings.get(exchange, set()).discard((queue, routing_key or ""))
+
+    def delete_queue(self, queue):
+        with self._cond:
+            self._queues.pop(queue, None)
+            self._consumers.pop(queue, None)
+            for bindings in self._bindings.values():
+                for binding in [b for b in bindings if b[0] == queue]:
+                    bindings.discard(binding)
+
+    def _route(self, exchange, routing_key):
+        if exchange == "":
+            return [routing_key] if routing_key in self._queues else []
+        exchange_type = self._exchanges.get(exchange, "fanout")
+        queues = []
+        for queue, key in self._bindings.get(exchange, ()):
+            if exchange_type == "fanout" or key == routing_key:
+                queues.append(queue)
+        return queues
+
+    def publish(self, exchange, routing_key, body, properties):
+        with self._cond:
+            self.counters["published"] += 1
+            self.published_by_exchange[exchange] = self.published_by_exchange.get(exchange, 0) + 1
+            queues = [q for q in self._route(exchange, routing_key) if q in self._queues]
+            if not queues:
+                self.counters["unroutable"] += 1
+            for queue in queues:
+                messages = self._queues[queue]
+                messages.append((properties, body))
+                if self._limits[queue] is not None and len(messages) > self._limits[queue]:
+                    messages.popleft()
+                    self.counters["dropped"] += 1
+            if queues:
+                self._cond.notify_all()
+
+    def consume(self, queue, channel, callback, auto_ack):
+        with self._cond:
+            self._consumers.setdefault(queue, []).append((channel, callback, auto_ack))
+
+    def cancel(self, channel):
+        with self._cond:
+            for queue, consumers in self._consumers.items():
+                self._consumers[queue] = [c for c in consumers if c[0] is not channel]
+
+    def _take(self, connection):
+        """
+        Pop deliverable messages for the consumers of ``connection``.
+        """
+        deliveries = []
+        for queue, consumers in self._consumers.items():
+            messages = self._queues.get(queue)
+            for channel, callback, auto_ack in consumers:
+                if channel.connection is not connection or not channel.is_open:
+                    continue
+                while messages and (auto_ack or channel.prefetch_count == 0
+                                    or len(channel.unacked) < channel.prefetch_count):
+                    properties, body = messages.popleft()
+                    tag = next(channel.delivery_tags)
+                    if not auto_ack:
+                        channel.unacked.add(tag)
+                    method = SimpleNamespace(delivery_tag=tag, routing_key=queue, exchange="", redelivered=False)
+                    deliveries.append((callback, channel, method, properties, body))
+        self.counters["delivered"] += len(deliveries)
+        return deliveries
+
+    def process(self, connection, time_limit):
+        """
+        Deliver pending messages to ``connection``'s consumers, waiting up to
+        ``time_limit`` seconds for the first one.
+        """
+        deadline = None if time_limit is None else time.monotonic() + time_limit
+        with self._cond:
+            deliveries = self._take(connection)
+            while not deliveries and not self.closed:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+                deliveries = self._take(connection)
+        for callback, channel, method, properties, body in deliveries:
+            callback(channel, method, properties, body)
+
+    def queue_depths(self):
+        with self._cond:
+            return {queue: len(messages) for queue, messages in self._queues.items()}
+
+
+class InMemoryChannel:
+    def __init__(self, connection):
+        self.connection = connection
+        self.broker = connection.broker
+        self.prefetch_count = 0
+        self.unacked = set()
+        self.delivery_tags = itertools.count(1)
+        self._open = True
+
+    @property
+    def is_open(self):
+        return self._open and not self.broker.closed
+
+    @property
+    def is_closed(self):
+        return not self.is_open
+
+    def close(self):
+        self._open = False
+        self.broker.cancel(self)
+
+    def confirm_delivery(self):
+        pass
+
+    def basic_qos(self, prefetch_count=0, **kwargs):
+        self.prefetch_count = prefetch_count
+
+    def exchange_declare(self, exchange, exchange_type="direct", **kwargs):
+        self.broker.declare_exchange(exchange, exchange_type)
+
+    def queue_declare(self, queue="", passive=False, arguments=None, **kwargs):
+        name = self.broker.declare_queue(queue, arguments, passive)
+        return SimpleNamespace(method=SimpleNamespace(queue=name, message_count=0, consumer_count=0))
+
+    def queue_bind(self, queue, exchange, routing_key=None, **kwargs):
+        self.broker.bind(exchange, queue, routing_key)
+
+    def queue_unbind(self, queue, exchange, routing_key=None, **kwargs):
+        self.broker.unbind(exchange, queue, routing_key)
+
+    def queue_delete(self, queue, **kwargs):
+        self.broker.delete_queue(queue)
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, mandatory=False):
+        if not self.is_open:
+            raise pika.exceptions.ChannelWrongStateError("Channel is closed.")
+        self.broker.publish(exchange, routing_key, bytes(body), properties or pika.BasicProperties())
+
+    def basic_consume(self, queue, on_message_callback, auto_ack=False, **kwargs):
+        self.broker.consume(queue, self, on_message_callback, auto_ack)
+        return f"ctag-{id(self)}"
+
+    def basic_ack(self, delivery_tag=0, multiple=False):
+        self.unacked.discard(delivery_tag)
+
+    def basic_nack(self, delivery_tag=0, multiple=False, requeue=True):
+        self.unacked.discard(delivery_tag)
+
+    def basic_cancel(self, consumer_tag=None):
+        self.broker.cancel(self)
+
+
+class InMemoryConnection:
+    broker = None  # set by install()
+
+    def __init__(self, parameters=None):
+        self._open = True
+
+    @property
+    def is_open(self):
+        return self._open and not self.broker.closed
+
+    @property
+    def is_closed(self):
+        return not self.is_open
+
+    def channel(self):
+        return InMemoryChannel(self)
+
+    def process_data_events(self, time_limit=0):
+        self.broker.process(self, time_limit)
+
+    def sleep(self, duration):
+        self.broker.process(self, duration)
+
+    def close(self):
+        self._open = False
+
+
+def install(broker):
+    """
+    Route every new ``pika.BlockingConnection`` to ``broker``.
+    """
+    InMemoryConnection.broker = broker
+    pika.BlockingConnection = InMemoryConnection
+    return broker
@@ -0,0 +1,251 @@
+"""
+Stand-ins for the cameras and neural nets of the pipeline.
+
+``SyntheticScene`` renders frames with "people": rectangles whose blue
+channel is saturated while the background's never is, each identity with
+its own shirt/trousers colours. The stub detector finds them by
+thresholding that channel, the stub trackers associate boxes by IoU and
+the stub ReID embeds a coarse colour layout of the crop. Together they keep
+every data path of detect_person busy (batching, tracking, track cache,
+gallery, publishing) at a fraction of the cost of YOLO, BoT-SORT and
+FastReID, so pipeline overhead can be measured on its own.
+
+``install_stub_models()`` must run before detect_person is imported.
+"""
+import sys
+import time
+import types
+
+import cv2
+import numpy as np
+
+PERSON_SIZE = (60, 150)  # width, height in pixels at 1280x720
+BACKGROUND_MAX_BLUE = 200
+PERSON_MIN_BLUE = 240
+
+
+class SyntheticScene:
+    """
+    Frames of one camera with ``people`` identities walking across.
+
+    Identities are drawn from a pool shared by all cameras (same seed), so
+    the same person shows up on several cameras and cross-camera ReID is
+    exercised.
+    """
+
+    def __init__(self, camera_index, width=1280, height=720, people=4, identity_pool=16, seed=0):
+        rng = np.random.default_rng(seed * 1000 + camera_index)
+        self.width, self.height = width, height
+        y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+        background = np.stack([
+            (x + y) / (width + height) * BACKGROUND_MAX_BLUE,
+            x / width * 180 + 40,
+            y / height * 180 + 40,
+        ], axis=-1)
+        self.background = background.astype(np.uint8)
+        palette = np.random.default_rng(seed).integers(0, 255, (identity_pool, 2, 2))
+        scale = width / 1280.0
+        self.size = (int(PERSON_SIZE[0] * scale), int(PERSON_SIZE[1] * scale))
+        self.people = []
+        for identity in rng.choice(identity_pool, size=min(people, identity_pool), replace=False):
+            self.people.append({
+                "colors": palette[identity],
+                "pos": rng.uniform([0, 0], [width - self.size[0], height - self.size[1]]),
+                "vel": rng.uniform(-60, 60, 2) * scale,  # pixels per second
+            })
+
+    def render(self, t):
+        frame = self.background.copy()
+        w, h = self.size
+        span = np.array([self.width - w, self.height - h], dtype=np.float64)
+        for person in self.people:
+            # Walk back and forth inside the frame
+            pos = np.abs((person["pos"] + person["vel"] * t) % (2 * span) - span)
+            span_pos = span - pos
+            x1, y1 = int(span_pos[0]), int(span_pos[1])
+            (g1, r1), (g2, r2) = person["colors"]
+            cv2.rectangle(frame, (x1, y1), (x1 + w, y1 + h // 2), (255, int(g1), int(r1)), -1)
+            cv2.rectangle(frame, (x1, y1 + h // 2), (x1 + w, y1 + h), (255, int(g2), int(r2)), -1)
+        return frame
+
+
+class ReplayCapture:
+    """
+    ``cv2.VideoCapture`` stand-in that plays a video file or a synthetic
+    scene at ``fps`` frames per second (0 = as fast as it is read), until
+    ``stop_event`` is set.
+    """
+
+    def __init__(self, source, fps, stop_event):
+        self.source = source
+        self.period = 1.0 / fps if fps else 0.0
+        self.stop_event = stop_event
+        self.started = time.monotonic()
+        self.next_frame = self.started
+        self.frames = 0
+        self._pending = None
+        self._video = None
+        if isinstance(source, str):
+            self._video = _RealVideoCapture(source)
+
+    def isOpened(self):
+        if self.stop_event.is_set():
+            return False
+        return self._video is None or self._video.isOpened()
+
+    def grab(self):
+        if self.period:
+            delay = self.next_frame - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self.next_frame += self.period
+        if self._video is not None:
+            ok = self._video.grab()
+            if not ok:
+                # Loop the recording
+                self._video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                ok = self._video.grab()
+            self._pending = ok
+            return ok
+        self._pending = time.monotonic() - self.started
+        self.frames += 1
+        return True
+
+    def retrieve(self):
+        if self._video is not None:
+            return self._video.retrieve()
+        return True, self.source.render(self._pending)
+
+    def read(self):
+        if not self.grab():
+            return False, None
+        return self.retrieve()
+
+    def release(self):
+        if self._video is not None:
+            self._video.release()
+
+
+_RealVideoCapture = cv2.VideoCapture
+
+
+class StubBoxes:
+    def __init__(self, xyxy, ids=None):
+        self.xyxy = xyxy
+        self.cls = np.zeros(len(xyxy), dtype=np.float32)
+        self.conf = np.full(len(xyxy), 0.9, dtype=np.float32)
+        self.id = ids
+
+
+class StubResults:
+    names = {0: "person"}
+
+    def __init__(self, boxes):
+        self.boxes = boxes
+
+
+class StubYOLO:
+    """
+    Detector stand-in: connected components of the saturated blue channel.
+    """
+
+    def __init__(self, model_path=None):
+        self.model_path = model_path
+
+    def predict(self, source, classes=None, verbose=False, **kwargs):
+        frames = source if isinstance(source, list) else [source]
+        results = []
+        for frame in frames:
+            mask = (frame[:, :, 0] >= PERSON_MIN_BLUE).astype(np.uint8)
+            count, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=4)
+            boxes = [(x, y, x + w, y + h) for x, y, w, h, area in stats[1:count] if area >= 200]
+            results.append(StubResults(StubBoxes(np.asarray(boxes, dtype=np.float32).reshape(-1, 4))))
+        return results
+
+    __call__ = predict
+
+
+def _iou_matrix(a, b):
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-6)
+
+
+class StubCameraTrackers:
+    """
+    Same interface as camera_trackers.CameraTrackers; greedy IoU association.
+    """
+
+    def __init__(self, tracker_config=None, frame_rate=30):
+        self._trackers = {}
+
+    def __contains__(self, camera_id):
+        return camera_id in self._trackers
+
+    def __iter__(self):
+        return iter(list(self._trackers))
+
+    def drop(self, camera_id):
+        self._trackers.pop(camera_id, None)
+
+    def update(self, camera_id, result, frame):
+        state = self._trackers.setdefault(camera_id, {"boxes": np.zeros((0, 4), np.float32),
+                                                      "ids": np.zeros(0, np.int64), "next_id": 1})
+        boxes = result.boxes.xyxy
+        ids = np.zeros(len(boxes), dtype=np.int64)
+        iou = _iou_matrix(boxes, state["boxes"]) if len(boxes) and len(state["boxes"]) else None
+        for i in range(len(boxes)):
+            if iou is not None and iou[i].max() > 0.3:
+                j = int(iou[i].argmax())
+                ids[i] = state["ids"][j]
+                iou[:, j] = 0
+            else:
+                ids[i] = state["next_id"]
+                state["next_id"] += 1
+        state["boxes"], state["ids"] = boxes, ids
+        result.boxes.id = ids.astype(np.float32) if len(ids) else None
+        return result
+
+
+STUB_FEATURE_DIM = 24
+
+
+def stub_extract_reid_features(frame, boxes, max_batch_size=32):
+    """
+    ReID stand-in: mean colour of a 4x2 grid over the crop, centred and normalised.
+    """
+    boxes = list(boxes)
+    features = np.zeros((len(boxes), STUB_FEATURE_DIM), dtype=np.float32)
+    valid = np.zeros(len(boxes), dtype=bool)
+    h, w = frame.shape[:2]
+    for i, (x1, y1, x2, y2) in enumerate(boxes):
+        x1, y1, x2, y2 = max(0, x1), max(0, y1), min(w, x2), min(h, y2)
+        if x2 - x1 < 2 or y2 - y1 < 4:
+            continue
+        grid = cv2.resize(frame[y1:y2, x1:x2], (2, 4), interpolation=cv2.INTER_AREA)
+        feature = grid.reshape(-1).astype(np.float32) - 128.0
+        norm = np.linalg.norm(feature)
+        if norm > 0:
+            features[i] = feature / norm
+            valid[i] = True
+    return features, valid
+
+
+def install_stub_models():
+    """
+    Register stub ``ultralytics``, ``reid_model`` and ``camera_trackers``
+    modules so importing detect_person needs none of the real packages.
+    """
+    ultralytics = types.ModuleType("ultralytics")
+    ultralytics.YOLO = StubYOLO
+    reid_model = types.ModuleType("reid_model")
+    reid_model.extract_reid_features = stub_extract_reid_features
+    reid_model.REID_MAX_BATCH_SIZE = 32
+    camera_trackers = types.ModuleType("camera_trackers")
+    camera_trackers.CameraTrackers = StubCameraTrackers
+    sys.modules.update({"ultralytics": ultralytics, "reid_model": reid_model, "camera_trackers": camera_trackers})
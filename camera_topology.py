@@ -0,0 +1,160 @@
+import json
+from collections import OrderedDict
+
+import numpy as np
+
+# What a camera that is not in the topology matches against:
+#   all  - every identity in the gallery (no gating)
+#   none - nothing, every person it sees is a new identity
+UNKNOWN_CAMERA_POLICIES = ("all", "none")
+
+
+class CameraTopology:
+    """
+    Which cameras a person can walk between, and how long that takes.
+
+    Args:
+        links: Iterable of dicts ``{"from": cam, "to": cam, "min_s": .., "max_s": ..}``,
+            optionally with ``"bidirectional": False`` (default True).
+        same_camera_max_s (float): How long after leaving a camera a person
+            may reappear on it. Must exceed the track cache refresh interval.
+        unknown_cameras (str): One of UNKNOWN_CAMERA_POLICIES.
+    """
+
+    def __init__(self, links=(), same_camera_max_s=600.0, unknown_cameras="all"):
+        if unknown_cameras not in UNKNOWN_CAMERA_POLICIES:
+            raise ValueError(f"Unknown camera policy {unknown_cameras!r}, expected one of {UNKNOWN_CAMERA_POLICIES}")
+        self.same_camera_max_s = float(same_camera_max_s)
+        self.unknown_cameras = unknown_cameras
+        self._incoming = {}  # camera -> {source camera: (min_s, max_s)}
+        for link in links:
+            window = (float(link.get("min_s", 0.0)), float(link["max_s"]))
+            if window[0] > window[1]:
+                raise ValueError(f"Link {link['from']} -> {link['to']} has min_s > max_s")
+            self._add(link["from"], link["to"], window)
+            if link.get("bidirectional", True):
+                self._add(link["to"], link["from"], window)
+        for camera in list(self._incoming):
+            self._incoming[camera].setdefault(camera, (0.0, self.same_camera_max_s))
+        # Longest a sighting on a camera stays useful to any camera it leads to
+        self._horizon = {}
+        for camera, sources in self._incoming.items():
+            for source, (_, max_s) in sources.items():
+                self._horizon[source] = max(self._horizon.get(source, 0.0), max_s)
+
+    def _add(self, source, target, window):
+        source, target = str(source), str(target)
+        self._incoming.setdefault(source, {})
+        self._incoming.setdefault(target, {})[source] = window
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read a topology from JSON::
+
+            {"same_camera_max_s": 600, "unknown_cameras": "all",
+             "links": [{"from": "cam-1", "to": "cam-2", "min_s": 5, "max_s": 90}]}
+        """
+        with open(path) as f:
+            config = json.load(f)
+        return cls(config.get("links", ()), config.get("same_camera_max_s", 600.0),
+                   config.get("unknown_cameras", "all"))
+
+    def __contains__(self, camera):
+        return str(camera) in self._incoming
+
+    def sources(self, camera):
+        """
+        ``{source camera: (min_s, max_s)}`` a person seen on ``camera`` may come from.
+        """
+        return self._incoming.get(str(camera), {})
+
+    def horizon(self, camera):
+        """
+        Seconds after which a sighting on ``camera`` can no longer match anywhere.
+        """
+        return self._horizon.get(str(camera), self.same_camera_max_s)
+
+
+class TopologyGate:
+    """
+    Incrementally maintained candidate sets for topology-gated ReID matching.
+
+    Every identity is filed under the camera it was last seen on, in
+    last-seen order. The candidates for a query on camera C at time t are
+    the identities last seen on a camera with a link into C, within that
+    link's transit window; each lookup walks only the recent tail of those
+    cameras' lists, so it scales with local traffic, not gallery size.
+    Sightings older than their camera's horizon are dropped as they age out.
+    """
+
+    def __init__(self, topology):
+        self.topology = topology
+        self._recent = {}     # camera -> OrderedDict(id -> last seen), least recent first
+        self._camera_of = {}  # id -> camera it was last seen on
+
+    def __len__(self):
+        return len(self._camera_of)
+
+    def camera_of(self, pid):
+        return self._camera_of.get(int(pid))
+
+    def observe(self, ids, camera, now):
+        """
+        Record that ``ids`` were seen on ``camera`` at ``now``.
+        """
+        camera = str(camera)
+        recent = self._recent.get(camera)
+        if recent is None:
+            recent = self._recent[camera] = OrderedDict()
+        for pid in ids:
+            pid = int(pid)
+            previous = self._camera_of.get(pid)
+            if previous is not None and previous != camera:
+                self._recent[previous].pop(pid, None)
+            self._camera_of[pid] = camera
+            recent[pid] = now
+            recent.move_to_end(pid)
+        self._expire(camera, now)
+
+    def forget(self, ids):
+        for pid in ids:
+            camera = self._camera_of.pop(int(pid), None)
+            if camera is not None:
+                self._recent[camera].pop(int(pid), None)
+
+    def _expire(self, camera, now):
+        recent = self._recent[camera]
+        cutoff = now - self.topology.horizon(camera)
+        while recent:
+            pid, seen = next(iter(recent.items()))
+            if seen >= cutoff:
+                break
+            recent.popitem(last=False)
+            del self._camera_of[pid]
+
+    def candidates(self, camera, now):
+        """
+        Ids a person seen on ``camera`` at ``now`` may be.
+
+        Returns:
+            (K,) int64 array, or None when ``camera`` is not in the topology
+            and the policy is to match against the whole gallery.
+        """
+        sources = self.topology.sources(camera)
+        if not sources:
+            if self.topology.unknown_cameras == "all":
+                return None
+            return np.empty(0, dtype=np.int64)
+        found = []
+        for source, (min_s, max_s) in sources.items():
+            recent = self._recent.get(source)
+            if not recent:
+                continue
+            for pid, seen in reversed(recent.items()):
+                age = now - seen
+                if age > max_s:
+                    break
+                if age >= min_s:
+                    found.append(pid)
+        return np.asarray(found, dtype=np.int64)
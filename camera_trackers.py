@@ -0,0 +1,81 @@
+import inspect
+
+import torch
+from ultralytics.trackers.bot_sort import BOTSORT
+from ultralytics.trackers.byte_tracker import BYTETracker
+from ultralytics.utils import IterableSimpleNamespace, yaml_load
+
+TRACKER_MAP = {"bytetrack": BYTETracker, "botsort": BOTSORT}
+
+
+class CameraTrackers:
+    """
+    One BoT-SORT (or ByteTrack) instance per camera.
+
+    Detection runs as plain batched ``predict`` calls; each camera's
+    detections are then fed to that camera's own tracker, so tracks from
+    different cameras never share state.
+
+    Args:
+        tracker_config (str): Tracker yaml, e.g. "botsort.yaml".
+        frame_rate (int): Frame rate the tracker's buffers are scaled for.
+    """
+
+    def __init__(self, tracker_config="botsort.yaml", frame_rate=30):
+        cfg = yaml_load(tracker_config)
+        if cfg.get("with_reid") and cfg.get("model", "auto") == "auto":
+            # "auto" reuses the detector's features, which a plain predict
+            # doesn't expose; appearance matching is done by our own ReID
+            print(f"[Tracker] {tracker_config}: with_reid needs model features, disabling it for per-camera trackers")
+            cfg["with_reid"] = False
+        self.cfg = IterableSimpleNamespace(**cfg)
+        self.frame_rate = frame_rate
+        self._trackers = {}
+
+    def __contains__(self, camera_id):
+        return camera_id in self._trackers
+
+    def __iter__(self):
+        return iter(list(self._trackers))
+
+    def get(self, camera_id):
+        tracker = self._trackers.get(camera_id)
+        if tracker is None:
+            tracker = TRACKER_MAP[self.cfg.tracker_type](args=self.cfg, frame_rate=self.frame_rate)
+            self._trackers[camera_id] = tracker
+        return tracker
+
+    def drop(self, camera_id):
+        self._trackers.pop(camera_id, None)
+
+    def update(self, camera_id, result, frame):
+        """
+        Run the camera's tracker on one predict ``result`` in place.
+
+        Mirrors ultralytics' own track callback: on return ``result.boxes``
+        holds only tracked boxes with their ``id`` set, or no ids at all if
+        nothing is tracked this frame.
+        """
+        tracker = self.get(camera_id)
+        det = result.boxes.cpu().numpy()
+        if _accepts_feats(tracker):
+            tracks = tracker.update(det, frame, None)
+        else:
+            tracks = tracker.update(det, frame)
+        if len(tracks) == 0:
+            return result
+        idx = tracks[:, -1].astype(int)
+        tracked = result[idx]
+        tracked.update(boxes=torch.as_tensor(tracks[:, :-1]))
+        return tracked
+
+
+_update_arity = {}
+
+
+def _accepts_feats(tracker):
+    # Newer ultralytics trackers take (results, img, feats)
+    cls = type(tracker)
+    if cls not in _update_arity:
+        _update_arity[cls] = len(inspect.signature(tracker.update).parameters) >= 3
+    return _update_arity[cls]
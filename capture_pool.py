@@ -0,0 +1,338 @@
+import itertools
+import multiprocessing
+import queue
+import threading
+
+from metrics import REGISTRY as metrics_registry, MetricsRegistry
+from rabbitmq_publisher import RabbitMQPublisher
+
+# How long CameraHandle.join() waits for a camera's capture loop to notice it
+# was stopped (it checks between frames; a grab on a dead stream can block)
+# before the worker running it is recycled
+STOP_TIMEOUT_S = 15.0
+
+# Workers are spawned, not forked: the framer's main process runs the monitor,
+# metrics and broker threads, and a fork could copy one of their locks held
+_MP_CONTEXT = multiprocessing.get_context("spawn")
+
+
+class _FpsValue:
+    """
+    Stand-in for the shared double process_video reads its frame rate from.
+    """
+
+    def __init__(self, value):
+        self.value = value
+
+
+class RemoteFpsValue:
+    """
+    Main-process side of a pooled camera's frame rate: setting ``value``
+    forwards it to whichever worker serves the camera.
+    """
+
+    def __init__(self, pool, camera_id, value):
+        self._pool = pool
+        self._camera_id = camera_id
+        self._value = float(value)
+
+    @property
+    def value(self):
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        if value != self._value:
+            self._value = float(value)
+            self._pool.set_fps(self._camera_id, self._value)
+
+
+class CameraHandle:
+    """
+    Process-like handle (``is_alive``, ``terminate``, ``join``, ``pid``) on a
+    camera served by a pool worker, so the code that starts, stops and
+    restarts one process per camera works unchanged with the pool.
+    """
+
+    def __init__(self, pool, camera_id, run_id, worker, process):
+        self.camera_id = camera_id
+        self.run_id = run_id
+        self.worker = worker
+        self._pool = pool
+        self._process = process
+        self._exited = threading.Event()
+        self._stopping = False
+
+    @property
+    def pid(self):
+        return self._process.pid
+
+    def is_alive(self):
+        return not self._exited.is_set() and self._process.is_alive()
+
+    def terminate(self):
+        self._pool.stop(self)
+
+    def join(self, timeout=None):
+        """
+        Wait for the camera's loop to exit. Without a ``timeout``, a stopped
+        loop still running after STOP_TIMEOUT_S is taken down with its worker
+        (see CaptureWorkerPool.recycle), so it never runs next to its restart.
+        """
+        if self._exited.wait(STOP_TIMEOUT_S if timeout is None else timeout):
+            return
+        if timeout is None and self._stopping:
+            self._pool.recycle(self.worker, self._process)
+
+
+def _worker_main(index, run_stream, commands, events, rabbitmq_host, metrics_queue=None):
+    """
+    Body of a capture worker process: one thread per camera, one broker connection.
+    """
+    publisher = RabbitMQPublisher(host=rabbitmq_host, heartbeat=600, confirm=False, retries=1)
+    streams = {}  # run_id -> (thread, stop event, frame rate)
+
+    def run(run_id, args, kwargs, stop_event, fps_value):
+        try:
+            run_stream(*args, publisher=publisher, stop_event=stop_event, metrics=MetricsRegistry(),
+                       metrics_queue=metrics_queue, fps_value=fps_value, **kwargs)
+        finally:
+            events.put(run_id)
+
+    while True:
+        try:
+            command = commands.get(timeout=1)
+        except queue.Empty:
+            command = (None,)
+        kind = command[0]
+        if kind == "start":
+            _, run_id, args, kwargs, fps = command
+            stop_event = threading.Event()
+            fps_value = _FpsValue(fps)
+            thread = threading.Thread(target=run, args=(run_id, args, kwargs, stop_event, fps_value),
+                                      name=f"capture-{index}-{args[1]}", daemon=True)
+            streams[run_id] = (thread, stop_event, fps_value)
+            thread.start()
+        elif kind == "stop":
+            stream = streams.pop(command[1], None)
+            if stream is not None:
+                stream[1].set()
+        elif kind == "fps":
+            stream = streams.get(command[1])
+            if stream is not None:
+                stream[2].value = command[2]
+        elif kind == "exit":
+            for thread, stop_event, _ in streams.values():
+                stop_event.set()
+            for thread, _, _ in streams.values():
+                thread.join(STOP_TIMEOUT_S)
+            publisher.close()
+            return
+        for run_id, (thread, _, _) in list(streams.items()):
+            if not thread.is_alive():
+                del streams[run_id]
+
+
+class CaptureWorkerPool:
+    """
+    A fixed pool of capture worker processes, each serving many cameras.
+
+    One OS process per camera costs a Python interpreter and a broker
+    connection per camera. Here every worker runs the capture loops of its
+    cameras as threads (OpenCV releases the GIL while it grabs, decodes
+    and encodes) and publishes their frames over one shared connection.
+
+    A new camera goes to the worker with the least load, the sum of the
+    ``load`` its cameras were started with (the framer uses their frame
+    rate ceiling), ties broken by camera count. A worker that dies is
+    respawned when a camera is next started on it; its cameras' handles
+    report not alive, so the framer's monitor restarts them.
+
+    A camera's loop only checks its stop event between frames, and a thread
+    cannot be killed, so a camera is never started while an earlier run of
+    it is still going: ``start`` first stops and joins that run, and a run
+    that outlives STOP_TIMEOUT_S gets its whole worker recycled, taking the
+    worker's other cameras down for the monitor to restart elsewhere.
+
+    Args:
+        run_stream: Capture loop of one camera, called in a worker thread as
+            ``run_stream(*args, publisher=, stop_event=, metrics=, metrics_queue=, fps_value=, **kwargs)``.
+        num_workers (int): Number of worker processes.
+        rabbitmq_host (str): Broker the workers publish to.
+        metrics_queue: Queue the cameras push their metrics snapshots to,
+            handed to ``run_stream``; must come from a spawn context.
+    """
+
+    def __init__(self, run_stream, num_workers, rabbitmq_host="localhost", metrics_queue=None):
+        self.run_stream = run_stream
+        self.num_workers = max(1, int(num_workers))
+        self.rabbitmq_host = rabbitmq_host
+        self.metrics_queue = metrics_queue
+        self._processes = [None] * self.num_workers
+        self._commands = [None] * self.num_workers
+        self._loads = [{} for _ in range(self.num_workers)]  # worker -> {camera_id: load}
+        self._assigned = {}  # camera_id -> CameraHandle of its current run
+        self._runs = {}      # run_id -> CameraHandle, until its loop exits
+        self._run_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        with self._lock:
+            for index in range(self.num_workers):
+                self._ensure_worker(index)
+
+    def _collect_exits(self, process, events):
+        # One per worker process, on a queue of its own: a recycled worker
+        # can be killed mid-write, which would wedge a queue shared by all
+        while True:
+            try:
+                run_id = events.get(timeout=1)
+            except queue.Empty:
+                if process.is_alive():
+                    continue
+                self._release(process)
+                return
+            except (EOFError, OSError):
+                self._release(process)
+                return
+            with self._lock:
+                handle = self._runs.pop(run_id, None)
+            if handle is not None:
+                handle._exited.set()
+
+    def _release(self, process):
+        """
+        Mark every run of a dead worker process exited.
+        """
+        with self._lock:
+            handles = [handle for handle in self._runs.values() if handle._process is process]
+            for handle in handles:
+                del self._runs[handle.run_id]
+        for handle in handles:
+            handle._exited.set()
+
+    def _ensure_worker(self, index):
+        process = self._processes[index]
+        if process is not None and process.is_alive():
+            return process
+        commands = _MP_CONTEXT.Queue()
+        events = _MP_CONTEXT.Queue()
+        process = _MP_CONTEXT.Process(target=_worker_main, name=f"capture-worker-{index}",
+                                      args=(index, self.run_stream, commands, events, self.rabbitmq_host,
+                                            self.metrics_queue))
+        process.start()
+        self._processes[index] = process
+        self._commands[index] = commands
+        threading.Thread(target=self._collect_exits, args=(process, events), name=f"capture-pool-{index}",
+                         daemon=True).start()
+        # The cameras of a dead worker are restarted one by one, wherever they land
+        self._loads[index].clear()
+        return process
+
+    def _pick_worker(self):
+        def load(index):
+            process = self._processes[index]
+            if process is not None and not process.is_alive():
+                return (0.0, 0, index)
+            loads = self._loads[index]
+            return (sum(loads.values()), len(loads), index)
+        return min(range(self.num_workers), key=load)
+
+    def start(self, camera_id, args, kwargs=None, load=1.0, fps=0.0):
+        """
+        Start serving a camera on the least loaded worker.
+
+        Args:
+            camera_id: The camera (``args[1]`` of ``run_stream``).
+            args, kwargs: Arguments of ``run_stream``; must be picklable.
+            load (float): What the camera weighs in the worker assignment.
+            fps (float): Initial frame rate, later changed with ``set_fps``.
+
+        Returns:
+            CameraHandle
+        """
+        # An earlier run of the camera must be gone first (its worker recycled if need be)
+        with self._lock:
+            running = [handle for handle in self._runs.values() if handle.camera_id == camera_id]
+        for handle in running:
+            handle.terminate()
+            handle.join()
+        with self._lock:
+            previous = self._assigned.get(camera_id)
+            if previous is not None:
+                self._loads[previous.worker].pop(camera_id, None)
+            index = self._pick_worker()
+            process = self._ensure_worker(index)
+            handle = CameraHandle(self, camera_id, next(self._run_ids), index, process)
+            self._runs[handle.run_id] = handle
+            self._assigned[camera_id] = handle
+            self._loads[index][camera_id] = float(load)
+            self._commands[index].put(("start", handle.run_id, tuple(args), dict(kwargs or {}), float(fps)))
+        return handle
+
+    def stop(self, handle):
+        with self._lock:
+            handle._stopping = True
+            if self._assigned.get(handle.camera_id) is handle:
+                del self._assigned[handle.camera_id]
+                self._loads[handle.worker].pop(handle.camera_id, None)
+            if handle._process is self._processes[handle.worker] and handle._process.is_alive():
+                self._commands[handle.worker].put(("stop", handle.run_id))
+            else:
+                handle._exited.set()
+
+    def recycle(self, index, process):
+        """
+        Kill a worker process and start a fresh one in its place.
+
+        Used when a stopped camera's loop does not exit (a grab blocked on a
+        dead stream). Every camera the worker served reports not alive.
+        """
+        with self._lock:
+            if self._processes[index] is not process:
+                return
+            process.terminate()
+            process.join(STOP_TIMEOUT_S)
+            if process.is_alive():
+                process.kill()
+                process.join()
+            for handle in list(self._assigned.values()):
+                if handle._process is process:
+                    del self._assigned[handle.camera_id]
+            metrics_registry.inc("capture_workers_recycled_total")
+            self._ensure_worker(index)
+        self._release(process)
+
+    def fps_value(self, camera_id, fps):
+        """
+        A ``value`` holder that forwards frame rate changes to the camera's worker.
+        """
+        return RemoteFpsValue(self, camera_id, fps)
+
+    def set_fps(self, camera_id, fps):
+        with self._lock:
+            handle = self._assigned.get(camera_id)
+            if handle is not None and handle._process is self._processes[handle.worker]:
+                self._commands[handle.worker].put(("fps", handle.run_id, float(fps)))
+
+    def stats(self):
+        """
+        Per worker: pid, whether it is alive, its cameras and their total load.
+        """
+        with self._lock:
+            return [{"worker": index, "pid": process.pid if process is not None else None,
+                     "alive": process is not None and process.is_alive(),
+                     "cameras": len(self._loads[index]), "load": sum(self._loads[index].values())}
+                    for index, process in enumerate(self._processes)]
+
+    def close(self, timeout=STOP_TIMEOUT_S):
+        """
+        Stop every camera and worker.
+        """
+        with self._lock:
+            processes = [(p, c) for p, c in zip(self._processes, self._commands) if p is not None]
+        for process, commands in processes:
+            if process.is_alive():
+                commands.put(("exit",))
+        for process, _ in processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
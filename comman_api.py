@@ -1,31 +1,24 @@
-from flask import Flask, request, jsonify,send_from_directory
+from flask import Flask, request, jsonify,send_from_directory, Response
 from flask_cors import CORS
-import pickle
 import pika
 import logging
 import datetime
 import os
+from rabbitmq_publisher import RabbitMQPublisher
+from wire_format import KIND_CAMERA_COMMAND, pack_message
+from rabbitmq_logger import AsyncRabbitMQLogger
+from metrics import REGISTRY as metrics_registry, render_prometheus
 
 
 app = Flask(__name__)
 CORS(app)
 
+# Log records are queued in memory and shipped in batches by a background thread
+rabbitmq_logger = AsyncRabbitMQLogger(host='localhost', queue='anpr_logs')
+
 # Function to send logs to RabbitMQ
 def send_log_to_rabbitmq(log_message):
-    try:
-        connection = pika.BlockingConnection(pika.ConnectionParameters(host='localhost', heartbeat=600))
-        channel = connection.channel()
-        channel.queue_declare(queue='anpr_logs')
-        
-        # Serialize the log message as JSON and send it to RabbitMQ
-        channel.basic_publish(
-            exchange='',
-            routing_key='anpr_logs',
-            body=pickle.dumps(log_message)
-        )
-        connection.close()
-    except Exception as e:
-        print(f"Failed to send log to RabbitMQ: {e}")
+    rabbitmq_logger.send_log(log_message)
 
 # Wrapper functions for different log levels
 def log_info(message):
@@ -128,6 +121,10 @@ def log_exception(message):
 #     rabbitmq_logger.send_log(message_data)
 
 
+# Shared by all requests and threads; connects lazily and reconnects on failure
+camera_publisher = RabbitMQPublisher(host='localhost', heartbeat=600, confirm=True)
+
+
 @app.route('/CommanApiStart', methods=['POST'])
 def update_camera_details():
     data = request.get_json()
@@ -136,66 +133,65 @@ def update_camera_details():
     cameras = data.get("cameras", [])
     if not cameras:
         log_exception("No cameras provided in the request.")
-        return jsonify({"error": "No cameras provided!"}),
+        return jsonify({"error": "No cameras provided!"}), 400
 
+    # Validate the whole request before publishing anything
+    required_fields = ["camera_id", "url"]
     for camera in cameras:
-        required_fields = ["camera_id", "url"]
-
         if not all(field in camera for field in required_fields):
             missing_fields = [field for field in required_fields if field not in camera]
             log_exception(f"Missing required fields: {missing_fields} for camera {camera.get('camera_id', 'Unknown')}!")
             return jsonify({"error": f"Missing required fields in camera details for camera {camera.get('camera_id')}!"}), 400
 
-        camera_id = camera["camera_id"]
-        camera_url = camera["url"]
-        running = camera.get("running", False)
-        user_id = camera["user_id"]
+    messages = []
+    for camera in cameras:
         objectlist = camera.get("objectlist", "[]")
-        objectlist_lower = objectlist.lower()
-        print("This is object list :", objectlist, type(objectlist))
-
-        # Connect to RabbitMQ
-        try:
-            connection = pika.BlockingConnection(pika.ConnectionParameters(host='localhost', heartbeat=600))
-            channel = connection.channel()
-            log_info(f"Connected to RabbitMQ for camera {camera_id}.")
-            try:
-                # # Declare the queue passively (will throw an exception if the queue doesn't exist)
-                # channel.queue_declare(queue='rtspurl_for_rdas', passive=True)
-                # Declare an exchange
-                channel.exchange_declare(exchange='rtspurl_for_framer', exchange_type='fanout')
-            except pika.exceptions.ChannelClosedByBroker:
-                channel = connection.channel()
-                channel.exchange_declare(exchange='rtspurl_for_framer', exchange_type='fanout')
-                log_info(f"Queue 'rtspurl_from_api_db' declared successfully.")
-        except Exception as e:
-            log_exception(f"Failed to connect to RabbitMQ for camera {camera_id}: {e}")
-            return jsonify({"error": "Failed to connect to RabbitMQ!"}), 500
-
         frame_data = {
-            "CameraId": camera_id,
-            "CameraUrl": camera_url,
-            "Running": running,
-            "UserId": user_id,
-            "ObjectList": objectlist_lower
-            
+            "CameraId": camera["camera_id"],
+            "CameraUrl": camera["url"],
+            "Running": camera.get("running", False),
+            "UserId": camera.get("user_id"),
+            "ObjectList": objectlist.lower(),
+            "Transport": camera.get("transport", "inline"),  # "shm" when detect_person runs on the framer host
+            "Encoding": camera.get("encoding"),  # e.g. "jpeg" or {"type": "jpeg", "quality": 80, "max_long_edge": 1280}
+            "TargetFps": camera.get("target_fps"),  # Frames per second published by the framer
+            "MinFps": camera.get("min_fps"),  # Adaptive frame rate floor (empty scene)
+            "MaxFps": camera.get("max_fps"),  # Adaptive frame rate ceiling, defaults to TargetFps
+            "MotionGate": camera.get("motion_gate"),  # e.g. true, "mog2" or {"min_changed": 0.01, "keepalive_s": 5}
         }
-        serialized_frame = pickle.dumps(frame_data)
-        print("This is frame_data :", frame_data)
-
-        # Send the frame to the queue
-        try:
-            channel.basic_publish(
-                exchange="rtspurl_for_framer",
-                routing_key="",
-                body=serialized_frame
-            )
-            log_info(f"Sent a frame from camera {camera_id} to RabbitMQ queue.")
-        except Exception as e:
-            log_exception(f"Failed to publish message for camera {camera_id}: {e}")
-
-    log_info("Cameras added/updated successfully.")
-    return jsonify({"message": "Cameras added/updated successfully!"}), 201
+        messages.append(pack_message(KIND_CAMERA_COMMAND, frame_data))
+
+    # Publish the whole request as one confirmed batch over the shared connection
+    try:
+        camera_publisher.declare_exchange('rtspurl_for_framer', exchange_type='fanout')
+    except Exception as e:
+        log_exception(f"Failed to connect to RabbitMQ: {e}")
+        return jsonify({"error": "Failed to connect to RabbitMQ!"}), 500
+    with metrics_registry.timer("stage_latency_ms", stage="publish_commands"):
+        outcomes = camera_publisher.publish_batch("rtspurl_for_framer", messages)
+
+    results = []
+    for camera, (ok, error) in zip(cameras, outcomes):
+        result = {"camera_id": camera["camera_id"], "status": "sent" if ok else "failed"}
+        if not ok:
+            result["error"] = error
+            log_exception(f"Failed to publish message for camera {camera['camera_id']}: {error}")
+        results.append(result)
+
+    failed = sum(1 for ok, _ in outcomes if not ok)
+    metrics_registry.inc("camera_commands_total", len(cameras) - failed, status="sent")
+    metrics_registry.inc("camera_commands_total", failed, status="failed")
+    if failed == 0:
+        log_info(f"{len(cameras)} cameras added/updated successfully.")
+        return jsonify({"message": "Cameras added/updated successfully!", "results": results}), 201
+    if failed == len(cameras):
+        return jsonify({"error": "Failed to publish cameras to RabbitMQ!", "results": results}), 500
+    log_info(f"{len(cameras) - failed} of {len(cameras)} cameras added/updated.")
+    return jsonify({"message": f"{failed} of {len(cameras)} cameras failed to publish.", "results": results}), 207
+
+@app.route('/metrics')
+def metrics():
+    return Response(render_prometheus([(metrics_registry.snapshot(), {})]), mimetype="text/plain")
 
 @app.route('/app/<folder>/<camera_id>/<filename>')
 def get_image(folder,camera_id, filename):
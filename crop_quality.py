@@ -0,0 +1,135 @@
+import cv2
+import numpy as np
+
+# Reject reasons, in the order they are checked (cheapest first)
+REJECT_REASONS = ("low_score", "too_small", "aspect_ratio", "truncated", "occluded", "blurry")
+
+
+def overlap_fractions(boxes, frame_boxes=None):
+    """
+    For each (x1, y1, x2, y2) box, the largest fraction of its area covered
+    by another box of the frame (``frame_boxes``, default ``boxes``).
+    """
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    others = boxes if frame_boxes is None else np.asarray(frame_boxes, dtype=np.float32).reshape(-1, 4)
+    if len(boxes) == 0 or len(others) == 0:
+        return np.zeros(len(boxes), dtype=np.float32)
+    x1 = np.maximum(boxes[:, None, 0], others[None, :, 0])
+    y1 = np.maximum(boxes[:, None, 1], others[None, :, 1])
+    x2 = np.minimum(boxes[:, None, 2], others[None, :, 2])
+    y2 = np.minimum(boxes[:, None, 3], others[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    # A box doesn't occlude itself
+    inter[np.all(boxes[:, None, :] == others[None, :, :], axis=2)] = 0
+    areas = np.clip(boxes[:, 2] - boxes[:, 0], 0, None) * np.clip(boxes[:, 3] - boxes[:, 1], 0, None)
+    return inter.max(axis=1) / np.maximum(areas, 1.0)
+
+
+def sharpness(crop, height=64):
+    """
+    Variance of the Laplacian of the crop, downscaled to ``height`` rows
+    so the cost doesn't depend on the box size.
+    """
+    gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+    if gray.shape[0] > height:
+        width = max(1, int(round(gray.shape[1] * height / gray.shape[0])))
+        gray = cv2.resize(gray, (width, height), interpolation=cv2.INTER_AREA)
+    return float(cv2.Laplacian(gray, cv2.CV_32F).var())
+
+
+class CropQualityGate:
+    """
+    Decide which person detections are worth a ReID forward pass.
+
+    Slivers at the frame edge, tiny far-away people, low-confidence and
+    heavily overlapped boxes give poor embeddings that waste a forward pass
+    and then pollute the gallery. Rejected detections keep their tracker
+    id, they just aren't (re-)embedded this frame.
+
+    Args:
+        min_score (float): Detection confidence floor.
+        min_height, min_width (int): Minimum box size in pixels.
+        min_aspect, max_aspect (float): Bounds on height / width; a standing
+            person is roughly 2-3.
+        border_margin (int): Boxes within this many pixels of a frame edge
+            are treated as cut off by it. None disables the check.
+        max_overlap (float): Reject boxes with more than this fraction of
+            their area covered by another detection. None disables it.
+        min_sharpness (float): Reject crops whose variance of the Laplacian
+            is below this (motion blur / out of focus). None disables it.
+    """
+
+    def __init__(self, min_score=0.5, min_height=64, min_width=32, min_aspect=1.0, max_aspect=5.0,
+                 border_margin=2, max_overlap=0.7, min_sharpness=None):
+        self.min_score = min_score
+        self.min_height = min_height
+        self.min_width = min_width
+        self.min_aspect = min_aspect
+        self.max_aspect = max_aspect
+        self.border_margin = border_margin
+        self.max_overlap = max_overlap
+        self.min_sharpness = min_sharpness
+        self.counters = {"checked": 0, "accepted": 0}
+        self.counters.update({reason: 0 for reason in REJECT_REASONS})
+
+    def check(self, frame, boxes, scores, frame_boxes=None):
+        """
+        Check the boxes of one frame.
+
+        Args:
+            frame: BGR frame (H, W, 3).
+            boxes: (x1, y1, x2, y2) boxes to check.
+            scores: Their detection confidences.
+            frame_boxes: Every detection in the frame, for the overlap check.
+                Defaults to ``boxes``.
+
+        Returns:
+            (accepted, reasons): (N,) bool mask and, per box, None or the
+            first REJECT_REASONS entry it failed.
+        """
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        scores = np.asarray(scores, dtype=np.float32).reshape(-1)
+        n = len(boxes)
+        reasons = [None] * n
+        if n == 0:
+            return np.zeros(0, dtype=bool), reasons
+        height, width = frame.shape[:2]
+        box_w = boxes[:, 2] - boxes[:, 0]
+        box_h = boxes[:, 3] - boxes[:, 1]
+        failed = {
+            "low_score": scores < self.min_score,
+            "too_small": (box_h < self.min_height) | (box_w < self.min_width),
+            "aspect_ratio": (box_h < self.min_aspect * box_w) | (box_h > self.max_aspect * box_w),
+        }
+        if self.border_margin is not None:
+            m = self.border_margin
+            failed["truncated"] = ((boxes[:, 0] <= m) | (boxes[:, 1] <= m)
+                                   | (boxes[:, 2] >= width - m) | (boxes[:, 3] >= height - m))
+        if self.max_overlap is not None:
+            failed["occluded"] = overlap_fractions(boxes, frame_boxes) > self.max_overlap
+
+        accepted = np.ones(n, dtype=bool)
+        for reason in REJECT_REASONS:
+            mask = failed.get(reason)
+            if mask is None:
+                continue
+            newly = accepted & mask
+            for i in np.flatnonzero(newly):
+                reasons[i] = reason
+            self.counters[reason] += int(newly.sum())
+            accepted &= ~mask
+        if self.min_sharpness is not None:
+            for i in np.flatnonzero(accepted):
+                x1, y1, x2, y2 = boxes[i].astype(int)
+                crop = frame[max(0, y1):y2, max(0, x1):x2]
+                if crop.size == 0 or sharpness(crop) < self.min_sharpness:
+                    accepted[i] = False
+                    reasons[i] = "blurry"
+                    self.counters["blurry"] += 1
+        self.counters["checked"] += n
+        self.counters["accepted"] += int(accepted.sum())
+        return accepted, reasons
+
+    def stats(self):
+        return dict(self.counters)
+
@@ -1,36 +1,213 @@
 import pika
 import cv2
-import pickle  # To deserialize and serialize frames
 import struct  # To handle frame size unpacking
 from ultralytics import YOLO
 import os
 import datetime
 import logging
 import time
-from reid_model import extract_reid_feature
+from reid_model import extract_reid_features
+from reid_gallery import ReIDGallery, FaissIVFIndex
+from gallery_store import GalleryStore
+from camera_topology import CameraTopology, TopologyGate
+from track_cache import TrackCache
+from crop_quality import CropQualityGate, REJECT_REASONS
+from frame_ring import FrameRingReader
+from frame_codec import decode_frame
+from rabbitmq_logger import AsyncRabbitMQLogger
+from rabbitmq_publisher import RabbitMQPublisher
+from frame_mailbox import LatestFrameMailbox, frame_age_ms
+from frame_rate import ACTIVITY_EXCHANGE, ActivityReport
+from camera_trackers import CameraTrackers
+from metrics import REGISTRY as metrics_registry, start_metrics_server
+from model_registry import MODELS
+from wire_format import (KIND_CAMERA_ACTIVITY, KIND_RESULT, KIND_WORKER_HEARTBEAT, WireFormatError,
+                         pack_message, unpack_frame, unpack_message)
+from worker_sharding import (ShardMembership, SHARDED_FRAME_EXCHANGE, WORKER_EXCHANGE,
+                             bucket_of, bucket_routing_key)
 import numpy as np
 
-gallery = []  # List of (id, feature)
-next_reid = 0
+# Set to True to use an approximate faiss index for galleries past ~100k ids
+GALLERY_USE_ANN = False
+# Solve a one-to-one assignment so two detections can't claim the same ID
+GALLERY_JOINT_ASSIGNMENT = True
+# Forget identities not seen for this many seconds (None = keep forever)
+GALLERY_TTL_SECONDS = 6 * 60 * 60
+# Keep at most this many identities, evicting the least recently seen
+GALLERY_MAX_IDENTITIES = 50000
+# Log gallery stats every N processed frames
+GALLERY_STATS_INTERVAL = 500
+# Optional JSON camera topology (adjacent cameras and transit times, see
+# camera_topology.CameraTopology.load). When set, a detection is only
+# matched against identities last seen on a camera that can reach its
+# camera within the link's transit window.
+CAMERA_TOPOLOGY_PATH = os.environ.get("CAMERA_TOPOLOGY")
+
+gallery = ReIDGallery(
+    threshold=0.6,
+    index_factory=FaissIVFIndex if GALLERY_USE_ANN else None,
+    ema_momentum=0.9,
+    ttl_seconds=GALLERY_TTL_SECONDS,
+    max_identities=GALLERY_MAX_IDENTITIES,
+    gate=TopologyGate(CameraTopology.load(CAMERA_TOPOLOGY_PATH)) if CAMERA_TOPOLOGY_PATH else None,
+)
+frames_processed = 0
+
+# Snapshots + append log of the gallery, so identities and next ids survive
+# restarts. Each worker needs its own directory; empty disables persistence.
+GALLERY_STORE_DIR = os.environ.get("GALLERY_STORE_DIR", "gallery_store")
+GALLERY_SNAPSHOT_INTERVAL_S = 300
+GALLERY_LOG_FSYNC_INTERVAL_S = 1.0
+gallery_store = GalleryStore(
+    GALLERY_STORE_DIR,
+    snapshot_interval_s=GALLERY_SNAPSHOT_INTERVAL_S,
+    fsync_interval_s=GALLERY_LOG_FSYNC_INTERVAL_S,
+) if GALLERY_STORE_DIR else None
+
+# Per-camera track_id -> ReID identity caches
+TRACK_CACHE_SETTINGS = {
+    "refresh_interval": 30,    # Re-embed every N frames even if nothing changed
+    "min_iou": 0.5,            # Re-embed when the box moved/resized below this IoU
+    "score_jump": 0.2,         # Re-embed when detection confidence jumps by this much
+    "weak_distance": 0.45,     # Re-embed while the cached match is weaker than this
+    "max_missing_frames": 30,  # Drop tracks the tracker stopped reporting
+}
+track_caches = {}
+
+RESULT_SCORE_THRESHOLD = 0.4   # Detections below this confidence are not reported
+
+# Detections whose crops are too poor to embed skip ReID for the frame (see
+# crop_quality.CropQualityGate); they keep their tracker id and any identity
+# their track already has. None embeds every non-empty crop.
+CROP_QUALITY_SETTINGS = {
+    # Detection confidence floor. Reported detections below it get no ReID id
+    # (counted as low_score), so raise it only together with RESULT_SCORE_THRESHOLD
+    "min_score": RESULT_SCORE_THRESHOLD,
+    "min_height": 64,          # Minimum box size in pixels
+    "min_width": 32,
+    "min_aspect": 1.0,         # Bounds on box height / width
+    "max_aspect": 5.0,
+    "border_margin": 2,        # Boxes this close to a frame edge are cut off by it (None disables)
+    "max_overlap": 0.7,        # Max fraction of a box covered by another detection (None disables)
+    "min_sharpness": None,     # Min variance of the Laplacian, e.g. 20 (None disables)
+}
+crop_quality_gate = CropQualityGate(**CROP_QUALITY_SETTINGS) if CROP_QUALITY_SETTINGS else None
+
+# Maps framer shared-memory rings for frames sent with transport="shm"
+frame_ring_reader = FrameRingReader()
+
+# Frame freshness / backpressure
+FRAME_QUEUE_NAME = "detected_vehicle"
+MAX_FRAME_AGE_MS = 2000        # Drop frames older than this when their turn comes (None = never)
+FRAME_PREFETCH = 64            # Max unacked frames held by this worker
+FRAME_QUEUE_ARGUMENTS = {
+    "x-max-length": 300,       # Broker keeps at most this many frames...
+    "x-overflow": "drop-head",  # ...discarding the oldest first
+    "x-message-ttl": 10000,    # and expires frames after 10 s
+}
+FRAME_STATS_INTERVAL_S = 60
+
+
+def _ack_delivery(item):
+    ch, method, _, _ = item
+    try:
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+    except pika.exceptions.AMQPError:
+        pass
+
+
+# Keeps only the latest pending frame per camera
+frame_mailbox = LatestFrameMailbox(on_drop=_ack_delivery)
+
+# Sharded mode: several detect_person workers split the cameras between them.
+# Requires the framer to run with FRAME_ROUTING = "sharded".
+SHARDED_MODE = False
+shard_membership = None
+owned_buckets = set()
+
+# YOLOv10 person detector, registered as "detector" in model_registry.MODELS
+# and loaded on first use or by load_models() at startup. Each setting can
+# be set in the MODELS_CONFIG file or with a DETECTOR_<SETTING> environment
+# variable (DETECTOR_WEIGHTS, DETECTOR_DEVICE, ...).
+DETECTOR_DEFAULTS = {
+    "weights": "yolov10n.pt",
+    "device": None,            # None lets ultralytics pick (cuda when available)
+    "warmup_batches": 2,       # Dummy batches per warm-up batch size (0 disables warm-up)
+    "warmup_width": 1280,      # Size of the dummy warm-up frames
+    "warmup_height": 720,
+}
+
+
+def load_detector(settings):
+    detector = YOLO(settings["weights"])
+    if settings["device"]:
+        # Merged into the arguments of every predict call
+        detector.overrides["device"] = settings["device"]
+    return detector
+
+
+def warmup_detector(detector, settings):
+    """
+    Run dummy single-frame and full batches so CUDA/cuDNN setup, predictor
+    construction and allocator growth happen before the first real frame.
+    """
+    frame = np.zeros((settings["warmup_height"], settings["warmup_width"], 3), dtype=np.uint8)
+    for batch_size in (1, DETECT_MAX_BATCH):
+        for _ in range(settings["warmup_batches"]):
+            detector.predict(source=[frame] * batch_size, classes=0, verbose=False)
+
+
+MODELS.register("detector", load_detector, warmup_detector, DETECTOR_DEFAULTS)
+
+
+def get_detector():
+    return MODELS.get("detector")
+
+
+# One tracker per camera; detection itself is batched across cameras
+TRACKER_CONFIG_PATH = "botsort.yaml"
+camera_trackers = CameraTrackers(TRACKER_CONFIG_PATH)
+DETECT_MAX_BATCH = 8           # Max frames per predict call
+DETECT_MAX_WAIT_MS = 20        # Max time to wait for more frames to fill a batch
+
+# Per-frame results go to the processed_queue_name exchange; drawing and
+# display are left to result_viewer.py so the inference loop never blocks
+results_publisher = RabbitMQPublisher(host='localhost', heartbeat=600, confirm=False, retries=1)
+
+# Prometheus-style /metrics and /metrics.json listener (0 disables it)
+METRICS_PORT = int(os.environ.get("DETECT_PERSON_METRICS_PORT", 9101))
+QUEUE_DEPTH_INTERVAL_S = 5     # How often the broker is asked for the frame queue depth
+
+# People and live tracks per camera, and the frame queue depth, are reported
+# to the framer on ACTIVITY_EXCHANGE every ACTIVITY_REPORT_INTERVAL_S so it
+# can adapt each camera's frame rate (see frame_rate). 0 disables reports.
+ACTIVITY_REPORT_INTERVAL_S = 2
+activity_report = ActivityReport(ACTIVITY_REPORT_INTERVAL_S) if ACTIVITY_REPORT_INTERVAL_S else None
+
+metrics_registry.describe("stage_latency_ms", "Per-stage latency in milliseconds")
+metrics_registry.describe("frames_dropped_total", "Frames dropped before detection, by reason")
+for _reason in ("superseded", "out_of_order", "stale", "lost_upstream"):
+    metrics_registry.counter_fn("frames_dropped_total", lambda r=_reason: frame_mailbox.counters[r], reason=_reason)
+metrics_registry.counter_fn("frames_received_total", lambda: frame_mailbox.counters["received"])
+metrics_registry.gauge_fn("mailbox_pending_frames", lambda: len(frame_mailbox))
+metrics_registry.gauge_fn("gallery_identities", lambda: len(gallery))
+if crop_quality_gate is not None:
+    metrics_registry.describe("reid_crops_quality_rejected_total", "Detections not embedded by the crop quality gate, by reason")
+    for _reason in REJECT_REASONS:
+        metrics_registry.counter_fn("reid_crops_quality_rejected_total",
+                                    lambda r=_reason: crop_quality_gate.counters[r], reason=_reason)
+metrics_registry.counter_fn("gallery_gated_searches_total", lambda: gallery.counters["gated_searches"])
+metrics_registry.counter_fn("gallery_gate_candidates_total", lambda: gallery.counters["gate_candidates"])
+if gallery_store is not None:
+    for _counter in ("snapshots", "snapshot_failures", "log_records", "log_bytes"):
+        metrics_registry.counter_fn(f"gallery_store_{_counter}_total", lambda c=_counter: gallery_store.counters[c])
+metrics_registry.gauge_fn("tracked_cameras", lambda: len(track_caches))
+# Log records are queued in memory and shipped in batches by a background thread
+rabbitmq_logger = AsyncRabbitMQLogger(host='localhost', queue='anpr_logs')
 
-# Load YOLOv10 model
-model_path = "yolov10n.pt"
-model = YOLO(model_path)
 # Function to send logs to RabbitMQ
 def send_log_to_rabbitmq(log_message):
-    try:
-        connection = pika.BlockingConnection(pika.ConnectionParameters(host='localhost',heartbeat=600))
-        channel = connection.channel()
-        channel.queue_declare(queue='anpr_logs')  # Declare the queue for logs
-        # Serialize the log message as JSON and send it to RabbitMQ
-        channel.basic_publish(
-            exchange='',
-            routing_key='anpr_logs',
-            body=pickle.dumps(log_message)
-        )
-        connection.close()
-    except Exception as e:
-        print(f"Failed to send log to RabbitMQ: {e}")
+    rabbitmq_logger.send_log(log_message)
 
 # Wrapper functions for logging and sending logs to RabbitMQ
 def log_info(message):
@@ -89,20 +266,238 @@ def setup_rabbitmq_connection(queue_name, rabbitmq_host, retries=5, retry_delay=
 
 
 
-def match_reid(feature, threshold=0.6):
-    global next_reid
-    best_id, best_dist = -1, float('inf')
-    for pid, feat in gallery:
-        dist = np.linalg.norm(feature - feat)
-        if dist < best_dist:
-            best_id, best_dist = pid, dist
-    if best_dist < threshold:
-        return best_id
-    else:
-        gallery.append((next_reid, feature))
-        assigned_id = next_reid
-        next_reid += 1
-        return assigned_id
+def resolve_reid_ids(frame, camera_id, detections, now=None):
+    """
+    Resolve the ReID identity of every tracked detection of a frame.
+
+    Tracks with a fresh entry in the camera's TrackCache reuse their cached
+    identity; only the rest are embedded (in one batch) and matched. Crops
+    the quality gate rejects are not embedded: they keep their cached
+    identity if they have one and stay unresolved otherwise.
+
+    Args:
+        frame: BGR frame the detections belong to.
+        camera_id: Camera the frame came from.
+        detections: List of (box, class_id, track_id, score).
+        now (float): When the frame was captured (wall clock). Topology
+            transit windows and last-seen times are measured against it, so
+            detector lag doesn't inflate them. Defaults to ``time.time()``.
+
+    Returns:
+        (reid_ids, valid): (N,) identity array and a mask of resolved rows.
+    """
+    now = time.time() if now is None else now
+    track_cache = track_caches.get(camera_id)
+    if track_cache is None:
+        track_cache = track_caches[camera_id] = TrackCache(**TRACK_CACHE_SETTINGS)
+    track_cache.step([d[2] for d in detections])
+
+    reid_ids = np.full(len(detections), -1, dtype=np.int64)
+    valid = np.zeros(len(detections), dtype=bool)
+    refresh = []
+    for i, (box, _, track_id, score) in enumerate(detections):
+        entry = track_cache.get(track_id)
+        if track_cache.needs_refresh(track_id, box, score) or entry.reid_id not in gallery:
+            refresh.append(i)
+        else:
+            reid_ids[i] = entry.reid_id
+            valid[i] = True
+    if refresh and crop_quality_gate is not None:
+        accepted, _ = crop_quality_gate.check(frame, [detections[i][0] for i in refresh],
+                                              [detections[i][3] for i in refresh],
+                                              frame_boxes=[d[0] for d in detections])
+        for i in np.asarray(refresh)[~accepted]:
+            entry = track_cache.get(detections[i][2])
+            if entry is not None and entry.reid_id in gallery:
+                reid_ids[i] = entry.reid_id
+                valid[i] = True
+        refresh = [i for i, ok in zip(refresh, accepted) if ok]
+    gallery.touch(reid_ids[valid], now=now, camera_id=camera_id)
+    if not refresh:
+        return reid_ids, valid
+
+    # === Extract ReID features for refreshed boxes in one batch ===
+    with metrics_registry.timer("stage_latency_ms", stage="reid_extract"):
+        features, extracted = extract_reid_features(frame, [detections[i][0] for i in refresh])
+    refresh = np.asarray(refresh)[extracted]
+    if len(refresh) == 0:
+        return reid_ids, valid
+    features = features[extracted]
+    with metrics_registry.timer("stage_latency_ms", stage="gallery_match"):
+        matched_ids, distances = gallery.match(features, joint=GALLERY_JOINT_ASSIGNMENT, now=now, camera_id=camera_id)
+    for i, reid_id, feature, distance in zip(refresh, matched_ids, features, distances):
+        box, _, track_id, score = detections[i]
+        # A freshly created identity is an exact match of itself
+        distance = 0.0 if np.isinf(distance) else float(distance)
+        track_cache.update(track_id, int(reid_id), feature, box, score, distance)
+        reid_ids[i] = reid_id
+        valid[i] = True
+    return reid_ids, valid
+
+def load_frame(body):
+    """
+    Deserialize a frame message and resolve its pixels.
+
+    Returns:
+        (frame_data, frame, frame_descriptor, frame_is_shared), or None if
+        the frame has to be dropped. ``frame_is_shared`` tells whether
+        ``frame`` is a view into the framer's shared-memory ring.
+    """
+    frame_data = unpack_frame(body)
+    camera_id = frame_data.get("camera_id", "Unknown")  # Default to 'Unknown' if not found
+    frame = frame_data.get("frame", None)  # Ensure 'frame' is present
+    frame_descriptor = None
+    if frame_data.get("transport") == "shm":
+        # Zero-copy view into the framer's ring buffer
+        frame_descriptor = frame_data.get("shm")
+        frame = frame_ring_reader.read(camera_id, frame_descriptor)
+        if frame is None:
+            log_error(f"Frame from camera {camera_id} was overwritten before it was read, dropping")
+            metrics_registry.inc("frames_dropped_total", reason="shm_overwritten")
+            return None
+
+    if frame is None:
+        raise log_error("Frame data is missing from the message")
+
+    encoding = frame_data.get("encoding", "raw")
+    frame = decode_frame(frame, encoding)
+    # Only raw frames in shared memory alias the framer's ring
+    frame_is_shared = frame_descriptor is not None and encoding in ("raw", "downscale")
+    if frame_descriptor is not None and not frame_is_shared and not frame_ring_reader.is_current(frame_descriptor):
+        log_error(f"Frame from camera {camera_id} was overwritten while it was decoded, dropping")
+        metrics_registry.inc("frames_dropped_total", reason="shm_overwritten")
+        return None
+    return frame_data, frame, frame_descriptor, frame_is_shared
+
+
+def handle_tracked_frame(frame_data, frame, frame_descriptor, frame_is_shared, results):
+    """
+    Resolve ReID identities for a camera's tracked result.
+
+    Returns:
+        dict: The compact result record published for the frame, or None
+        if its shared-memory frame was overwritten while it was processed.
+    """
+    global frames_processed
+    camera_id = frame_data.get("camera_id", "Unknown")
+    boxes = results.boxes
+    detections = []
+    if boxes.id is not None:
+        for box, cls_id, track_id, score in zip(boxes.xyxy, boxes.cls, boxes.id, boxes.conf):
+            if score > RESULT_SCORE_THRESHOLD:
+                x1, y1, x2, y2 = map(int, box.tolist())
+                detections.append(((x1, y1, x2, y2), int(cls_id.item()), int(track_id.item()), float(score)))
+
+    reid_ids, valid = resolve_reid_ids(frame, camera_id, detections, now=frame_data.get("capture_time") or time.time())
+    if activity_report is not None:
+        track_cache = track_caches.get(camera_id)
+        activity_report.observe(camera_id, len(detections), len(track_cache) if track_cache is not None else 0)
+    if frame_is_shared and not frame_ring_reader.is_current(frame_descriptor):
+        # Detections and identities may come from a torn frame: don't publish them
+        log_error(f"Frame from camera {camera_id} was overwritten while it was processed, dropping")
+        metrics_registry.inc("frames_dropped_total", reason="shm_overwritten")
+        return None
+
+    record = {
+        "camera_id": camera_id,
+        "user_id": frame_data.get("user_id"),
+        "date_time": frame_data.get("date_time"),
+        "capture_time": frame_data.get("capture_time"),
+        "seq": frame_data.get("seq"),
+        "stream": frame_data.get("stream"),
+        "timestamp": time.time(),
+        "frame_shape": tuple(frame.shape[:2]),
+        "detections": [
+            {
+                "track_id": track_id,
+                "reid_id": int(reid_id) if is_valid else None,
+                "box": box,
+                "score": round(score, 4),
+                "class_name": results.names[class_id],
+            }
+            for (box, class_id, track_id, score), reid_id, is_valid in zip(detections, reid_ids, valid)
+        ],
+    }
+    frames_processed += 1
+    if frames_processed % GALLERY_STATS_INTERVAL == 0:
+        log_info(f"ReID gallery stats: {gallery.stats()}")
+        if gallery_store is not None:
+            log_info(f"ReID gallery store stats: {gallery_store.stats()}")
+        log_info(f"Track cache stats: { {cam: c.stats() for cam, c in track_caches.items()} }")
+        if crop_quality_gate is not None:
+            log_info(f"Crop quality gate stats: {crop_quality_gate.stats()}")
+    return record
+
+
+def publish_results(processed_queue_name, records):
+    """
+    Publish result records to the processed_queue_name exchange in one pass.
+    """
+    if not records:
+        return
+    outcomes = results_publisher.publish_batch(processed_queue_name, [pack_message(KIND_RESULT, r) for r in records])
+    failed = [error for ok, error in outcomes if not ok]
+    if failed:
+        log_error(f"Failed to publish {len(failed)} of {len(records)} results: {failed[0]}")
+
+
+def process_frames(bodies, processed_queue_name, rabbitmq_host):
+    """
+    Process a batch of frame messages, possibly from several cameras.
+
+    Person detection runs as one batched ``predict`` over all frames; each
+    frame's detections then go through its own camera's tracker, in order,
+    and the batch's results are published to ``processed_queue_name``.
+
+    Args:
+        bodies: Serialized frame messages received from the queue.
+        processed_queue_name: RabbitMQ exchange for processed results.
+    """
+    loaded = []
+    for body in bodies:
+        try:
+            with metrics_registry.timer("stage_latency_ms", stage="decode"):
+                item = load_frame(body)
+        except Exception as e:
+            log_exception(f"Error processing frame --=: {e}")
+            continue
+        if item is None:
+            continue
+        object_list = item[0].get("object_list", None)
+        # Detect and classify objects in the frame
+        if object_list and "person" in object_list:
+            loaded.append(item)
+    if not loaded:
+        return
+
+    try:
+        with metrics_registry.timer("stage_latency_ms", stage="detect"):
+            batch_results = get_detector().predict(source=[item[1] for item in loaded], classes=0, verbose=False)
+        metrics_registry.observe("detect_batch_frames", len(loaded))
+    except Exception as e:
+        log_exception(f"Error running detection on a batch of {len(loaded)} frames: {e}")
+        return
+
+    records = []
+    for (frame_data, frame, frame_descriptor, frame_is_shared), results in zip(loaded, batch_results):
+        try:
+            camera_id = frame_data.get("camera_id", "Unknown")
+            with metrics_registry.timer("stage_latency_ms", stage="track"):
+                results = camera_trackers.update(camera_id, results, frame)
+            record = handle_tracked_frame(frame_data, frame, frame_descriptor, frame_is_shared, results)
+            if record is not None:
+                records.append(record)
+        except Exception as e:
+            log_exception(f"Error processing frame --=: {e}")
+    try:
+        with metrics_registry.timer("stage_latency_ms", stage="publish"):
+            publish_results(processed_queue_name, records)
+    except Exception as e:
+        log_exception(f"Error publishing results: {e}")
+    if gallery_store is not None:
+        gallery_store.maybe_snapshot()
+    metrics_registry.inc("frames_processed_total", len(records))
+
 
 def process_frame(ch, method, properties, body, processed_queue_name, rabbitmq_host):
     """
@@ -113,92 +508,265 @@ def process_frame(ch, method, properties, body, processed_queue_name, rabbitmq_h
         body: The serialized frame data received from the queue.
         processed_channel: RabbitMQ channel for sending processed frames.
     """
-    global obj_list
+    process_frames([body], processed_queue_name, rabbitmq_host)
 
-    #processed_connection, processed_channel = setup_rabbitmq_connection(processed_queue_name, rabbitmq_host)
-    # Load and print BoT-SORT config values
-    tracker_config_path = "botsort.yaml"
-    # if not os.path.exists(tracker_config_path):
-    #     raise FileNotFoundError(f"Tracker config not found: {tracker_config_path}")
+def declare_frame_queue(connection, channel, exchange, queue_name=FRAME_QUEUE_NAME):
+    """
+    Declare the bounded frame queue and bind it to the frame exchange.
+
+    Returns the channel to use, which is a new one if the broker rejected
+    the declaration because the queue already exists with other arguments.
+    """
+    try:
+        channel.queue_declare(queue=queue_name, durable=True, arguments=FRAME_QUEUE_ARGUMENTS)
+    except pika.exceptions.ChannelClosedByBroker as e:
+        log_error(f"Queue {queue_name} exists without the frame limits ({e}); delete it to apply them")
+        channel = connection.channel()
+        channel.queue_declare(queue=queue_name, passive=True)
+    channel.queue_bind(exchange=exchange, queue=queue_name)
+    return channel
 
-    # with open(tracker_config_path, 'r') as f:
-    #     tracker_config = yaml.safe_load(f)
 
-    # print("BoT-SORT Config:")
-    # print(f"  with_reid       : {tracker_config.get('with_reid')}")
-    # print(f"  track_buffer    : {tracker_config.get('track_buffer')}")
-    # print(f"  new_track_thresh: {tracker_config.get('new_track_thresh')}")
-    # print(f"  reid_weights    : {tracker_config.get('reid_weights')}")
+def on_frame_message(ch, method, properties, body):
+    """
+    Consumer callback: park the delivery in the per-camera mailbox.
+
+    Uses only the AMQP headers stamped by the framer, so frames that get
+    superseded are never decoded.
+    """
+    headers = properties.headers or {}
+    if SHARDED_MODE and "camera_id" in headers and bucket_of(headers["camera_id"]) not in owned_buckets:
+        # Still in flight from before a rebalance; the new owner gets the next one
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+        return
+    # Frames without stamps (older framers) are never superseded
+    camera_id = headers.get("camera_id", ("unstamped", method.delivery_tag))
+    frame_mailbox.put(camera_id, headers.get("seq"), (ch, method, properties, body), stream=headers.get("stream"))
 
+
+def on_heartbeat_message(ch, method, properties, body):
     try:
-        # Deserialize the frame and metadata
-        frame_data = pickle.loads(body)
-        camera_id = frame_data.get("camera_id", "Unknown")  # Default to 'Unknown' if not found
-        frame = frame_data.get("frame", None)  # Ensure 'frame' is present
-        user_id = frame_data.get("user_id", "Unknown") # Default to 'Unknown'
-        date_time = frame_data.get("date_time", "Unknown") # Default
-        object_list = frame_data.get("object_list",None)
-        #print("This is payload data :", frame_data)
-        
-        if frame is None:
-            raise log_error("Frame data is missing from the message")
+        shard_membership.observe(unpack_message(body, KIND_WORKER_HEARTBEAT))
+    except WireFormatError as e:
+        log_error(f"Ignoring malformed worker heartbeat: {e}")
 
-        # Detect and classify objects in the frame
-        if "person" in object_list:
-            # Run tracking
-            results = model.track(source=frame, classes=0, persist=True, tracker=tracker_config_path,verbose=False)[0]
-            # Draw results
-            boxes = results.boxes
-            if boxes.id is not None:
-                for box, cls_id, track_id, score in zip(boxes.xyxy, boxes.cls, boxes.id, boxes.conf):
-                    if score > 0.4:
-                        x1, y1, x2, y2 = map(int, box.tolist())
-                        class_id = int(cls_id.item())
-                        track_id = int(track_id.item())
-                        class_name = results.names[class_id]
-                        #person_crop = frame[y1:y2, x1:x2]
-                        # === Extract ReID feature here ===
-                        feature = extract_reid_feature(frame, (x1, y1, x2, y2))
-                        print("THese are feature :", feature)
-                        if feature is not None:
-                            print(f"[ReID] Feature for Track ID {track_id}: {feature[:5]}...")  # Print first 5 dims
-                        reid_id = match_reid(feature)
-                        label = f"{class_name} (ReID:{reid_id})"
-
-
-                        #label = f"{class_name} (ID:{track_id})"
-                        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                        cv2.putText(frame, label, (x1, y1 + 10),
-                                    cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
-            # Resize and show
-            frame = cv2.resize(frame, (900, 700))
-            # Display in the correct window based on camera ID
-            if camera_id == 20:
-                cv2.imshow("win20", frame)
-            elif camera_id == 21:
-                cv2.imshow("win21", frame)
-            else:
-                cv2.imshow("win_unknown", frame)  # Optional: for unexpected IDs
-            if cv2.waitKey(20) & 0xFF == ord("q"):
-                cv2.destroyAllWindows()
-                os._exit(0)      
-            # Print metadata (camera ID)
-            log_info(f"Received frame from Camera ID: {camera_id}")
-    
+
+def setup_sharded_consumer(channel):
+    """
+    Declare this worker's frame queue and join the worker heartbeat exchange.
+
+    The frame queue starts without bindings; shard_tick binds it to the
+    buckets this worker owns once it has heard from its peers.
+    """
+    global shard_membership, owned_buckets
+    if shard_membership is None:
+        shard_membership = ShardMembership()
+    owned_buckets = set()
+    channel.exchange_declare(exchange=SHARDED_FRAME_EXCHANGE, exchange_type="direct")
+    channel.exchange_declare(exchange=WORKER_EXCHANGE, exchange_type="fanout")
+    queue_name = f"{FRAME_QUEUE_NAME}.{shard_membership.worker_id}"
+    channel.queue_declare(queue=queue_name, exclusive=True, arguments=FRAME_QUEUE_ARGUMENTS)
+    heartbeat_queue = channel.queue_declare(queue="", exclusive=True).method.queue
+    channel.queue_bind(exchange=WORKER_EXCHANGE, queue=heartbeat_queue)
+    channel.basic_consume(
+        queue=heartbeat_queue,
+        on_message_callback=on_heartbeat_message,
+        auto_ack=True
+    )
+    return queue_name
+
+
+def release_cameras(buckets):
+    """
+    Drop the local tracking state of cameras in buckets this worker lost.
+    """
+    for camera_id in [cam for cam in track_caches if bucket_of(cam) in buckets]:
+        del track_caches[camera_id]
+    for camera_id in [cam for cam in camera_trackers if bucket_of(cam) in buckets]:
+        camera_trackers.drop(camera_id)
+
+
+def shard_tick(channel, queue_name):
+    """
+    Send our heartbeat and rebind the frame queue when bucket ownership changes.
+    """
+    global owned_buckets
+    if shard_membership.heartbeat_due():
+        channel.basic_publish(exchange=WORKER_EXCHANGE, routing_key="",
+                              body=pack_message(KIND_WORKER_HEARTBEAT, shard_membership.heartbeat_message()))
+    if not shard_membership.ready():
+        return
+    buckets = shard_membership.owned_buckets()
+    if buckets == owned_buckets:
+        return
+    for bucket in buckets - owned_buckets:
+        channel.queue_bind(exchange=SHARDED_FRAME_EXCHANGE, queue=queue_name, routing_key=bucket_routing_key(bucket))
+    released = owned_buckets - buckets
+    for bucket in released:
+        channel.queue_unbind(exchange=SHARDED_FRAME_EXCHANGE, queue=queue_name, routing_key=bucket_routing_key(bucket))
+    owned_buckets = buckets
+    release_cameras(released)
+    log_info(f"Worker {shard_membership.worker_id} now owns {len(buckets)} buckets "
+             f"({len(shard_membership.live_workers())} live workers)")
+
+
+def shard_goodbye(channel):
+    """
+    Tell the peers we are leaving so they take over our buckets right away.
+    """
+    try:
+        channel.basic_publish(exchange=WORKER_EXCHANGE, routing_key="",
+                              body=pack_message(KIND_WORKER_HEARTBEAT, shard_membership.heartbeat_message(leaving=True)))
+    except Exception:
+        pass
+
+
+def _next_fresh_frame():
+    """
+    Pop the next pending frame that is still young enough to process.
+    """
+    while True:
+        entry = frame_mailbox.pop()
+        if entry is None:
+            return None
+        item = entry[1]
+        age = frame_age_ms(item[2].headers or {})
+        if MAX_FRAME_AGE_MS is not None and age is not None and age > MAX_FRAME_AGE_MS:
+            frame_mailbox.drop_stale(item)
+            continue
+        if age is not None:
+            # Capture to dequeue: encode, publish and broker/mailbox wait
+            metrics_registry.observe("stage_latency_ms", age, stage="queue_wait")
+        return item
+
+
+def update_queue_depth(channel, queue_name):
+    """
+    Ask the broker how many frames wait in ``queue_name`` (passive declare).
+
+    Returns:
+        int: The depth, or None if the broker couldn't be asked.
+    """
+    try:
+        depth = channel.queue_declare(queue=queue_name, passive=True).method.message_count
+    except pika.exceptions.AMQPError:
+        return None
+    metrics_registry.set_gauge("frame_queue_depth", depth)
+    return depth
+
+
+def report_activity(queue_depth):
+    """
+    Publish the camera activity seen since the last report to the framer.
+    """
+    ok, error = results_publisher.publish(ACTIVITY_EXCHANGE,
+                                          pack_message(KIND_CAMERA_ACTIVITY, activity_report.message(queue_depth)))
+    if not ok:
+        log_error(f"Failed to publish camera activity: {error}")
+
+
+def consume_frames(connection, channel, processed_queue_name, rabbitmq_host, on_tick=None, queue_name=None):
+    """
+    Serve the latest frame of each camera until the channel closes.
+
+    Frames are gathered into batches of up to DETECT_MAX_BATCH, waiting at
+    most DETECT_MAX_WAIT_MS after the first one for more cameras to arrive.
+    """
+    last_stats = last_depth = time.monotonic()
+    queue_depth = None
+    while channel.is_open:
+        # Pull in everything the broker has delivered, waiting only when idle
+        connection.process_data_events(time_limit=0 if len(frame_mailbox) else 1)
+        if on_tick is not None:
+            on_tick()
+        if time.monotonic() - last_stats > FRAME_STATS_INTERVAL_S:
+            last_stats = time.monotonic()
+            log_info(f"Frame delivery stats: {frame_mailbox.stats()}")
+        if queue_name is not None and time.monotonic() - last_depth > QUEUE_DEPTH_INTERVAL_S:
+            last_depth = time.monotonic()
+            queue_depth = update_queue_depth(channel, queue_name)
+        if queue_name is not None and activity_report is not None and activity_report.due():
+            report_activity(queue_depth)
+        item = _next_fresh_frame()
+        if item is None:
+            continue
+        batch = [item]
+        deadline = time.monotonic() + DETECT_MAX_WAIT_MS / 1000.0
+        while len(batch) < DETECT_MAX_BATCH:
+            item = _next_fresh_frame()
+            if item is not None:
+                batch.append(item)
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            connection.process_data_events(time_limit=remaining)
+        try:
+            process_frames([body for _, _, _, body in batch], processed_queue_name, rabbitmq_host)
+        finally:
+            for item in batch:
+                frame_mailbox.mark_processed()
+                _ack_delivery(item)
+
+
+def load_models():
+    """
+    Load and warm up every registered model (detector and ReID) and log how
+    long each took. main() calls this before consuming, so a worker only
+    takes frames off the queue once its models are hot.
+    """
+    for name, timing in MODELS.load_all().items():
+        log_info(f"Model {name} loaded in {timing['load_s']:.1f}s, warmed up in {timing['warmup_s']:.1f}s")
+
+
+def restore_gallery():
+    """
+    Map the last gallery snapshot and replay the log written after it, so
+    identities and next ids carry over a restart; from here on every
+    gallery change is journaled to GALLERY_STORE_DIR.
+    """
+    if gallery_store is None:
+        return
+    start = time.perf_counter()
+    try:
+        restored = gallery_store.restore(gallery)
     except Exception as e:
-        log_exception(f"Error processing frame --=: {e}")
+        gallery.restore_state(np.empty(0, dtype=np.int64), None, [], gallery.next_id, None)
+        # A new generation, numbered above every id the unreadable files mention
+        next_id = gallery_store.start_fresh(gallery)
+        log_exception(f"Failed to restore the ReID gallery from {GALLERY_STORE_DIR}, starting empty "
+                      f"with next id {next_id}: {e}")
+        return
+    log_info(f"Restored {restored} ReID identities (next id {gallery.next_id}) from {GALLERY_STORE_DIR} "
+             f"in {time.perf_counter() - start:.2f}s: {gallery_store.stats()}")
+
 
 def main(receive_queue_name="all_frame", processed_queue_name="detect_person_object", rabbitmq_host="localhost"):
     """
-    Main function to set up RabbitMQ connections for receiving and sending frames.
+    Main function to set up RabbitMQ connections for receiving frames and sending results.
+
+    Runs headless: every processed frame yields one result record (camera,
+    capture stamps, and per detection track_id, reid_id, box and score)
+    published to the ``processed_queue_name`` fanout exchange. Run
+    result_viewer.py to see annotated frames.
+
+    Frames are consumed with manual acks and a bounded prefetch from a
+    length- and TTL-limited queue, and only the latest frame of each camera
+    is processed (see LatestFrameMailbox).
+
+    With SHARDED_MODE every worker consumes its own queue, bound to the
+    camera buckets it owns by rendezvous hashing over the live workers, so
+    a camera's frames and tracker state always stay on one worker.
 
     Args:
         queue_name (str): The RabbitMQ queue to consume frames from. Defaults to 'video_frames'.
         processed_queue_name (str): The RabbitMQ queue to send processed frames to. Defaults to 'processed_frames'.
     """
+    start_metrics_server(METRICS_PORT)
+    load_models()
+    restore_gallery()
     # Set up RabbitMQ connection and channel for receiving frames
     receiver_connection, receiver_channel = setup_rabbitmq_connection(receive_queue_name, rabbitmq_host)
-    queue_name = "detected_vehicle"
 
     while True:
         try:
@@ -206,18 +774,34 @@ def main(receive_queue_name="all_frame", processed_queue_name="detect_person_obj
                 log_error("Receiver channel is closed. Attempting to reconnect.")
                 time.sleep(25)
                 receiver_connection, receiver_channel = setup_rabbitmq_connection(receive_queue_name, rabbitmq_host)
-            receiver_channel.queue_declare(queue=queue_name, durable=True)
-            receiver_channel.queue_bind(exchange=receive_queue_name, queue=queue_name)
-            # Start consuming frames from the 'video_frames' queue
+            # Deliveries parked before a reconnect can't be acked anymore
+            frame_mailbox.clear()
+            results_publisher.declare_exchange(processed_queue_name, "fanout")
+            if activity_report is not None:
+                results_publisher.declare_exchange(ACTIVITY_EXCHANGE, "fanout")
+            receiver_channel.basic_qos(prefetch_count=FRAME_PREFETCH)
+            on_tick = None
+            if SHARDED_MODE:
+                queue_name = setup_sharded_consumer(receiver_channel)
+                channel = receiver_channel
+                on_tick = lambda: shard_tick(channel, queue_name)
+            else:
+                queue_name = FRAME_QUEUE_NAME
+                receiver_channel = declare_frame_queue(receiver_connection, receiver_channel, receive_queue_name)
             receiver_channel.basic_consume(
-                queue=queue_name, 
-                on_message_callback=lambda ch, method, properties, body: process_frame(
-                    ch, method, properties, body, processed_queue_name,rabbitmq_host 
-                ),
-                auto_ack=True
+                queue=queue_name,
+                on_message_callback=on_frame_message,
+                auto_ack=False
             )
             log_info("Waiting for video frames...")
-            receiver_channel.start_consuming()
+            consume_frames(receiver_connection, receiver_channel, processed_queue_name, rabbitmq_host,
+                           on_tick=on_tick, queue_name=queue_name)
+        except (KeyboardInterrupt, SystemExit):
+            if SHARDED_MODE and receiver_channel.is_open:
+                shard_goodbye(receiver_channel)
+            if gallery_store is not None:
+                gallery_store.close()
+            raise
         except pika.exceptions.ConnectionClosedByBroker as e:
             log_error("Connection closed by broker, reconnecting...")
             time.sleep(25)
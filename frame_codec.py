@@ -0,0 +1,94 @@
+import cv2
+import numpy as np
+
+# Per-camera frame encodings understood by decode_frame:
+#   raw       - the BGR ndarray as captured
+#   jpeg      - lossy, ``quality`` 1-100
+#   png       - lossless, ``png_compression`` 0-9
+#   downscale - raw BGR resized so its long edge is ``max_long_edge``
+FRAME_ENCODINGS = ("raw", "jpeg", "png", "downscale")
+
+DEFAULT_ENCODING = {
+    "type": "raw",
+    "quality": 85,
+    "png_compression": 1,
+    "max_long_edge": None,
+}
+
+
+def encoding_settings(encoding):
+    """
+    Normalise a per-camera encoding setting into a full settings dict.
+
+    Accepts None, an encoding name ("jpeg") or a partial dict
+    ({"type": "jpeg", "quality": 70, "max_long_edge": 1280}).
+    """
+    settings = dict(DEFAULT_ENCODING)
+    if isinstance(encoding, str):
+        settings["type"] = encoding
+    elif isinstance(encoding, dict):
+        settings.update({k: v for k, v in encoding.items() if v is not None})
+    settings["type"] = str(settings["type"]).lower()
+    if settings["type"] not in FRAME_ENCODINGS:
+        raise ValueError(f"Unknown frame encoding {settings['type']!r}, expected one of {FRAME_ENCODINGS}")
+    if settings["type"] == "downscale" and not settings["max_long_edge"]:
+        raise ValueError("The downscale encoding needs max_long_edge")
+    return settings
+
+
+def downscale(frame, max_long_edge):
+    """
+    Resize ``frame`` so its long edge is at most ``max_long_edge`` pixels.
+    """
+    h, w = frame.shape[:2]
+    long_edge = max(h, w)
+    if not max_long_edge or long_edge <= max_long_edge:
+        return frame
+    scale = max_long_edge / float(long_edge)
+    return cv2.resize(frame, (max(1, round(w * scale)), max(1, round(h * scale))),
+                      interpolation=cv2.INTER_AREA)
+
+
+def encode_frame(frame, settings):
+    """
+    Encode a BGR frame for publishing.
+
+    Args:
+        frame: BGR ndarray as read from the camera.
+        settings (dict): Output of ``encoding_settings``.
+
+    Returns:
+        (payload, header): ``payload`` is an ndarray (raw, downscale) or
+        bytes (jpeg, png); ``header`` holds the fields decode_frame needs.
+    """
+    header = {"encoding": "raw", "source_shape": tuple(frame.shape)}
+    frame = downscale(frame, settings.get("max_long_edge"))
+    kind = settings["type"]
+    if kind == "jpeg":
+        ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, int(settings["quality"])])
+    elif kind == "png":
+        ok, buf = cv2.imencode(".png", frame, [cv2.IMWRITE_PNG_COMPRESSION, int(settings["png_compression"])])
+    else:
+        return frame, header
+    if not ok:
+        raise ValueError(f"Failed to encode frame as {kind}")
+    header["encoding"] = kind
+    return buf.tobytes(), header
+
+
+def decode_frame(payload, encoding="raw"):
+    """
+    Decode a payload produced by ``encode_frame`` back to a BGR ndarray.
+
+    ``payload`` may be bytes or a uint8 ndarray (e.g. a shared-memory view).
+    """
+    if encoding in (None, "raw", "downscale"):
+        return payload
+    if encoding not in ("jpeg", "png"):
+        raise ValueError(f"Unknown frame encoding {encoding!r}")
+    if not isinstance(payload, np.ndarray):
+        payload = np.frombuffer(payload, dtype=np.uint8)
+    frame = cv2.imdecode(payload, cv2.IMREAD_COLOR)
+    if frame is None:
+        raise ValueError(f"Failed to decode {encoding} frame")
+    return frame
@@ -0,0 +1,118 @@
+import time
+import socket
+from collections import OrderedDict
+
+HOSTNAME = socket.gethostname()
+
+
+def now_ms():
+    """
+    Monotonic clock in milliseconds, comparable between processes of one host.
+    """
+    return time.monotonic() * 1000.0
+
+
+def frame_age_ms(headers, now_monotonic_ms=None, now_wall=None):
+    """
+    Age of a frame from its capture stamps.
+
+    The monotonic stamp is used when the frame was captured on this host;
+    otherwise fall back to the wall-clock capture time (needs synced clocks).
+    Returns None if the frame carries no usable stamp.
+    """
+    if headers.get("host") == HOSTNAME and headers.get("capture_ts_ms") is not None:
+        now_monotonic_ms = now_ms() if now_monotonic_ms is None else now_monotonic_ms
+        return now_monotonic_ms - float(headers["capture_ts_ms"])
+    if headers.get("capture_time") is not None:
+        now_wall = time.time() if now_wall is None else now_wall
+        return (now_wall - float(headers["capture_time"])) * 1000.0
+    return None
+
+
+class LatestFrameMailbox:
+    """
+    Holds at most one pending frame per camera.
+
+    A newer frame from a camera replaces the one still waiting, so when the
+    detector falls behind it skips straight to the present instead of
+    working through a backlog. Cameras are served round-robin in arrival
+    order. Frames whose sequence number is not newer than the last one
+    accepted for the camera are rejected; gaps in the sequence are counted
+    as frames lost upstream (broker max-length / TTL).
+
+    ``on_drop(item)`` is called for every superseded or rejected item, e.g.
+    to ack its delivery.
+    """
+
+    def __init__(self, on_drop=None):
+        self.on_drop = on_drop
+        self._pending = OrderedDict()  # camera_id -> item
+        self._last_seq = {}
+        self.counters = {
+            "received": 0,
+            "processed": 0,
+            "superseded": 0,
+            "out_of_order": 0,
+            "stale": 0,
+            "lost_upstream": 0,
+        }
+
+    def __len__(self):
+        return len(self._pending)
+
+    def _drop(self, item, reason):
+        self.counters[reason] += 1
+        if self.on_drop is not None:
+            self.on_drop(item)
+
+    def put(self, camera_id, seq, item, stream=None):
+        """
+        Offer a frame. Returns False if it was rejected as out of order.
+
+        ``stream`` identifies one framer run of the camera; its sequence
+        numbers restart from zero when the framer process restarts.
+        """
+        self.counters["received"] += 1
+        last_stream, last = self._last_seq.get(camera_id, (None, None))
+        if seq is not None and last is not None and stream == last_stream:
+            if seq <= last:
+                self._drop(item, "out_of_order")
+                return False
+            if seq > last + 1:
+                self.counters["lost_upstream"] += seq - last - 1
+        if seq is not None:
+            self._last_seq[camera_id] = (stream, seq)
+        old = self._pending.pop(camera_id, None)
+        if old is not None:
+            self._drop(old, "superseded")
+        self._pending[camera_id] = item
+        return True
+
+    def pop(self):
+        """
+        Return ``(camera_id, item)`` of the longest waiting camera, or None.
+        """
+        if not self._pending:
+            return None
+        return self._pending.popitem(last=False)
+
+    def clear(self):
+        """
+        Forget pending frames without calling ``on_drop`` (e.g. after a
+        reconnect, when their deliveries can no longer be acked).
+        """
+        self._pending.clear()
+
+    def drop_stale(self, item):
+        """
+        Record that a popped item was discarded for being too old.
+        """
+        self._drop(item, "stale")
+
+    def mark_processed(self):
+        self.counters["processed"] += 1
+
+    def stats(self):
+        stats = dict(self.counters)
+        stats["pending"] = len(self._pending)
+        return stats
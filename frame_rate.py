@@ -0,0 +1,142 @@
+import time
+
+from worker_sharding import default_worker_id
+
+# Fanout exchange detect_person workers report per-camera activity and their
+# frame queue depth on; the framer adapts each camera's frame rate to it
+ACTIVITY_EXCHANGE = "camera_activity"
+
+
+class ActivityReport:
+    """
+    Per-camera activity a detect_person worker saw since its last report.
+
+    For every camera that had a frame processed, the report carries the most
+    people detected in one frame and the most tracks alive in its track
+    cache; the worker's frame queue depth (consumer lag) goes alongside.
+
+    Args:
+        interval_s (float): Seconds between reports.
+        worker_id (str): Identifies the reporting worker.
+    """
+
+    def __init__(self, interval_s=2.0, worker_id=None):
+        self.interval_s = interval_s
+        self.worker_id = worker_id or default_worker_id()
+        self.last_report = time.monotonic()
+        self._cameras = {}  # camera_id -> {"people": .., "tracks": ..}
+
+    def observe(self, camera_id, people, tracks):
+        seen = self._cameras.get(camera_id)
+        if seen is None:
+            self._cameras[camera_id] = {"people": int(people), "tracks": int(tracks)}
+        else:
+            seen["people"] = max(seen["people"], int(people))
+            seen["tracks"] = max(seen["tracks"], int(tracks))
+
+    def due(self, now=None):
+        now = time.monotonic() if now is None else now
+        return now - self.last_report >= self.interval_s
+
+    def message(self, queue_depth=None, now=None):
+        """
+        Build the report and start collecting the next one.
+        """
+        self.last_report = time.monotonic() if now is None else now
+        cameras, self._cameras = self._cameras, {}
+        # A list rather than a dict keyed by camera: JSON keys would turn ids into strings
+        return {"worker_id": self.worker_id, "time": time.time(), "queue_depth": queue_depth,
+                "cameras": [dict(activity, camera_id=camera_id) for camera_id, activity in cameras.items()]}
+
+
+class AdaptiveFrameRate:
+    """
+    Frame rate of one camera between ``min_fps`` and ``max_fps``.
+
+    Any activity (people detected or tracks still alive) puts the camera
+    straight back at ``max_fps``, so nobody walking in is sampled too
+    sparsely to track. Once the scene has been empty for ``quiet_after_s``
+    the rate is multiplied by ``decay`` every ``decay_interval_s`` down to
+    ``min_fps``.
+    """
+
+    def __init__(self, min_fps, max_fps, quiet_after_s=10.0, decay_interval_s=5.0, decay=0.5):
+        if min_fps > max_fps:
+            raise ValueError(f"min_fps {min_fps} is above max_fps {max_fps}")
+        self.min_fps = float(min_fps)
+        self.max_fps = float(max_fps)
+        self.quiet_after_s = quiet_after_s
+        self.decay_interval_s = decay_interval_s
+        self.decay = decay
+        self.fps = self.max_fps
+        self.last_active = time.monotonic()
+        self.last_decay = self.last_active
+
+    def observe(self, people, tracks, now=None):
+        now = time.monotonic() if now is None else now
+        if people or tracks:
+            self.last_active = now
+            self.fps = self.max_fps
+
+    def update(self, now=None):
+        """
+        Apply the decay due by ``now`` and return the camera's rate.
+        """
+        now = time.monotonic() if now is None else now
+        if now - self.last_active < self.quiet_after_s:
+            self.last_decay = now
+        elif now - self.last_decay >= self.decay_interval_s:
+            self.last_decay = now
+            self.fps = max(self.min_fps, self.fps * self.decay)
+        return self.fps
+
+
+class LoadBackoff:
+    """
+    Global factor on every camera's frame rate, driven by detector lag.
+
+    While the deepest frame queue reported by any detect_person worker is
+    above ``high_depth`` the factor is multiplied by ``step`` every
+    ``adjust_interval_s`` (down to ``min_factor``); once it falls below
+    ``low_depth`` it recovers the same way back to 1. Reports older than
+    ``report_timeout_s`` (a worker that went away) are ignored.
+    """
+
+    def __init__(self, high_depth=100, low_depth=20, min_factor=0.25, step=0.5, adjust_interval_s=5.0,
+                 report_timeout_s=15.0):
+        self.high_depth = high_depth
+        self.low_depth = low_depth
+        self.min_factor = min_factor
+        self.step = step
+        self.adjust_interval_s = adjust_interval_s
+        self.report_timeout_s = report_timeout_s
+        self.factor = 1.0
+        self.last_adjust = time.monotonic()
+        self._depths = {}  # worker_id -> (queue depth, reported at)
+
+    def observe(self, worker_id, queue_depth, now=None):
+        if queue_depth is None:
+            return
+        self._depths[worker_id] = (int(queue_depth), time.monotonic() if now is None else now)
+
+    def depth(self, now=None):
+        now = time.monotonic() if now is None else now
+        for worker_id, (_, reported) in list(self._depths.items()):
+            if now - reported > self.report_timeout_s:
+                del self._depths[worker_id]
+        return max((depth for depth, _ in self._depths.values()), default=None)
+
+    def update(self, now=None):
+        """
+        Adjust the factor if one is due by ``now`` and return it.
+        """
+        now = time.monotonic() if now is None else now
+        if now - self.last_adjust < self.adjust_interval_s:
+            return self.factor
+        depth = self.depth(now)
+        self.last_adjust = now
+        if depth is not None and depth > self.high_depth:
+            self.factor = max(self.min_factor, self.factor * self.step)
+        elif depth is None or depth < self.low_depth:
+            self.factor = min(1.0, self.factor / self.step)
+        return self.factor
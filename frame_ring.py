@@ -0,0 +1,169 @@
+import os
+import itertools
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+
+# Number of frames each camera's ring can hold before the oldest is overwritten
+DEFAULT_RING_SLOTS = 8
+
+_HEADER_ALIGN = 64
+_ring_counter = itertools.count()
+
+
+def _header_bytes(slots):
+    # One int64 sequence number per slot, padded to a cache line
+    return -(-slots * 8 // _HEADER_ALIGN) * _HEADER_ALIGN
+
+
+class FrameRingWriter:
+    """
+    Per-camera shared-memory ring buffer written by the framer.
+
+    Each slot is guarded by a sequence number (seqlock): it is set to -1
+    while the frame is copied in and to the frame's sequence number once the
+    copy is complete. Readers only accept a slot whose sequence number
+    matches the descriptor they received, so an overwritten or half-written
+    slot is detected instead of read.
+
+    Args:
+        camera_id: Camera the ring belongs to, used in the segment name.
+        slot_bytes (int): Capacity of one slot, usually ``frame.nbytes``.
+        slots (int): Number of slots in the ring.
+    """
+
+    def __init__(self, camera_id, slot_bytes, slots=DEFAULT_RING_SLOTS):
+        self.camera_id = camera_id
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.header_bytes = _header_bytes(slots)
+        # Unique per writer so a reader never maps a stale, resized segment
+        self.name = f"frames_{camera_id}_{os.getpid()}_{next(_ring_counter)}"
+        self.shm = shared_memory.SharedMemory(
+            name=self.name, create=True, size=self.header_bytes + slots * slot_bytes
+        )
+        self._seqs = np.ndarray((slots,), dtype=np.int64, buffer=self.shm.buf)
+        self._seqs[:] = -1
+        self.seq = 0
+
+    def fits(self, frame):
+        return frame.nbytes <= self.slot_bytes
+
+    def write(self, frame, timestamp=None):
+        """
+        Copy ``frame`` into the next slot and return its descriptor.
+
+        The descriptor is a small dict that goes over the broker in place of
+        the frame itself.
+        """
+        if not self.fits(frame):
+            raise ValueError(f"Frame of {frame.nbytes} bytes does not fit a {self.slot_bytes} byte slot")
+        slot = self.seq % self.slots
+        offset = self.header_bytes + slot * self.slot_bytes
+        self._seqs[slot] = -1
+        dst = np.ndarray(frame.shape, dtype=frame.dtype, buffer=self.shm.buf, offset=offset)
+        np.copyto(dst, frame)
+        self._seqs[slot] = self.seq
+        descriptor = {
+            "shm_name": self.name,
+            "slots": self.slots,
+            "slot_bytes": self.slot_bytes,
+            "slot": slot,
+            "seq": self.seq,
+            "shape": tuple(frame.shape),
+            "dtype": frame.dtype.str,
+            "timestamp": timestamp,
+        }
+        self.seq += 1
+        return descriptor
+
+    def close(self):
+        """
+        Release and unlink the segment. Readers holding a mapping keep it
+        valid until they close it themselves.
+        """
+        self._seqs = None
+        try:
+            self.shm.close()
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class FrameRingReader:
+    """
+    Maps framer ring buffers and returns zero-copy views of their frames.
+
+    Mappings are cached by segment name. When a camera's writer is recreated
+    (restart or resolution change) it gets a new name and the old mapping is
+    dropped.
+    """
+
+    def __init__(self):
+        self._rings = {}  # shm_name -> (SharedMemory, seqs)
+        self._by_camera = {}  # camera_id -> shm_name
+
+    def _attach(self, camera_id, descriptor):
+        name = descriptor["shm_name"]
+        ring = self._rings.get(name)
+        if ring is not None:
+            return ring
+        shm = shared_memory.SharedMemory(name=name)
+        # The writer owns the segment; don't let this process unlink it on exit
+        try:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except Exception:
+            pass
+        seqs = np.ndarray((descriptor["slots"],), dtype=np.int64, buffer=shm.buf)
+        ring = self._rings[name] = (shm, seqs)
+        old = self._by_camera.get(camera_id)
+        self._by_camera[camera_id] = name
+        if old is not None and old != name:
+            self._detach(old)
+        return ring
+
+    def _detach(self, name):
+        shm, seqs = self._rings.pop(name, (None, None))
+        del seqs  # Drop our own export of the buffer before closing
+        if shm is not None:
+            try:
+                shm.close()
+            except BufferError:
+                # A view is still alive somewhere; the mapping goes with it
+                pass
+
+    def read(self, camera_id, descriptor, copy=False):
+        """
+        Return the frame a descriptor points at, or None if it was overwritten.
+
+        With ``copy=False`` the result is a view into shared memory; call
+        ``is_current`` after using it to check it wasn't overwritten meanwhile.
+        """
+        try:
+            shm, seqs = self._attach(camera_id, descriptor)
+        except FileNotFoundError:
+            return None
+        slot, seq = descriptor["slot"], descriptor["seq"]
+        if seqs[slot] != seq:
+            return None
+        header = _header_bytes(descriptor["slots"])
+        offset = header + slot * descriptor["slot_bytes"]
+        frame = np.ndarray(descriptor["shape"], dtype=np.dtype(descriptor["dtype"]),
+                           buffer=shm.buf, offset=offset)
+        if copy:
+            frame = frame.copy()
+            if seqs[slot] != seq:
+                return None
+        return frame
+
+    def is_current(self, descriptor):
+        """
+        True if the descriptor's slot still holds the frame it describes.
+        """
+        ring = self._rings.get(descriptor["shm_name"])
+        return ring is not None and ring[1][descriptor["slot"]] == descriptor["seq"]
+
+    def close(self):
+        for name in list(self._rings):
+            self._detach(name)
+        self._by_camera.clear()
@@ -1,12 +1,26 @@
 import pika
 import time
 import cv2
-import pickle  # To serialize frames
 import struct  # To send the size of the frame
-from multiprocessing import Process, current_process
+from multiprocessing import Process, RawValue, current_process, get_context
+import queue
 import logging
 import datetime
 import threading
+import signal
+import sys
+import numpy as np
+from frame_ring import FrameRingWriter, DEFAULT_RING_SLOTS
+from frame_codec import encoding_settings, encode_frame
+from motion_gate import MotionGate, motion_gate_settings
+from rabbitmq_logger import AsyncRabbitMQLogger
+from frame_mailbox import HOSTNAME, now_ms
+from worker_sharding import SHARDED_FRAME_EXCHANGE, camera_routing_key
+from frame_rate import ACTIVITY_EXCHANGE, AdaptiveFrameRate, LoadBackoff
+from capture_pool import CaptureWorkerPool
+from wire_format import KIND_CAMERA_ACTIVITY, KIND_CAMERA_COMMAND, WireFormatError, pack_frame, unpack_message
+from metrics import REGISTRY as metrics_registry, start_metrics_server
+import os
 
 
 # # Function to send logs to RabbitMQ
@@ -27,53 +41,9 @@ import threading
 #         print(f"Failed to send log to RabbitMQ: {e}")
 
 
-class RabbitMQLogger:
-    def __init__(self, host='localhost', queue='framer_logs'):
-        self.host = host
-        self.queue = queue
-        self.connection = None
-        self.channel = None
-        self._connect()
-
-    def _connect(self):
-        try:
-            self.connection = pika.BlockingConnection(
-                pika.ConnectionParameters(host=self.host, heartbeat=600)
-            )
-            self.channel = self.connection.channel()
-            self.channel.queue_declare(queue=self.queue)
-            print("[RabbitMQ] Connection established.")
-        except Exception as e:
-            print(f"[RabbitMQ] Failed to connect: {e}")
-            self.connection = None
-            self.channel = None
-
-    def _is_connected(self):
-        return self.connection and self.connection.is_open and self.channel
-
-    def send_log(self, log_message):
-        try:
-            if not self._is_connected():
-                print("[RabbitMQ] Reconnecting...")
-                self._connect()
-
-            if self._is_connected():
-                self.channel.basic_publish(
-                    exchange='',
-                    routing_key=self.queue,
-                    body=pickle.dumps(log_message)
-                )
-            else:
-                print("[RabbitMQ] Unable to send log, connection not available.")
-        except Exception as e:
-            print(f"[RabbitMQ] Error sending log: {e}")
-            # Optionally reset the connection on error
-            self.connection = None
-            self.channel = None
-
-
-# Instantiate a single logger object to use throughout
-rabbitmq_logger = RabbitMQLogger()
+# Instantiate a single logger object to use throughout; records are shipped
+# in batches by a background thread (restarted in each camera process)
+rabbitmq_logger = AsyncRabbitMQLogger(host='localhost', queue='framer_logs')
 
 
 
@@ -120,7 +90,42 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 # Dictionary to keep track of camera processes
 camera_processes = {}
 
-def setup_rabbitmq_connection(queue_name, rabbitmq_host, retries=5, retry_delay=5):
+# Prometheus-style /metrics and /metrics.json listener (0 disables it). Camera
+# processes push snapshots of their metrics to the main process, which serves
+# them labelled by camera.
+METRICS_PORT = int(os.environ.get("FRAMER_METRICS_PORT", 9102))
+METRICS_PUSH_INTERVAL_S = 5
+# A spawn-context queue: pooled capture workers are spawned and handed it explicitly
+camera_metrics_queue = get_context("spawn").Queue(maxsize=1000)
+camera_metrics = {}  # camera_id -> latest snapshot
+
+metrics_registry.describe("stage_latency_ms", "Per-stage latency in milliseconds")
+metrics_registry.gauge_fn("camera_processes", lambda: sum(p.is_alive() for p in list(camera_processes.values())))
+
+
+def _push_camera_metrics(camera_id, registry=metrics_registry, metrics_queue=None):
+    if metrics_queue is None:
+        metrics_queue = camera_metrics_queue
+    try:
+        metrics_queue.put_nowait((camera_id, registry.snapshot()))
+    except queue.Full:
+        pass
+
+
+def collect_camera_metrics():
+    """
+    Keep the latest metrics snapshot of every camera process (runs in a thread).
+    """
+    while True:
+        camera_id, snapshot = camera_metrics_queue.get()
+        if camera_id in camera_processes:
+            camera_metrics[camera_id] = snapshot
+
+
+def camera_metric_snapshots():
+    return [(snapshot, {"camera": camera_id}) for camera_id, snapshot in list(camera_metrics.items())]
+
+def setup_rabbitmq_connection(queue_name, rabbitmq_host, retries=5, retry_delay=5, exchange_type="fanout"):
     """
     Set up a RabbitMQ connection and declare the queue.
     """
@@ -128,7 +133,7 @@ def setup_rabbitmq_connection(queue_name, rabbitmq_host, retries=5, retry_delay=
         try:
             connection = pika.BlockingConnection(pika.ConnectionParameters(host=rabbitmq_host, heartbeat=600))
             channel = connection.channel()
-            channel.exchange_declare(exchange=queue_name, exchange_type="fanout")
+            channel.exchange_declare(exchange=queue_name, exchange_type=exchange_type)
             log_info(f"Connected to RabbitMQ at {rabbitmq_host}")
             return connection, channel
         except pika.exceptions.AMQPConnectionError as e:
@@ -136,69 +141,296 @@ def setup_rabbitmq_connection(queue_name, rabbitmq_host, retries=5, retry_delay=
             time.sleep(retry_delay)
     raise log_exception(f"Could not connect to RabbitMQ after {retries} attempts")
 
-def process_video(camera_url, camera_id, user_id, objectlist, rabbitmq_host, frame_interval, retry_limit=50):
+# Frames per second published per camera unless the camera command sets TargetFps
+DEFAULT_TARGET_FPS = 3.0
+
+# Adaptive frame rate: every camera runs between its MinFps and MaxFps
+# (camera command, MaxFps defaults to TargetFps) depending on the activity
+# detect_person reports for it on ACTIVITY_EXCHANGE, times a global backoff
+# while the detector's frame queue is deep (see frame_rate). Without reports
+# for ACTIVITY_TIMEOUT_S cameras go back to TargetFps.
+ADAPTIVE_FRAME_RATE = True
+DEFAULT_MIN_FPS = 0.5
+ADAPTIVE_FPS_SETTINGS = {
+    "quiet_after_s": 10.0,     # Scene empty this long before the rate starts to fall...
+    "decay_interval_s": 5.0,   # ...then it is multiplied by decay this often
+    "decay": 0.5,
+}
+LOAD_BACKOFF_SETTINGS = {
+    "high_depth": 100,         # Back off while a detector queue holds more frames than this...
+    "low_depth": 20,           # ...and recover once it is below this
+    "min_factor": 0.25,
+    "step": 0.5,
+    "adjust_interval_s": 5.0,
+}
+ACTIVITY_TIMEOUT_S = 30
+
+
+class FrameSampler:
+    """
+    Time-based frame sampler.
+
+    Decides, per grabbed frame, whether it is due for publishing so every
+    camera publishes ``target_fps`` frames per second regardless of its own
+    frame rate. Skipped frames only need ``cap.grab()``; the decode and BGR
+    conversion of ``cap.retrieve()`` is paid for published frames only.
+    """
+
+    def __init__(self, target_fps):
+        self.target_fps = float(target_fps)
+        self.period = 1.0 / self.target_fps if self.target_fps > 0 else 0.0
+        self.next_due = None
+
+    def set_fps(self, target_fps):
+        """
+        Change the rate; the pending frame is re-timed from the last published one.
+        """
+        previous = self.period
+        self.target_fps = float(target_fps)
+        self.period = 1.0 / self.target_fps if self.target_fps > 0 else 0.0
+        if self.next_due is not None:
+            self.next_due += self.period - previous
+
+    def due(self, now):
+        """
+        Return True if a frame grabbed at monotonic time ``now`` should be published.
+        """
+        if self.next_due is None or now >= self.next_due:
+            # Keep a steady cadence, but don't burst to catch up after a stall
+            if self.next_due is None or now - self.next_due >= self.period:
+                self.next_due = now + self.period
+            else:
+                self.next_due += self.period
+            return True
+        return False
+
+
+# "fanout" publishes every frame to the all_frame exchange (single detector);
+# "sharded" routes frames by camera bucket to detect_person workers running
+# with SHARDED_MODE = True (see worker_sharding).
+FRAME_ROUTING = "fanout"
+
+# Frame transports: "inline" sends the whole frame through RabbitMQ as the
+# message payload (works across hosts), "shm" writes it to a per-camera
+# shared-memory ring and only sends a small descriptor (detect_person must
+# run on the same host). "pickle" is the old name of "inline".
+FRAME_TRANSPORTS = ("inline", "shm")
+DEFAULT_FRAME_TRANSPORT = "inline"
+
+# Capture modes: "process" runs every camera in its own OS process with its
+# own broker connection; "pool" multiplexes the cameras over CAPTURE_WORKERS
+# worker processes, each running its cameras as threads and publishing over
+# one shared connection (see capture_pool). Use the pool past a few dozen
+# cameras.
+CAPTURE_MODES = ("process", "pool")
+CAPTURE_MODE = os.environ.get("FRAMER_CAPTURE_MODE", "process")
+CAPTURE_WORKERS = int(os.environ.get("FRAMER_CAPTURE_WORKERS", os.cpu_count() or 1))
+capture_pool = None
+
+def process_video(camera_url, camera_id, user_id, objectlist, rabbitmq_host, target_fps, retry_limit=50,
+                  transport=DEFAULT_FRAME_TRANSPORT, encoding=None, fps_value=None, motion=None,
+                  publisher=None, stop_event=None, metrics=None, metrics_queue=None):
     """
     Process the video stream and send frames to RabbitMQ.
+
+    With ``transport="shm"`` frames go into a shared-memory ring buffer and
+    only their descriptor is published. The ring is recreated if the stream
+    resolution changes.
+
+    Frames are sampled at ``target_fps`` by capture time; skipped frames are
+    grabbed but never decoded. If given, ``fps_value`` (a shared double the
+    main process keeps at the camera's adaptive frame rate) overrides it.
+
+    ``encoding`` selects how frames are packed (raw, jpeg, png or downscale,
+    see frame_codec); the chosen encoding travels in the message header.
+
+    ``motion`` turns on the motion gate (see motion_gate): sampled frames
+    of a static scene are decoded and checked but not published, apart
+    from periodic keep-alive frames.
+
+    Run in its own process it opens its own broker connection and records
+    into the process-wide metrics registry. A capture pool worker (see
+    capture_pool) instead runs it in a thread with the worker's shared
+    ``publisher``, a per-camera ``metrics`` registry and a ``stop_event``
+    that ends the loop; its snapshots go to the main process over the
+    ``metrics_queue`` it is given, as a spawned worker has its own copy of
+    this module's queue.
     """
+    if transport == "pickle":
+        transport = "inline"
+    if transport not in FRAME_TRANSPORTS:
+        log_error(f"Unknown frame transport {transport!r} for camera {camera_id}, using inline")
+        transport = "inline"
+    try:
+        encoding = encoding_settings(encoding)
+    except ValueError as e:
+        log_error(f"Invalid frame encoding for camera {camera_id}: {e}, sending raw frames")
+        encoding = encoding_settings(None)
+    try:
+        motion = motion_gate_settings(motion)
+    except ValueError as e:
+        log_error(f"Invalid motion gate for camera {camera_id}: {e}, publishing every sampled frame")
+        motion = None
+    motion_gate = MotionGate(**motion) if motion else None
+    if transport == "shm" and stop_event is None:
+        # stop_camera_process terminates us; exit through finally so the ring is unlinked
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    if metrics is None:
+        # Forked from the main process: start from empty metrics
+        metrics = metrics_registry
+        metrics.clear()
+    stopped = stop_event.is_set if stop_event is not None else (lambda: False)
+    wait = stop_event.wait if stop_event is not None else time.sleep
+    last_metrics_push = time.monotonic()
     retry_count = 0
     try:
         camera_url = int(camera_url)
     except ValueError:
         camera_url = camera_url
-    while retry_count < retry_limit:
+    while retry_count < retry_limit and not stopped():
         
         cap = cv2.VideoCapture(camera_url)
 
         if not cap.isOpened():
             log_error(f"Error: Could not open video stream from {camera_url}")
             retry_count += 1
-            time.sleep(10)
+            wait(10)
             continue
 
         log_info(f"Processing video stream from {camera_id}")
-        all_frame_queue = 'all_frame'
+        if FRAME_ROUTING == "sharded":
+            # Route by camera bucket so each detect_person worker gets whole cameras
+            all_frame_queue, exchange_type = SHARDED_FRAME_EXCHANGE, "direct"
+            routing_key = camera_routing_key(camera_id)
+        else:
+            all_frame_queue, exchange_type = 'all_frame', "fanout"
+            routing_key = ""
         #queue_name_ultra = 'all_frame_ultra'
-        conn_frames, chan_frames = setup_rabbitmq_connection(all_frame_queue, rabbitmq_host)
+        if publisher is None:
+            conn_frames, chan_frames = setup_rabbitmq_connection(all_frame_queue, rabbitmq_host,
+                                                                 exchange_type=exchange_type)
+        else:
+            conn_frames = chan_frames = None
+            publisher.declare_exchange(all_frame_queue, exchange_type)
 
 
-        frame_count = 0
+        sampler = FrameSampler(target_fps if fps_value is None else fps_value.value)
+        metrics.set_gauge("camera_target_fps", sampler.target_fps)
         last_frame_time = time.time()
+        # Identifies this run of the camera; seq restarts with every run
+        stream_id = f"{HOSTNAME}-{os.getpid()}-{int(time.time() * 1000)}"
+        frame_seq = 0
+        frame_ring = None
 
         try:
-            while cap.isOpened():
-                ret, frame = cap.read()
+            while cap.isOpened() and not stopped():
+                with metrics.timer("stage_latency_ms", stage="capture"):
+                    ret = cap.grab()
+                capture_time = time.time()
+                capture_ts_ms = now_ms()
+                if time.monotonic() - last_metrics_push > METRICS_PUSH_INTERVAL_S:
+                    last_metrics_push = time.monotonic()
+                    if motion_gate is not None:
+                        metrics.set_gauge("motion_suppression_ratio", motion_gate.suppression_ratio())
+                    _push_camera_metrics(camera_id, metrics, metrics_queue)
 
                 if not ret:
-                    if time.time() - last_frame_time > 5:
+                    metrics.inc("frames_grab_failed_total")
+                    if capture_time - last_frame_time > 5:
                         log_error(f"No frame received for 5 seconds from {camera_id}, restarting...")
                         break
                     continue
 
-                last_frame_time = time.time()
+                last_frame_time = capture_time
+
+                if fps_value is not None and fps_value.value != sampler.target_fps:
+                    sampler.set_fps(fps_value.value)
+                    metrics.set_gauge("camera_target_fps", sampler.target_fps)
+                if not sampler.due(time.monotonic()):
+                    metrics.inc("frames_skipped_total")
+                    continue
 
-                frame_count += 1
-                if frame_count % frame_interval != 0:
+                # Only frames we publish are decoded
+                with metrics.timer("stage_latency_ms", stage="decode"):
+                    ret, frame = cap.retrieve()
+                if not ret:
+                    metrics.inc("frames_grab_failed_total")
                     continue
+                keepalive = False
+                if motion_gate is not None:
+                    with metrics.timer("stage_latency_ms", stage="motion"):
+                        reason = motion_gate.check(frame, time.monotonic())
+                    if reason is None:
+                        metrics.inc("frames_motion_suppressed_total")
+                        continue
+                    keepalive = reason == "keepalive"
+                    if keepalive:
+                        metrics.inc("frames_keepalive_total")
 
-                frame_count = 0
                 retry_count = 0
                 current_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
+                with metrics.timer("stage_latency_ms", stage="encode"):
+                    payload, header = encode_frame(frame, encoding)
                 frame_data = {
                     "camera_id": camera_id,
-                    "frame": frame,
+                    "frame": payload,
                     "user_id" : user_id,
                     "date_time": current_time,
+                    "capture_time": capture_time,
                     "object_list": objectlist
                 }
-                serialized_frame = pickle.dumps(frame_data)
+                if keepalive:
+                    # Published only so trackers see the static scene; no motion since the last frame
+                    frame_data["keepalive"] = True
+                # Freshness stamps, also sent as AMQP headers so the detector
+                # can drop stale or superseded frames without unpickling them
+                stamps = {
+                    "camera_id": camera_id,
+                    "seq": frame_seq,
+                    "stream": stream_id,
+                    "capture_ts_ms": capture_ts_ms,
+                    "capture_time": capture_time,
+                    "host": HOSTNAME,
+                }
+                frame_data.update(stamps)
+                frame_seq += 1
+                frame_data.update(header)
+                if transport == "shm":
+                    if not isinstance(payload, np.ndarray):
+                        payload = np.frombuffer(payload, dtype=np.uint8)
+                    if frame_ring is None or not frame_ring.fits(payload):
+                        if frame_ring is not None:
+                            frame_ring.close()
+                        frame_ring = FrameRingWriter(camera_id, max(frame.nbytes, payload.nbytes), DEFAULT_RING_SLOTS)
+                        log_info(f"Camera {camera_id}: shared-memory ring {frame_ring.name} created")
+                    frame_data["frame"] = None
+                    frame_data["transport"] = "shm"
+                    frame_data["shm"] = frame_ring.write(payload, timestamp=time.time())
+                with metrics.timer("stage_latency_ms", stage="serialize"):
+                    serialized_frame = pack_frame(frame_data)
                 print("This is current time :", current_time)
-                if not chan_frames or not chan_frames.is_open:
-                    log_error(f"Error: Could not open RabbitMQ connection for {queue_name_media}")
-                    conn_frames, chan_frames = setup_rabbitmq_connection(all_frame_queue, rabbitmq_host)
+                if publisher is None and (not chan_frames or not chan_frames.is_open):
+                    log_error(f"Error: Could not open RabbitMQ connection for {all_frame_queue}")
+                    conn_frames, chan_frames = setup_rabbitmq_connection(all_frame_queue, rabbitmq_host,
+                                                                         exchange_type=exchange_type)
               
                 # Send frame to both queues
-                chan_frames.basic_publish(exchange=all_frame_queue, routing_key="", body=serialized_frame)
+                with metrics.timer("stage_latency_ms", stage="publish"):
+                    properties = pika.BasicProperties(headers=stamps)
+                    if publisher is not None:
+                        ok, error = publisher.publish(all_frame_queue, serialized_frame, routing_key=routing_key,
+                                                      properties=properties)
+                    else:
+                        chan_frames.basic_publish(exchange=all_frame_queue, routing_key=routing_key,
+                                                  body=serialized_frame, properties=properties)
+                        ok, error = True, None
+                if not ok:
+                    log_error(f"Failed to publish a frame from camera {camera_id}: {error}")
+                    metrics.inc("frames_publish_failed_total")
+                    continue
+                metrics.inc("frames_published_total")
+                metrics.inc("frame_bytes_published_total", len(serialized_frame))
                
                 log_info(f"Sent a frame from camera {camera_id} (Process ID: {current_process().pid})")
 
@@ -206,7 +438,12 @@ def process_video(camera_url, camera_id, user_id, objectlist, rabbitmq_host, fra
             log_exception(f"An error occurred in camera {camera_id}: {e}")
         finally:
             cap.release()
-            conn_frames.close()
+            if conn_frames is not None:
+                conn_frames.close()
+            if frame_ring is not None:
+                frame_ring.close()
+            if motion_gate is not None:
+                log_info(f"Camera {camera_id}: motion gate stats {motion_gate.stats()}")
             
             log_info(f"Camera {camera_id}: Video processing complete. RabbitMQ connection closed.")
             retry_count += 1
@@ -220,16 +457,81 @@ user_ids = {}
 credit_ids = {}
 camera_status = {}
 object_list = {}
+frame_transports = {}
+frame_encodings = {}
+motion_settings = {}
+target_fps_by_camera = {}
+fps_ranges = {}    # camera_id -> (TargetFps, MinFps, MaxFps) from the camera command
+frame_rates = {}   # camera_id -> AdaptiveFrameRate
+fps_values = {}    # camera_id -> shared double the camera process samples at
+load_backoff = LoadBackoff(**LOAD_BACKOFF_SETTINGS)
+last_activity_report = None  # monotonic time of the last detect_person report
+metrics_registry.gauge_fn("frame_rate_backoff", lambda: load_backoff.factor)
+
+
+def configure_frame_rate(camera_id, target_fps, min_fps=None, max_fps=None):
+    """
+    Set up the adaptive frame rate of a camera (none if it publishes every frame).
+    """
+    max_fps = float(max_fps or target_fps)
+    if not ADAPTIVE_FRAME_RATE or max_fps <= 0:
+        frame_rates.pop(camera_id, None)
+        return
+    min_fps = float(min_fps) if min_fps else min(DEFAULT_MIN_FPS, max_fps)
+    frame_rates[camera_id] = AdaptiveFrameRate(min(min_fps, max_fps), max_fps, **ADAPTIVE_FPS_SETTINGS)
 
-def start_camera_process(camera_url, camera_id, user_id, objectlist, rabbitmq_host, frame_interval=10):
+
+def get_capture_pool(rabbitmq_host="localhost"):
+    """
+    The capture worker pool, created on first use (CAPTURE_MODE "pool").
+    """
+    global capture_pool
+    if capture_pool is None:
+        capture_pool = CaptureWorkerPool(process_video, CAPTURE_WORKERS, rabbitmq_host,
+                                         metrics_queue=camera_metrics_queue)
+        log_info(f"Capturing with a pool of {capture_pool.num_workers} worker processes")
+        for index in range(capture_pool.num_workers):
+            metrics_registry.gauge_fn("capture_worker_cameras", lambda i=index: capture_pool.stats()[i]["cameras"],
+                                      worker=str(index))
+    return capture_pool
+
+
+def start_camera_process(camera_url, camera_id, user_id, objectlist, rabbitmq_host, target_fps=DEFAULT_TARGET_FPS,
+                         transport=DEFAULT_FRAME_TRANSPORT, encoding=None, min_fps=None, max_fps=None, motion=None):
     """
     Start a separate process for each camera.
+
+    In the "pool" CAPTURE_MODE the camera is handed to the least loaded
+    capture worker instead; the returned handle behaves like the Process.
     """
-    process = Process(target=process_video, args=(camera_url, camera_id, user_id, objectlist, rabbitmq_host, frame_interval))
-    process.start()
+    if camera_id not in frame_rates or fps_ranges.get(camera_id) != (target_fps, min_fps, max_fps):
+        configure_frame_rate(camera_id, target_fps, min_fps, max_fps)
+    fps_ranges[camera_id] = (target_fps, min_fps, max_fps)
+    pooled = CAPTURE_MODE == "pool"
+    fps_value = fps_values.get(camera_id)
+    if fps_value is None:
+        # Survives restarts, so a restarted camera resumes at its current rate
+        if pooled:
+            fps_value = get_capture_pool(rabbitmq_host).fps_value(camera_id, target_fps)
+        else:
+            fps_value = RawValue("d", target_fps)
+        fps_values[camera_id] = fps_value
+    args = (camera_url, camera_id, user_id, objectlist, rabbitmq_host, target_fps)
+    kwargs = {"transport": transport, "encoding": encoding, "motion": motion}
+    if pooled:
+        # A worker's load is the frames per second its cameras may publish
+        load = max(float(max_fps or 0), float(target_fps)) or DEFAULT_TARGET_FPS
+        process = get_capture_pool(rabbitmq_host).start(camera_id, args, kwargs, load=load, fps=fps_value.value)
+    else:
+        process = Process(target=process_video, args=args, kwargs=dict(kwargs, fps_value=fps_value))
+        process.start()
     camera_processes[camera_id] = process  # Store process in the dictionary
     camera_urls[camera_id] = camera_url  # Store the camera URL for later use
     user_ids[camera_id] = user_id
+    frame_transports[camera_id] = transport
+    frame_encodings[camera_id] = encoding
+    motion_settings[camera_id] = motion
+    target_fps_by_camera[camera_id] = target_fps
     # credit_ids[camera_id] = credit_id  # Store the credit ID for later use
     return process
 
@@ -246,6 +548,9 @@ def stop_camera_process(camera_id):
         log_info(f"Camera {camera_id}: Process stopped.")
         del camera_processes[camera_id]  # Remove from dictionary
         del object_list[camera_id]
+        camera_metrics.pop(camera_id, None)
+        frame_rates.pop(camera_id, None)
+        fps_values.pop(camera_id, None)
     else:
         log_error(f"No active process found for camera {camera_id}")
 
@@ -269,12 +574,73 @@ def monitor_camera_processes(rabbitmq_host="localhost"):
                     camera_url = camera_urls[camera_id]
                     user_id = user_ids[camera_id]
                     objectlist = object_list[camera_id]
-                    start_camera_process(camera_url, camera_id, user_id, objectlist4, rabbitmq_host)
+                    transport = frame_transports.get(camera_id, DEFAULT_FRAME_TRANSPORT)
+                    encoding = frame_encodings.get(camera_id)
+                    motion = motion_settings.get(camera_id)
+                    target_fps = target_fps_by_camera.get(camera_id, DEFAULT_TARGET_FPS)
+                    _, min_fps, max_fps = fps_ranges.get(camera_id, (target_fps, None, None))
+                    start_camera_process(camera_url, camera_id, user_id, objectlist, rabbitmq_host,
+                                         target_fps=target_fps, transport=transport, encoding=encoding,
+                                         min_fps=min_fps, max_fps=max_fps, motion=motion)
                 else:
                     log_error(f"No URL found for camera {camera_id}, unable to restart.")
                     
         time.sleep(25)  # Check every 25 seconds
 
+
+def on_activity_message(ch, method, properties, body):
+    """
+    Feed a detect_person activity report to the frame rate controllers.
+    """
+    global last_activity_report
+    try:
+        report = unpack_message(body, KIND_CAMERA_ACTIVITY)
+    except WireFormatError as e:
+        log_error(f"Ignoring malformed camera activity report: {e}")
+        return
+    now = time.monotonic()
+    last_activity_report = now
+    load_backoff.observe(report.get("worker_id"), report.get("queue_depth"), now)
+    for activity in report.get("cameras", ()):
+        rate = frame_rates.get(activity.get("camera_id"))
+        if rate is not None:
+            rate.observe(activity.get("people", 0), activity.get("tracks", 0), now)
+
+
+def apply_frame_rates(now=None):
+    """
+    Publish every camera's current adaptive rate to its camera process.
+    """
+    now = time.monotonic() if now is None else now
+    factor = load_backoff.update(now)
+    fresh = last_activity_report is not None and now - last_activity_report < ACTIVITY_TIMEOUT_S
+    for camera_id, rate in list(frame_rates.items()):
+        fps_value = fps_values.get(camera_id)
+        if fps_value is None:
+            continue
+        if fresh:
+            fps_value.value = max(rate.min_fps, rate.update(now) * factor)
+        else:
+            fps_value.value = target_fps_by_camera.get(camera_id, DEFAULT_TARGET_FPS)
+
+
+def consume_camera_activity(rabbitmq_host="localhost"):
+    """
+    Adapt camera frame rates to the activity reports of detect_person (runs in a thread).
+    """
+    while True:
+        try:
+            connection, channel = setup_rabbitmq_connection(ACTIVITY_EXCHANGE, rabbitmq_host)
+            queue_name = channel.queue_declare(queue="", exclusive=True).method.queue
+            channel.queue_bind(exchange=ACTIVITY_EXCHANGE, queue=queue_name)
+            channel.basic_consume(queue=queue_name, on_message_callback=on_activity_message, auto_ack=True)
+            while channel.is_open:
+                connection.process_data_events(time_limit=1)
+                apply_frame_rates()
+        except Exception as e:
+            log_exception(f"Camera activity consumer failed: {e}")
+        time.sleep(10)
+
 def fetch_camera_data_from_queue(queue_name, camera_url_detail="camera_url_detail", rabbitmq_host="localhost"):
     """
     Fetch camera ID and RTSP URL from RabbitMQ queue and manage the camera processes.
@@ -285,7 +651,7 @@ def fetch_camera_data_from_queue(queue_name, camera_url_detail="camera_url_detai
     
     def callback(ch, method, properties, body):
         try:
-            camera_data = pickle.loads(body)
+            camera_data = unpack_message(body, KIND_CAMERA_COMMAND)
             camera_id = camera_data.get('CameraId')
             camera_url = camera_data.get('CameraUrl')
             running_status = camera_data.get('Running')   # status True or False
@@ -293,6 +659,12 @@ def fetch_camera_data_from_queue(queue_name, camera_url_detail="camera_url_detai
             print("This is Running Status :", running_status)
             user_id = camera_data.get('UserId')
             objectlist = camera_data.get("ObjectList")
+            transport = camera_data.get("Transport") or DEFAULT_FRAME_TRANSPORT
+            encoding = camera_data.get("Encoding")
+            target_fps = float(camera_data.get("TargetFps") or DEFAULT_TARGET_FPS)
+            min_fps = camera_data.get("MinFps")
+            max_fps = camera_data.get("MaxFps")
+            motion = camera_data.get("MotionGate")
             
             if running_status == "TRUE":
                 camera_status[camera_id] = True
@@ -300,7 +672,9 @@ def fetch_camera_data_from_queue(queue_name, camera_url_detail="camera_url_detai
                 # Start process if not already running
                 if camera_id not in camera_processes or not camera_processes[camera_id].is_alive():
                     log_info(f"Starting camera process for {camera_id}.")
-                    start_camera_process(camera_url, camera_id, user_id, objectlist, rabbitmq_host)
+                    start_camera_process(camera_url, camera_id, user_id, objectlist, rabbitmq_host,
+                                         target_fps=target_fps, transport=transport, encoding=encoding,
+                                         min_fps=min_fps, max_fps=max_fps, motion=motion)
             else:
                 # Set status to False and stop process if running
                 camera_status[camera_id] = False
@@ -317,9 +691,20 @@ def fetch_camera_data_from_queue(queue_name, camera_url_detail="camera_url_detai
     channel.start_consuming()
 
 if __name__ == "__main__":
+    if CAPTURE_MODE not in CAPTURE_MODES:
+        log_error(f"Unknown capture mode {CAPTURE_MODE!r}, expected one of {CAPTURE_MODES}; using process")
+        CAPTURE_MODE = "process"
     # Start the monitor thread
     monitor_thread = threading.Thread(target=monitor_camera_processes, daemon=True)
     monitor_thread.start()
+    threading.Thread(target=collect_camera_metrics, daemon=True).start()
+    if ADAPTIVE_FRAME_RATE:
+        threading.Thread(target=consume_camera_activity, daemon=True).start()
+    start_metrics_server(METRICS_PORT, extra_snapshots=camera_metric_snapshots)
     
     # Fetch camera ID and RTSP URL from RabbitMQ queue 'details'
-    fetch_camera_data_from_queue(queue_name="rtspurl_for_framer")
\ No newline at end of file
+    try:
+        fetch_camera_data_from_queue(queue_name="rtspurl_for_framer")
+    finally:
+        if capture_pool is not None:
+            capture_pool.close()
\ No newline at end of file
@@ -0,0 +1,391 @@
+import json
+import os
+import re
+import shutil
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from wire_format import KIND_GALLERY_RECORD, WireFormatError, pack, unpack
+
+# Layout of a gallery store directory:
+#
+#   CURRENT              name of the latest complete snapshot
+#   snapshot-00000007/   ids.npy, vectors.npy, last_seen.npy, camera_index.npy, meta.json
+#   log-00000007.bin     gallery changes made after snapshot 7 was captured
+#   log-00000008.bin     changes after snapshot 8 was captured; while that
+#                        snapshot is still being written CURRENT names 7
+#
+# Restoring memory-maps the current snapshot's arrays (copy-on-write) and
+# replays every log from its generation on, oldest first. Each log record
+# is a KIND_GALLERY_RECORD wire format message framed by its length and
+# CRC32, so a record torn by a crash is detected and cut off.
+SNAPSHOT_FORMAT = 1
+_RECORD = struct.Struct("<II")
+_GENERATION = re.compile(r"^(snapshot|log)-(\d{8})(\.bin)?$")
+
+
+def _fsync_dir(path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        # Directories can't be opened (and needn't be synced) on Windows
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _write_file(path, write):
+    with open(path, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class GalleryStore:
+    """
+    Crash-safe persistence for a ReIDGallery.
+
+    Full snapshots of the embedding matrix, identity ids, last-seen times
+    and next_id are written every ``snapshot_interval_s`` from a background
+    thread; every change in between (new identities, prototype updates,
+    sightings and removals) is appended to a log as it happens
+    (the store is the gallery's ``journal``). A restarted worker maps the
+    snapshot instead of reading it, so even a large gallery is back in
+    milliseconds, then replays the short log on top.
+
+    Args:
+        directory (str): Where snapshots and logs live. One directory per
+            gallery: two workers must not share one.
+        snapshot_interval_s (float): maybe_snapshot() takes a snapshot when
+            the last one is older than this.
+        fsync_interval_s (float): Log records are written to the OS as they
+            happen, so a process crash loses none; they are fsynced at most
+            this long apart, which bounds what a host crash can lose.
+    """
+
+    def __init__(self, directory, snapshot_interval_s=300, fsync_interval_s=1.0):
+        self.directory = directory
+        self.snapshot_interval_s = snapshot_interval_s
+        self.fsync_interval_s = fsync_interval_s
+        self.gallery = None
+        self.generation = 0       # Generation of the snapshot CURRENT names
+        self._log = None
+        self._log_generation = 0  # Generation of the log being appended to
+        self._last_snapshot = time.monotonic()
+        self._last_fsync = time.monotonic()
+        self._writer = None
+        self.last_error = None
+        self.counters = {
+            "snapshots": 0,
+            "snapshot_failures": 0,
+            "log_records": 0,
+            "log_bytes": 0,
+            "replayed_records": 0,
+            "torn_logs": 0,
+        }
+        self.last_snapshot_seconds = 0.0
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _generations(self, kind):
+        found = []
+        for name in os.listdir(self.directory):
+            match = _GENERATION.match(name)
+            if match and match.group(1) == kind:
+                found.append(int(match.group(2)))
+        return sorted(found)
+
+    # ------------- Restore ---------------
+    def restore(self, gallery):
+        """
+        Load the current snapshot and the logs after it into ``gallery``,
+        then journal its changes from here on.
+
+        Returns:
+            int: Number of identities restored.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        try:
+            with open(self._path("CURRENT")) as f:
+                self.generation = int(f.read().strip().rsplit("-", 1)[1])
+        except FileNotFoundError:
+            self.generation = 0
+        if self.generation:
+            self._load_snapshot(gallery, self.generation)
+        logs = [g for g in self._generations("log") if g >= self.generation]
+        for generation in logs:
+            self._replay(gallery, self._path(f"log-{generation:08d}.bin"))
+        self.attach(gallery, logs[-1] if logs else self.generation)
+        return len(gallery)
+
+    def _load_snapshot(self, gallery, generation):
+        path = self._path(f"snapshot-{generation:08d}")
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        if meta.get("format") != SNAPSHOT_FORMAT:
+            raise ValueError(f"Unsupported gallery snapshot format {meta.get('format')!r} in {path}")
+        # "c": mapped copy-on-write, pages are read on first use and writes stay private
+        ids = np.load(os.path.join(path, "ids.npy"), mmap_mode="c")
+        vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="c")
+        last_seen = np.load(os.path.join(path, "last_seen.npy"))
+        cameras = None
+        if os.path.exists(os.path.join(path, "camera_index.npy")):
+            names = meta["cameras"]
+            cameras = [names[i] if i >= 0 else None for i in np.load(os.path.join(path, "camera_index.npy")).tolist()]
+        gallery.restore_state(ids, vectors, last_seen, meta["next_id"], meta["dim"], meta.get("counters"), cameras)
+
+    @staticmethod
+    def _read_log(path):
+        """
+        Parse a log up to its first torn or corrupt record.
+
+        Returns:
+            (records, end, size): ``(meta, vectors)`` per intact record, the
+            offset just after the last one and the file size.
+        """
+        with open(path, "rb") as f:
+            data = f.read()
+        records = []
+        offset = 0
+        while offset + _RECORD.size <= len(data):
+            length, crc = _RECORD.unpack_from(data, offset)
+            start = offset + _RECORD.size
+            body = data[start:start + length]
+            if len(body) < length or zlib.crc32(body) != crc:
+                break
+            try:
+                _, meta, vectors = unpack(body, KIND_GALLERY_RECORD)
+            except WireFormatError:
+                break
+            records.append((meta, vectors))
+            offset = start + length
+        return records, offset, len(data)
+
+    def _replay(self, gallery, path):
+        records, offset, size = self._read_log(path)
+        for meta, vectors in records:
+            gallery.apply_record(meta["op"], meta["ids"], vectors, meta.get("now"), meta.get("next_id"),
+                                 meta.get("camera_id"))
+            self.counters["replayed_records"] += 1
+        if offset < size:
+            # Torn tail from a crash mid-write: cut it so appends stay readable
+            self.counters["torn_logs"] += 1
+            with open(path, "r+b") as f:
+                f.truncate(offset)
+
+    def _highest_id(self):
+        """
+        Highest identity id (or next_id - 1) any snapshot or log mentions, -1 if none.
+        """
+        highest = -1
+        for generation in self._generations("snapshot"):
+            path = self._path(f"snapshot-{generation:08d}")
+            try:
+                with open(os.path.join(path, "meta.json")) as f:
+                    highest = max(highest, int(json.load(f)["next_id"]) - 1)
+            except (OSError, ValueError, KeyError):
+                pass
+            try:
+                ids = np.load(os.path.join(path, "ids.npy"), mmap_mode="r")
+                if len(ids):
+                    highest = max(highest, int(ids.max()))
+            except (OSError, ValueError):
+                pass
+        for generation in self._generations("log"):
+            try:
+                records, _, _ = self._read_log(self._path(f"log-{generation:08d}.bin"))
+            except OSError:
+                continue
+            for meta, _ in records:
+                highest = max([highest] + [int(pid) for pid in meta["ids"]])
+                if meta.get("next_id") is not None:
+                    highest = max(highest, int(meta["next_id"]) - 1)
+        return highest
+
+    def start_fresh(self, gallery):
+        """
+        Start a new generation for ``gallery`` when the stored state can't
+        be restored, without ever reissuing an id: ``next_id`` is raised
+        above every id the store's snapshots and logs mention. A snapshot
+        of ``gallery`` is written right away, so a restart uses it instead
+        of the unreadable files (which it then removes).
+
+        Returns:
+            int: The gallery's next_id.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        gallery.next_id = max(gallery.next_id, self._highest_id() + 1)
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+        self.gallery = gallery
+        gallery.journal = self
+        self._log_generation = max(self._generations("snapshot") + self._generations("log") + [self.generation])
+        self.snapshot(wait=True)
+        return gallery.next_id
+
+    # ------------- Journal ---------------
+    def attach(self, gallery, log_generation=None):
+        """
+        Journal ``gallery``'s changes into this store.
+        """
+        self.gallery = gallery
+        gallery.journal = self
+        self._open_log(self.generation if log_generation is None else log_generation)
+
+    def _open_log(self, generation):
+        if self._log is not None:
+            self._sync_log()
+            self._log.close()
+        self._log = open(self._path(f"log-{generation:08d}.bin"), "ab")
+        self._log_generation = generation
+        _fsync_dir(self.directory)
+
+    def _sync_log(self):
+        self._log.flush()
+        os.fsync(self._log.fileno())
+        self._last_fsync = time.monotonic()
+
+    def record(self, op, ids, vectors=None, now=None, next_id=None, camera_id=None):
+        """
+        Append one gallery change to the log (called by ReIDGallery).
+        """
+        meta = {"op": op, "ids": [int(pid) for pid in ids], "now": now, "next_id": next_id, "camera_id": camera_id}
+        payload = None if vectors is None else np.asarray(vectors, dtype=np.float32)
+        body = pack(KIND_GALLERY_RECORD, meta, payload)
+        self._log.write(_RECORD.pack(len(body), zlib.crc32(body)) + body)
+        self._log.flush()
+        self.counters["log_records"] += 1
+        self.counters["log_bytes"] += _RECORD.size + len(body)
+        if time.monotonic() - self._last_fsync >= self.fsync_interval_s:
+            self._sync_log()
+
+    # ------------- Snapshots ---------------
+    def maybe_snapshot(self):
+        """
+        Take a snapshot if the last one is older than snapshot_interval_s.
+        """
+        if self.gallery is not None and time.monotonic() - self._last_snapshot >= self.snapshot_interval_s:
+            self.snapshot()
+
+    def snapshot(self, wait=False):
+        """
+        Capture the gallery and write it as the next snapshot.
+
+        The capture copies the arrays and starts a new log; the files are
+        written and CURRENT switched over in a background thread. Until the
+        switch a restart uses the previous snapshot plus both logs, so no
+        change is lost whenever the process dies.
+
+        Returns:
+            bool: False if the previous snapshot is still being written
+            (and ``wait`` is False).
+        """
+        if self._writer is not None and self._writer.is_alive():
+            if not wait:
+                return False
+            self._writer.join()
+        self._last_snapshot = time.monotonic()
+        state = self.gallery.export_state()
+        generation = self._log_generation + 1
+        self._open_log(generation)
+        self._writer = threading.Thread(target=self._write_snapshot, args=(generation, state),
+                                        name="gallery-snapshot", daemon=True)
+        self._writer.start()
+        if wait:
+            self._writer.join()
+        return True
+
+    def _write_snapshot(self, generation, state):
+        name = f"snapshot-{generation:08d}"
+        tmp = self._path(name + ".tmp")
+        start = time.perf_counter()
+        try:
+            shutil.rmtree(tmp, ignore_errors=True)
+            os.makedirs(tmp)
+            for key in ("ids", "vectors", "last_seen"):
+                _write_file(os.path.join(tmp, key + ".npy"), lambda f: np.save(f, state[key]))
+            # Last camera per identity as indexes into meta["cameras"] (-1 unknown)
+            names = sorted({camera for camera in state.get("cameras", ()) if camera is not None})
+            index_of = {camera: i for i, camera in enumerate(names)}
+            camera_index = np.array([index_of.get(camera, -1) for camera in state.get("cameras", ())], dtype=np.int32)
+            _write_file(os.path.join(tmp, "camera_index.npy"), lambda f: np.save(f, camera_index))
+            meta = {
+                "format": SNAPSHOT_FORMAT,
+                "generation": generation,
+                "size": len(state["ids"]),
+                "dim": state["dim"],
+                "next_id": state["next_id"],
+                "counters": state["counters"],
+                "cameras": names,
+                "created_at": time.time(),
+            }
+            _write_file(os.path.join(tmp, "meta.json"), lambda f: f.write(json.dumps(meta).encode("utf-8")))
+            os.replace(tmp, self._path(name))
+            _fsync_dir(self.directory)
+            _write_file(self._path("CURRENT.tmp"), lambda f: f.write(name.encode("utf-8")))
+            os.replace(self._path("CURRENT.tmp"), self._path("CURRENT"))
+            _fsync_dir(self.directory)
+        except Exception as e:
+            self.counters["snapshot_failures"] += 1
+            self.last_error = f"{type(e).__name__}: {e}"
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        self.generation = generation
+        self.counters["snapshots"] += 1
+        self.last_snapshot_seconds = time.perf_counter() - start
+        self._cleanup(generation)
+
+    def _cleanup(self, generation):
+        """
+        Remove snapshots and logs the current snapshot supersedes.
+        """
+        for name in os.listdir(self.directory):
+            # Snapshots a crash interrupted mid-write
+            if name.endswith(".tmp") and name.startswith("snapshot-") and name != f"snapshot-{generation:08d}.tmp":
+                shutil.rmtree(self._path(name), ignore_errors=True)
+        for kind in ("snapshot", "log"):
+            for old in self._generations(kind):
+                if old >= generation:
+                    continue
+                path = self._path(f"{kind}-{old:08d}" + (".bin" if kind == "log" else ""))
+                try:
+                    if kind == "snapshot":
+                        # A restored gallery may still map these files; on
+                        # POSIX the mapping outlives the unlink
+                        shutil.rmtree(path)
+                    else:
+                        os.remove(path)
+                except OSError:
+                    # Still mapped on Windows; retried after the next snapshot
+                    pass
+
+    def close(self, snapshot=True):
+        """
+        Optionally take a final snapshot, then flush and close the log.
+        """
+        if self.gallery is None:
+            return
+        if snapshot:
+            self.snapshot(wait=True)
+        elif self._writer is not None:
+            self._writer.join()
+        self._sync_log()
+        self._log.close()
+        self._log = None
+        self.gallery.journal = None
+        self.gallery = None
+
+    def stats(self):
+        stats = dict(self.counters)
+        stats["generation"] = self.generation
+        stats["last_snapshot_seconds"] = round(self.last_snapshot_seconds, 3)
+        stats["last_error"] = self.last_error
+        return stats
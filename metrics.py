@@ -0,0 +1,220 @@
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Latency histogram buckets (milliseconds)
+DEFAULT_BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+class MetricsRegistry:
+    """
+    In-process counters, gauges and fixed-bucket histograms.
+
+    Recording is a dict lookup, a bisect and a few additions under one
+    lock, so instrumenting every frame stage costs microseconds. Metrics
+    are identified by name plus keyword labels; ``render_prometheus``
+    turns one or more snapshots into the Prometheus text format.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._gauge_fns = {}
+        self._counter_fns = {}
+        self._help = {}
+
+    def _after_fork(self):
+        # A lock held by another thread at fork time would never be released
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def inc(self, name, value=1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    def gauge_fn(self, name, fn, **labels):
+        """
+        Register a gauge read from ``fn()`` at scrape time.
+        """
+        self._gauge_fns[_key(name, labels)] = fn
+
+    def counter_fn(self, name, fn, **labels):
+        """
+        Register a counter read from ``fn()`` at scrape time (e.g. an
+        existing ``counters`` dict entry).
+        """
+        self._counter_fns[_key(name, labels)] = fn
+
+    def observe(self, name, value, **labels):
+        key = _key(name, labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """
+        Observe the duration of the ``with`` block in milliseconds.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, (time.perf_counter() - start) * 1e3, **labels)
+
+    def snapshot(self):
+        """
+        Picklable copy of every metric, for rendering or shipping to a parent process.
+        """
+        gauges = _read_fns(self._gauge_fns)
+        counters = _read_fns(self._counter_fns)
+        with self._lock:
+            gauges.update(self._gauges)
+            counters.update(self._counters)
+            return {
+                "buckets": self.buckets,
+                "counters": counters,
+                "gauges": gauges,
+                "histograms": {k: (list(v[0]), v[1], v[2]) for k, v in self._histograms.items()},
+                "help": dict(self._help),
+            }
+
+
+def _read_fns(fns):
+    values = {}
+    for key, fn in list(fns.items()):
+        try:
+            values[key] = fn()
+        except Exception:
+            continue
+    return values
+
+
+def _labels_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{str(v)}"' for k, v in labels) + "}"
+
+
+def render_prometheus(snapshots):
+    """
+    Render ``[(snapshot, extra_labels), ...]`` in the Prometheus text format.
+    """
+    series = {}
+    help_text = {}
+    for snapshot, extra in snapshots:
+        extra = tuple(sorted(extra.items()))
+        help_text.update(snapshot["help"])
+        for kind in ("counters", "gauges"):
+            metric_type = "counter" if kind == "counters" else "gauge"
+            for (name, labels), value in snapshot[kind].items():
+                series.setdefault((name, metric_type), []).append(
+                    f"{name}{_labels_text(labels + extra)} {value}")
+        for (name, labels), (counts, total, count) in snapshot["histograms"].items():
+            lines = series.setdefault((name, "histogram"), [])
+            labels = labels + extra
+            cumulative = 0
+            for bound, bucket_count in zip(list(snapshot["buckets"]) + ["+Inf"], counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_labels_text(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels_text(labels)} {total}")
+            lines.append(f"{name}_count{_labels_text(labels)} {count}")
+    out = []
+    for (name, metric_type), lines in sorted(series.items()):
+        if name in help_text:
+            out.append(f"# HELP {name} {help_text[name]}")
+        out.append(f"# TYPE {name} {metric_type}")
+        out.extend(lines)
+    return "\n".join(out) + "\n"
+
+
+def snapshot_to_json(snapshots):
+    """
+    JSON-friendly view of ``[(snapshot, extra_labels), ...]``.
+    """
+    out = []
+    for snapshot, extra in snapshots:
+        for kind in ("counters", "gauges"):
+            for (name, labels), value in snapshot[kind].items():
+                out.append({"name": name, "type": kind[:-1], "labels": {**dict(labels), **extra}, "value": value})
+        for (name, labels), (counts, total, count) in snapshot["histograms"].items():
+            out.append({"name": name, "type": "histogram", "labels": {**dict(labels), **extra},
+                        "buckets": list(snapshot["buckets"]), "counts": counts, "sum": total, "count": count})
+    return out
+
+
+REGISTRY = MetricsRegistry()
+os.register_at_fork(after_in_child=REGISTRY._after_fork)
+
+
+def start_metrics_server(port, host="0.0.0.0", registry=REGISTRY, extra_snapshots=None):
+    """
+    Serve ``/metrics`` (Prometheus text) and ``/metrics.json`` from a daemon thread.
+
+    Args:
+        port (int): TCP port, 0 or None to disable.
+        extra_snapshots: Optional callable returning more
+            ``[(snapshot, extra_labels), ...]``, e.g. from child processes.
+    """
+    if not port:
+        return None
+
+    def collect():
+        snapshots = [(registry.snapshot(), {})]
+        if extra_snapshots is not None:
+            snapshots.extend(extra_snapshots())
+        return snapshots
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split("?")[0]
+            if path == "/metrics":
+                body, content_type = render_prometheus(collect()).encode(), "text/plain; version=0.0.4"
+            elif path == "/metrics.json":
+                body, content_type = json.dumps(snapshot_to_json(collect())).encode(), "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
@@ -0,0 +1,126 @@
+import json
+import os
+import threading
+import time
+
+from metrics import REGISTRY as metrics_registry
+
+# Optional JSON file with one section of settings per model, e.g.
+#   {"reid": {"weights": "/models/market_bot_R50-ibn.pth", "device": "cpu"},
+#    "detector": {"weights": "/models/yolov10s.pt", "warmup_batches": 2}}
+# Environment variables named <MODEL>_<SETTING> (REID_WEIGHTS,
+# DETECTOR_DEVICE, ...) override both the file and the defaults.
+MODELS_CONFIG_PATH = os.environ.get("MODELS_CONFIG")
+
+
+def _coerce(value, default):
+    """
+    Convert an environment string to the type of the setting's default.
+    """
+    if isinstance(default, bool):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    if isinstance(default, int):
+        return int(value)
+    if isinstance(default, float):
+        return float(value)
+    return value or None
+
+
+def load_models_config(path=MODELS_CONFIG_PATH):
+    if not path:
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+class ModelRegistry:
+    """
+    Named models loaded on first use (``get``) or up front (``load_all``).
+
+    Each model is registered with a ``loader(settings)`` that builds it, an
+    optional ``warmup(model, settings)`` that runs dummy batches through it
+    so the first real frame doesn't pay for lazy initialisation, and its
+    default settings. Load and warm-up times are kept in ``timings()`` and
+    exported as the ``model_load_seconds`` / ``model_warmup_seconds`` gauges.
+    """
+
+    def __init__(self, config=None):
+        self._config = config
+        self._specs = {}
+        self._models = {}
+        self._timings = {}
+        self._lock = threading.RLock()
+
+    def register(self, name, loader, warmup=None, defaults=None):
+        self._specs[name] = (loader, warmup, dict(defaults or {}))
+
+    def __contains__(self, name):
+        return name in self._specs
+
+    def is_loaded(self, name):
+        return name in self._models
+
+    def settings(self, name):
+        """
+        Defaults, overlaid with the config file section, overlaid with the environment.
+        """
+        if self._config is None:
+            self._config = load_models_config()
+        _, _, defaults = self._specs[name]
+        settings = dict(defaults)
+        settings.update(self._config.get(name, {}))
+        for key, default in defaults.items():
+            value = os.environ.get(f"{name.upper()}_{key.upper()}")
+            if value is not None:
+                settings[key] = _coerce(value, default)
+        return settings
+
+    def get(self, name):
+        model = self._models.get(name)
+        if model is None:
+            with self._lock:
+                model = self._models.get(name)
+                if model is None:
+                    model = self._load(name)
+        return model
+
+    def _load(self, name):
+        loader, warmup, _ = self._specs[name]
+        settings = self.settings(name)
+        start = time.perf_counter()
+        model = loader(settings)
+        load_s = time.perf_counter() - start
+        warmup_s = 0.0
+        if warmup is not None and settings.get("warmup_batches", 0) > 0:
+            start = time.perf_counter()
+            warmup(model, settings)
+            warmup_s = time.perf_counter() - start
+        self._models[name] = model
+        self._timings[name] = {"load_s": load_s, "warmup_s": warmup_s}
+        metrics_registry.set_gauge("model_load_seconds", load_s, model=name)
+        metrics_registry.set_gauge("model_warmup_seconds", warmup_s, model=name)
+        return model
+
+    def load_all(self, names=None):
+        """
+        Load and warm up ``names`` (default: every registered model).
+
+        Returns:
+            dict: name -> {"load_s": ..., "warmup_s": ...}
+        """
+        for name in names or list(self._specs):
+            self.get(name)
+        return self.timings()
+
+    def unload(self, name):
+        with self._lock:
+            self._models.pop(name, None)
+            self._timings.pop(name, None)
+
+    def timings(self):
+        return {name: dict(timing) for name, timing in self._timings.items()}
+
+
+MODELS = ModelRegistry()
+metrics_registry.describe("model_load_seconds", "Time spent loading each model")
+metrics_registry.describe("model_warmup_seconds", "Time spent warming up each model with dummy batches")
@@ -0,0 +1,131 @@
+import time
+
+import cv2
+import numpy as np
+
+# Per-camera motion gate methods:
+#   diff - absolute difference with the previous sampled frame
+#   mog2 - OpenCV's MOG2 background subtractor (handles swaying trees,
+#          flicker and slow light changes better, costs a little more)
+MOTION_METHODS = ("diff", "mog2")
+
+DEFAULT_MOTION_GATE = {
+    "method": "diff",
+    "width": 160,             # Motion is measured on a grayscale copy this wide
+    "pixel_threshold": 25,    # diff: grey-level change that counts a pixel as changed
+    "history": 200,           # mog2: frames in the background model
+    "min_changed": 0.005,     # Fraction of changed pixels that counts as motion
+    "hold_s": 5.0,            # Keep publishing this long after the last motion
+    "keepalive_s": 10.0,      # Publish at least one frame this often without motion
+}
+
+
+def motion_gate_settings(motion):
+    """
+    Normalise a per-camera motion gate setting into a full settings dict.
+
+    Accepts None or False (no gate), True, a method name ("mog2") or a
+    partial dict ({"method": "diff", "min_changed": 0.01}).
+
+    Returns:
+        dict or None: None when the gate is off.
+    """
+    if motion is None or motion is False:
+        return None
+    settings = dict(DEFAULT_MOTION_GATE)
+    if isinstance(motion, str):
+        settings["method"] = motion
+    elif isinstance(motion, dict):
+        settings.update({k: v for k, v in motion.items() if v is not None})
+    settings["method"] = str(settings["method"]).lower()
+    if settings["method"] not in MOTION_METHODS:
+        raise ValueError(f"Unknown motion gate method {settings['method']!r}, expected one of {MOTION_METHODS}")
+    return settings
+
+
+class MotionGate:
+    """
+    Decide per sampled frame whether the scene changed enough to publish it.
+
+    Each frame is shrunk to a ``width``-pixel grayscale copy (about 1.5 ms
+    for a 720p frame) and compared with the previous one or a background model;
+    frames where less than ``min_changed`` of the pixels changed are
+    suppressed, saving their encode, publish and detector pass. Frames keep
+    flowing for ``hold_s`` after the last motion, so a person who stops
+    moving is still tracked for a while, and one keep-alive frame goes out
+    every ``keepalive_s`` so trackers see the scene empty and age their
+    tracks out.
+
+    Takes the keys of DEFAULT_MOTION_GATE as arguments.
+    """
+
+    def __init__(self, method="diff", width=160, pixel_threshold=25, history=200, min_changed=0.005, hold_s=5.0,
+                 keepalive_s=10.0):
+        if method not in MOTION_METHODS:
+            raise ValueError(f"Unknown motion gate method {method!r}, expected one of {MOTION_METHODS}")
+        self.method = method
+        self.width = width
+        self.pixel_threshold = pixel_threshold
+        self.min_changed = min_changed
+        self.hold_s = hold_s
+        self.keepalive_s = keepalive_s
+        self._reference = None
+        self._subtractor = None
+        if method == "mog2":
+            self._subtractor = cv2.createBackgroundSubtractorMOG2(history=history, detectShadows=False)
+        self.last_motion = None
+        self.last_published = None
+        self.counters = {"checked": 0, "motion": 0, "hold": 0, "keepalive": 0, "suppressed": 0}
+
+    def _small(self, frame):
+        height, width = frame.shape[:2]
+        size = (self.width, max(1, int(round(height * self.width / float(width)))))
+        small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        # Blur away sensor noise and compression artefacts
+        return cv2.GaussianBlur(small, (5, 5), 0)
+
+    def changed_fraction(self, frame):
+        """
+        Fraction of the downscaled frame's pixels that changed.
+        """
+        small = self._small(frame)
+        if self._subtractor is not None:
+            return np.count_nonzero(self._subtractor.apply(small)) / float(small.size)
+        reference, self._reference = self._reference, small
+        if reference is None or reference.shape != small.shape:
+            return 1.0
+        return np.count_nonzero(cv2.absdiff(small, reference) > self.pixel_threshold) / float(small.size)
+
+    def check(self, frame, now=None):
+        """
+        Check one sampled frame.
+
+        Returns:
+            str or None: Why the frame should be published ("motion", "hold"
+            or "keepalive"), or None to suppress it.
+        """
+        now = time.monotonic() if now is None else now
+        self.counters["checked"] += 1
+        if self.changed_fraction(frame) >= self.min_changed:
+            self.last_motion = now
+            reason = "motion"
+        elif self.last_motion is not None and now - self.last_motion < self.hold_s:
+            reason = "hold"
+        elif self.last_published is None or now - self.last_published >= self.keepalive_s:
+            reason = "keepalive"
+        else:
+            self.counters["suppressed"] += 1
+            return None
+        self.counters[reason] += 1
+        self.last_published = now
+        return reason
+
+    def suppression_ratio(self):
+        return self.counters["suppressed"] / float(max(self.counters["checked"], 1))
+
+    def stats(self):
+        stats = dict(self.counters)
+        stats["suppression_ratio"] = round(self.suppression_ratio(), 4)
+        return stats
@@ -0,0 +1,182 @@
+import atexit
+import os
+import threading
+import time
+from collections import deque
+from multiprocessing.util import Finalize
+
+from rabbitmq_publisher import RabbitMQPublisher
+from wire_format import KIND_LOG, pack_message
+
+# What to do when the in-memory log queue fills up:
+#   drop_oldest - make room by discarding the oldest queued record
+#   sample_info - above the high watermark keep only every Nth INFO record,
+#                 and drop the oldest record once completely full
+OVERFLOW_POLICIES = ("drop_oldest", "sample_info")
+
+
+class AsyncRabbitMQLogger:
+    """
+    Ships log records to a RabbitMQ queue off the caller's thread.
+
+    ``send_log`` only appends to a bounded in-memory queue. A daemon thread
+    drains it in batches over one persistent connection, so logging costs
+    the hot path a deque append instead of a broker round trip. Pending
+    records are flushed on interpreter exit.
+
+    After a fork (framer camera processes, capture pool workers) the child
+    gets its own queue, worker thread and connection before any of its
+    threads can log.
+
+    Args:
+        host (str): RabbitMQ host.
+        queue (str): Queue the records are published to.
+        capacity (int): Max records held in memory.
+        batch_size (int): Max records published per drain.
+        flush_interval (float): Max seconds a record waits before shipping.
+        overflow_policy (str): One of OVERFLOW_POLICIES.
+        high_watermark (float): Queue fill ratio that counts as pressure.
+        info_sample_rate (int): Under pressure keep 1 of this many INFO records.
+    """
+
+    def __init__(self, host='localhost', queue='anpr_logs', capacity=10000, batch_size=200,
+                 flush_interval=0.5, overflow_policy="sample_info", high_watermark=0.8,
+                 info_sample_rate=10):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy {overflow_policy!r}, expected one of {OVERFLOW_POLICIES}")
+        self.host = host
+        self.queue = queue
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow_policy = overflow_policy
+        self.high_watermark = int(capacity * high_watermark)
+        self.info_sample_rate = max(1, int(info_sample_rate))
+        self.counters = {"queued": 0, "sent": 0, "dropped": 0, "sampled_out": 0, "failed": 0}
+        self._pid = None
+        self._info_seen = 0
+        self._start()
+        atexit.register(self.close)
+        if hasattr(os, "register_at_fork"):
+            # Runs in the forking thread before the child has other threads,
+            # so concurrent first log calls can't each start a worker
+            os.register_at_fork(after_in_child=self._restart_after_fork)
+
+    def _start(self):
+        self._pid = os.getpid()
+        self._records = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._publisher = RabbitMQPublisher(host=self.host, heartbeat=600, confirm=False, retries=1)
+        self._queue_declared = False
+        self._inflight = 0
+        self._failing = False
+        self._thread = threading.Thread(target=self._run, name="rabbitmq-logger", daemon=True)
+        self._thread.start()
+
+    def _restart_after_fork(self):
+        self._start()
+        # multiprocessing children leave through os._exit and skip atexit
+        Finalize(self, self.close, exitpriority=10)
+
+    def send_log(self, log_message):
+        """
+        Queue a log record (a dict with at least "log_level") for shipping.
+        """
+        if self._pid != os.getpid():
+            self._restart_after_fork()
+        level = log_message.get("log_level", "INFO") if isinstance(log_message, dict) else "INFO"
+        with self._cond:
+            if self._closed:
+                return
+            size = len(self._records)
+            if self.overflow_policy == "sample_info" and level == "INFO" and size >= self.high_watermark:
+                self._info_seen += 1
+                if self._info_seen % self.info_sample_rate:
+                    self.counters["sampled_out"] += 1
+                    return
+            if size >= self.capacity:
+                self._records.popleft()
+                self.counters["dropped"] += 1
+            self._records.append(log_message)
+            self.counters["queued"] += 1
+            if len(self._records) >= self.batch_size:
+                self._cond.notify()
+
+    def _take_batch(self):
+        with self._cond:
+            if not self._records and not self._closed:
+                self._cond.wait(self.flush_interval)
+            count = min(self.batch_size, len(self._records))
+            self._inflight = count
+            return [self._records.popleft() for _ in range(count)]
+
+    def _ship(self, batch):
+        try:
+            if not self._queue_declared:
+                self._publisher.declare_queue(self.queue)
+                self._queue_declared = True
+            outcomes = self._publisher.publish_batch('', [pack_message(KIND_LOG, r) for r in batch], routing_key=self.queue)
+        except Exception as e:
+            outcomes = [(False, str(e))] * len(batch)
+        failed = [record for record, (ok, _) in zip(batch, outcomes) if not ok]
+        self.counters["sent"] += len(batch) - len(failed)
+        return failed
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                if self._closed:
+                    return
+                continue
+            failed = self._ship(batch)
+            with self._cond:
+                self._inflight = 0
+            if not failed:
+                self._failing = False
+                continue
+            with self._cond:
+                if self._closed:
+                    self.counters["failed"] += len(failed)
+                    return
+                # Put the batch back for the next attempt if there is room
+                room = self.capacity - len(self._records)
+                self.counters["failed"] += max(0, len(failed) - room)
+                self._records.extendleft(reversed(failed[:room]))
+            if not self._failing:
+                print(f"[RabbitMQ] Failed to ship {len(failed)} log records, retrying")
+                self._failing = True
+            time.sleep(min(5.0, self.flush_interval * 4))
+
+    def flush(self, timeout=5.0):
+        """
+        Wait up to ``timeout`` seconds for queued records to be shipped.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._cond.notify()
+        while time.monotonic() < deadline:
+            with self._cond:
+                if not self._records and not self._inflight:
+                    return True
+            time.sleep(0.01)
+        return False
+
+    def close(self, timeout=5.0):
+        """
+        Flush pending records and stop the worker thread.
+        """
+        if self._pid != os.getpid() or self._closed:
+            return
+        self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout)
+        self._publisher.close()
+
+    def stats(self):
+        stats = dict(self.counters)
+        stats["pending"] = len(self._records)
+        return stats
@@ -0,0 +1,151 @@
+import threading
+import time
+
+import pika
+
+
+class RabbitMQPublisher:
+    """
+    Long-lived, thread-safe RabbitMQ publisher.
+
+    A pika BlockingConnection must not be used from several threads at once,
+    so every operation holds a lock. The connection is opened lazily, kept
+    open across calls, and re-established (with the exchanges redeclared)
+    when the broker drops it.
+
+    Args:
+        host (str): RabbitMQ host.
+        heartbeat (int): Connection heartbeat in seconds.
+        confirm (bool): Put the channel in publisher-confirm mode, so every
+            publish returns only once the broker has taken the message and
+            routed it to a queue (it is published ``mandatory``).
+        retries (int): Connection attempts per operation.
+        retry_delay (float): Seconds between connection attempts.
+    """
+
+    def __init__(self, host='localhost', heartbeat=600, confirm=True, retries=3, retry_delay=1):
+        self.host = host
+        self.heartbeat = heartbeat
+        self.confirm = confirm
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.connection = None
+        self.channel = None
+        self._exchanges = {}  # exchange -> exchange_type
+        self._queues = {}  # queue -> queue_declare kwargs
+        self._lock = threading.RLock()
+
+    def _is_connected(self):
+        return (self.connection is not None and self.connection.is_open
+                and self.channel is not None and self.channel.is_open)
+
+    def _connect(self):
+        last_error = None
+        for attempt in range(self.retries):
+            try:
+                self.connection = pika.BlockingConnection(
+                    pika.ConnectionParameters(host=self.host, heartbeat=self.heartbeat)
+                )
+                self.channel = self.connection.channel()
+                if self.confirm:
+                    self.channel.confirm_delivery()
+                for exchange, exchange_type in self._exchanges.items():
+                    self.channel.exchange_declare(exchange=exchange, exchange_type=exchange_type)
+                for queue, kwargs in self._queues.items():
+                    self.channel.queue_declare(queue=queue, **kwargs)
+                return
+            except pika.exceptions.AMQPError as e:
+                last_error = e
+                self._reset()
+                if attempt + 1 < self.retries:
+                    time.sleep(self.retry_delay)
+        raise ConnectionError(f"Could not connect to RabbitMQ at {self.host}: {last_error}")
+
+    def _reset(self):
+        try:
+            if self.connection is not None and self.connection.is_open:
+                self.connection.close()
+        except Exception:
+            pass
+        self.connection = None
+        self.channel = None
+
+    def _ensure_connected(self):
+        if self._is_connected():
+            try:
+                # Serve heartbeats missed while the connection sat idle
+                self.connection.process_data_events(time_limit=0)
+                return
+            except pika.exceptions.AMQPError:
+                self._reset()
+        self._connect()
+
+    def declare_exchange(self, exchange, exchange_type='fanout'):
+        """
+        Declare an exchange now and again after every reconnect.
+        """
+        with self._lock:
+            self._exchanges[exchange] = exchange_type
+            self._ensure_connected()
+            self.channel.exchange_declare(exchange=exchange, exchange_type=exchange_type)
+
+    def declare_queue(self, queue, **kwargs):
+        """
+        Declare a queue now and again after every reconnect.
+        """
+        with self._lock:
+            self._queues[queue] = kwargs
+            self._ensure_connected()
+            self.channel.queue_declare(queue=queue, **kwargs)
+
+    def publish(self, exchange, body, routing_key="", properties=None):
+        """
+        Publish one message, reconnecting once if the connection was lost.
+        """
+        return self.publish_batch(exchange, [body], routing_key, properties)[0]
+
+    def publish_batch(self, exchange, bodies, routing_key="", properties=None):
+        """
+        Publish several messages over the shared connection in one locked pass.
+
+        With ``confirm`` pika's blocking channel waits for the broker's ack
+        of each message before sending the next, so confirms cost one round
+        trip per message; the batch saves the locking and reconnect checks.
+        Messages no queue is bound for are reported as rejected.
+
+        Returns:
+            list: One ``(ok, error)`` tuple per message, in order.
+        """
+        results = []
+        unreachable = None
+        with self._lock:
+            for body in bodies:
+                if unreachable is not None:
+                    # Broker unreachable: fail the rest of the batch fast
+                    results.append((False, unreachable))
+                    continue
+                error = None
+                for attempt in range(2):
+                    try:
+                        self._ensure_connected()
+                        # Returns of unroutable messages are only reported back in confirm mode
+                        self.channel.basic_publish(exchange=exchange, routing_key=routing_key,
+                                                   body=body, properties=properties, mandatory=self.confirm)
+                        error = None
+                        break
+                    except (pika.exceptions.UnroutableError, pika.exceptions.NackError) as e:
+                        # The broker refused this message; the connection is fine
+                        error = f"Rejected by broker: {e}"
+                        break
+                    except ConnectionError as e:
+                        error = unreachable = str(e)
+                        break
+                    except pika.exceptions.AMQPError as e:
+                        error = str(e)
+                        self._reset()
+                results.append((error is None, error))
+        return results
+
+    def close(self):
+        with self._lock:
+            self._reset()
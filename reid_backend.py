@@ -0,0 +1,265 @@
+import os
+import time
+
+import numpy as np
+import torch
+
+# Inference backends for the FastReID model:
+#   eager       - the PyTorch module as loaded
+#   torchscript - traced, frozen and optimised for inference (conv/bn folding,
+#                 no Python dispatch per layer)
+#   onnx        - exported to ONNX and run with onnxruntime on the CPU
+REID_BACKENDS = ("eager", "torchscript", "onnx")
+
+# INT8 quantization modes (onnx backend only):
+#   dynamic - weights quantized offline, activations at run time (no calibration)
+#   static  - weights and activations quantized offline from calibration crops
+REID_QUANTIZE_MODES = (None, "dynamic", "static")
+
+# ONNX opset used for the export
+ONNX_OPSET = 13
+
+
+def configure_threads(num_threads):
+    """
+    Pin torch's intra-op pool to ``num_threads`` and use a single inter-op
+    thread; the ReID graph is a straight chain, so inter-op parallelism only
+    adds contention with the detector running in the same process.
+    """
+    if not num_threads:
+        return
+    torch.set_num_threads(int(num_threads))
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Only allowed before the first parallel region ran
+        pass
+
+
+def export_path(weights_path, backend, quantize=None, export_dir=None):
+    """
+    Where the exported model for ``weights_path`` is cached, e.g.
+    ``market_bot_R50-ibn.int8-static.onnx`` next to the weights.
+    """
+    stem = os.path.splitext(os.path.basename(weights_path))[0]
+    suffix = ".ts" if backend == "torchscript" else ".onnx"
+    if quantize:
+        suffix = f".int8-{quantize}{suffix}"
+    return os.path.join(export_dir or os.path.dirname(os.path.abspath(weights_path)), stem + suffix)
+
+
+def _is_fresh(path, weights_path):
+    if not os.path.exists(path):
+        return False
+    return not os.path.exists(weights_path) or os.path.getmtime(path) >= os.path.getmtime(weights_path)
+
+
+class ReIDBackend:
+    """
+    Callable running one (N, 3, H, W) float32 batch through the ReID model.
+
+    Returns an (N, D) numpy array of ``output_dtype``: float32, or float16
+    when ``fp16_output`` is set, which halves the size of every embedding
+    kept in track caches and galleries at ~1e-3 relative error.
+    """
+
+    name = "eager"
+
+    def __init__(self, fp16_output=False):
+        self.output_dtype = np.float16 if fp16_output else np.float32
+        self.load_seconds = 0.0
+        self.quantize = None
+
+    def _run(self, batch):
+        raise NotImplementedError
+
+    def __call__(self, batch):
+        out = self._run(batch)
+        return out.reshape(len(out), -1).astype(self.output_dtype, copy=False)
+
+    def describe(self):
+        quantize = f"+int8-{self.quantize}" if self.quantize else ""
+        output = "fp16" if self.output_dtype == np.float16 else "fp32"
+        return f"{self.name}{quantize} ({output} output, loaded in {self.load_seconds:.1f}s)"
+
+
+class EagerBackend(ReIDBackend):
+    def __init__(self, model, device, fp16_output=False):
+        super().__init__(fp16_output)
+        self.model = model
+        self.device = device
+
+    def _run(self, batch):
+        with torch.inference_mode():
+            return self.model(torch.as_tensor(batch).to(self.device)).float().cpu().numpy()
+
+
+class TorchScriptBackend(ReIDBackend):
+    name = "torchscript"
+
+    def __init__(self, model, device, path, input_size, fp16_output=False, weights_path=None):
+        super().__init__(fp16_output)
+        start = time.perf_counter()
+        self.device = device
+        if _is_fresh(path, weights_path or ""):
+            self.module = torch.jit.load(path, map_location=device)
+        else:
+            example = torch.zeros((1, 3) + tuple(input_size), device=device)
+            with torch.no_grad():
+                traced = torch.jit.trace(model, example)
+            self.module = torch.jit.optimize_for_inference(torch.jit.freeze(traced.eval()))
+            torch.jit.save(self.module, path)
+        self.load_seconds = time.perf_counter() - start
+
+    def _run(self, batch):
+        with torch.inference_mode():
+            return self.module(torch.as_tensor(batch).to(self.device)).float().cpu().numpy()
+
+
+class _CalibrationReader:
+    """
+    onnxruntime CalibrationDataReader over a list of (N, 3, H, W) batches.
+    """
+
+    def __init__(self, input_name, batches):
+        self._batches = iter([{input_name: np.ascontiguousarray(b, dtype=np.float32)} for b in batches])
+
+    def get_next(self):
+        return next(self._batches, None)
+
+
+class OnnxBackend(ReIDBackend):
+    name = "onnx"
+
+    def __init__(self, model, path, fp32_path, input_size, quantize=None, calibration=None,
+                 num_threads=None, fp16_output=False, weights_path=None):
+        super().__init__(fp16_output)
+        import onnxruntime as ort  # Optional dependency, only needed for the onnx backend
+
+        if quantize not in REID_QUANTIZE_MODES:
+            raise ValueError(f"Unknown quantization {quantize!r}, expected one of {REID_QUANTIZE_MODES}")
+        if quantize == "static" and not calibration:
+            raise ValueError("Static INT8 quantization needs calibration batches")
+        start = time.perf_counter()
+        self.quantize = quantize
+        if not _is_fresh(fp32_path, weights_path or ""):
+            self._export(model, fp32_path, input_size)
+        if quantize and not _is_fresh(path, fp32_path):
+            self._quantize(fp32_path, path, quantize, calibration)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.inter_op_num_threads = 1
+        if num_threads:
+            options.intra_op_num_threads = int(num_threads)
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        self.load_seconds = time.perf_counter() - start
+
+    @staticmethod
+    def _export(model, path, input_size):
+        device = next(model.parameters()).device
+        example = torch.zeros((1, 3) + tuple(input_size), device=device)
+        with torch.no_grad():
+            torch.onnx.export(
+                model, example, path, opset_version=ONNX_OPSET,
+                input_names=["images"], output_names=["features"],
+                dynamic_axes={"images": {0: "batch"}, "features": {0: "batch"}},
+            )
+
+    @staticmethod
+    def _quantize(fp32_path, path, quantize, calibration):
+        from onnxruntime import quantization
+
+        if quantize == "dynamic":
+            quantization.quantize_dynamic(fp32_path, path, weight_type=quantization.QuantType.QInt8)
+            return
+        # Static QDQ: per-channel weights, activations calibrated on real crops
+        preprocessed = fp32_path.replace(".onnx", ".infer.onnx")
+        quantization.shape_inference.quant_pre_process(fp32_path, preprocessed)
+        quantization.quantize_static(
+            preprocessed, path, _CalibrationReader("images", calibration),
+            quant_format=quantization.QuantFormat.QDQ, per_channel=True,
+            activation_type=quantization.QuantType.QUInt8, weight_type=quantization.QuantType.QInt8,
+        )
+        os.remove(preprocessed)
+
+    def _run(self, batch):
+        if isinstance(batch, torch.Tensor):
+            batch = batch.numpy()
+        return self.session.run(None, {self.input_name: np.ascontiguousarray(batch, dtype=np.float32)})[0]
+
+
+def build_backend(model, device, weights_path, input_size, backend="eager", quantize=None,
+                  calibration=None, num_threads=None, fp16_output=False, export_dir=None):
+    """
+    Wrap a loaded FastReID model in the selected inference backend.
+
+    Exports are cached next to the weights (or in ``export_dir``) and
+    rebuilt when the weights file is newer.
+
+    Args:
+        model: The eager FastReID model, in eval mode.
+        device (str): Device the eager model lives on.
+        weights_path (str): Checkpoint the model was loaded from; names the exports.
+        input_size: (height, width) of the model input.
+        backend (str): One of REID_BACKENDS.
+        quantize (str): One of REID_QUANTIZE_MODES, onnx backend only.
+        calibration: List of (N, 3, H, W) float32 batches for static INT8.
+        num_threads (int): CPU threads for inference, None for the library default.
+        fp16_output (bool): Return float16 embeddings.
+
+    Returns:
+        ReIDBackend
+    """
+    if backend not in REID_BACKENDS:
+        raise ValueError(f"Unknown ReID backend {backend!r}, expected one of {REID_BACKENDS}")
+    if quantize and backend != "onnx":
+        raise ValueError("INT8 quantization is only available with the onnx backend")
+    configure_threads(num_threads)
+    if backend == "eager":
+        return EagerBackend(model, device, fp16_output)
+    path = export_path(weights_path, backend, quantize, export_dir)
+    if backend == "torchscript":
+        return TorchScriptBackend(model, device, path, input_size, fp16_output, weights_path)
+    fp32_path = export_path(weights_path, backend, None, export_dir)
+    return OnnxBackend(model, path, fp32_path, input_size, quantize, calibration, num_threads, fp16_output,
+                       weights_path)
+
+
+def compare_embeddings(reference, candidate):
+    """
+    How closely ``candidate`` embeddings track ``reference`` ones for the same crops.
+
+    Returns:
+        dict with ``mean_cosine`` / ``min_cosine`` (row-wise cosine
+        similarity) and ``top1_agreement``: the fraction of crops whose
+        nearest other crop is the same under both embeddings, i.e. how often
+        gallery matching would pick the same identity.
+    """
+    def normalize(x):
+        x = np.asarray(x, dtype=np.float32)
+        return x / (np.linalg.norm(x, axis=1, keepdims=True) + 1e-12)
+
+    reference, candidate = normalize(reference), normalize(candidate)
+    cosine = np.sum(reference * candidate, axis=1)
+    result = {"mean_cosine": float(cosine.mean()), "min_cosine": float(cosine.min()), "top1_agreement": 1.0}
+    if len(reference) > 1:
+        nearest = []
+        for x in (reference, candidate):
+            sims = x @ x.T
+            np.fill_diagonal(sims, -np.inf)
+            nearest.append(sims.argmax(axis=1))
+        result["top1_agreement"] = float(np.mean(nearest[0] == nearest[1]))
+    return result
+
+
+def check_backend(backend, reference, batches):
+    """
+    Run ``batches`` through ``backend`` and the ``reference`` backend (usually eager)
+    and compare the embeddings with compare_embeddings.
+    """
+    expected = np.concatenate([reference(b) for b in batches])
+    actual = np.concatenate([backend(b) for b in batches])
+    return compare_embeddings(expected, actual)
@@ -0,0 +1,583 @@
+import time
+from collections import OrderedDict
+from itertools import islice
+
+import numpy as np
+
+
+def l2_normalize(features, eps=1e-6):
+    """
+    L2-normalise a single feature or an (N, D) batch of features to float32.
+    """
+    features = np.asarray(features, dtype=np.float32)
+    if features.ndim == 1:
+        features = features[None, :]
+    norms = np.linalg.norm(features, axis=1, keepdims=True) + eps
+    return features / norms
+
+
+def similarity_to_distance(similarity):
+    """
+    Convert cosine similarity of unit vectors to euclidean distance.
+    """
+    return np.sqrt(np.clip(2.0 - 2.0 * np.asarray(similarity), 0.0, None))
+
+
+def distance_to_similarity(distance):
+    """
+    Convert euclidean distance of unit vectors to cosine similarity.
+    """
+    return 1.0 - (distance ** 2) / 2.0
+
+
+# ------------- Nearest-neighbour indexes ---------------
+def _search_rows(queries, vectors, ids, k):
+    """
+    Exact top-``k`` inner-product search of ``queries`` over ``vectors`` / ``ids``.
+    """
+    queries = np.asarray(queries, dtype=np.float32)
+    sims = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    out_ids = np.full((len(queries), k), -1, dtype=np.int64)
+    size = len(ids)
+    if size == 0 or len(queries) == 0:
+        return sims, out_ids
+    scores = queries @ vectors.T
+    kk = min(k, size)
+    if kk < size:
+        top = np.argpartition(-scores, kk - 1, axis=1)[:, :kk]
+    else:
+        top = np.tile(np.arange(size), (len(queries), 1))
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    top = np.take_along_axis(top, order, axis=1)
+    sims[:, :kk] = np.take_along_axis(top_scores, order, axis=1)
+    out_ids[:, :kk] = np.asarray(ids)[top]
+    return sims, out_ids
+
+
+class BruteForceIndex:
+    """
+    Exact inner-product index over a contiguous (N, D) float32 matrix.
+
+    Rows are kept packed: removing an id moves the last row into its slot,
+    so a search is always a single matrix multiply over ``N`` rows.
+    """
+
+    def __init__(self, dim, initial_capacity=1024):
+        self.dim = dim
+        self._vectors = np.empty((initial_capacity, dim), dtype=np.float32)
+        self._ids = np.empty(initial_capacity, dtype=np.int64)
+        self._rows = {}  # id -> row
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def vectors(self):
+        return self._vectors[:self._size]
+
+    @property
+    def ids(self):
+        return self._ids[:self._size]
+
+    def _grow(self, needed):
+        capacity = self._vectors.shape[0]
+        if needed <= capacity:
+            return
+        capacity = max(capacity, 1)
+        while capacity < needed:
+            capacity *= 2
+        vectors = np.empty((capacity, self.dim), dtype=np.float32)
+        vectors[:self._size] = self._vectors[:self._size]
+        ids = np.empty(capacity, dtype=np.int64)
+        ids[:self._size] = self._ids[:self._size]
+        self._vectors, self._ids = vectors, ids
+
+    def add(self, ids, vectors):
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        self._grow(self._size + len(ids))
+        for pid, vector in zip(ids, vectors):
+            row = self._rows.get(int(pid))
+            if row is None:
+                row = self._size
+                self._rows[int(pid)] = row
+                self._ids[row] = pid
+                self._size += 1
+            self._vectors[row] = vector
+
+    def update(self, ids, vectors):
+        self.add(ids, vectors)
+
+    def load(self, ids, vectors):
+        """
+        Replace the contents with ``ids`` / ``vectors`` without copying them,
+        e.g. writable (copy-on-write) arrays memory-mapped from a snapshot.
+        """
+        self._ids = ids
+        self._vectors = vectors
+        self._size = len(ids)
+        self._rows = {pid: row for row, pid in enumerate(ids.tolist())}
+
+    def get(self, ids):
+        """
+        Return the stored vectors of ``ids`` as an (N, D) array.
+        """
+        rows = [self._rows[int(pid)] for pid in np.asarray(ids).reshape(-1)]
+        return self._vectors[rows]
+
+    def remove(self, ids):
+        for pid in np.asarray(ids, dtype=np.int64).reshape(-1):
+            row = self._rows.pop(int(pid), None)
+            if row is None:
+                continue
+            last = self._size - 1
+            if row != last:
+                self._vectors[row] = self._vectors[last]
+                self._ids[row] = self._ids[last]
+                self._rows[int(self._ids[row])] = row
+            self._size -= 1
+
+    def search(self, queries, k=1, subset=None):
+        """
+        Return (similarities, ids), both (Q, k). Missing neighbours have id -1.
+        ``subset`` restricts the search to those ids.
+        """
+        if subset is None:
+            return _search_rows(queries, self.vectors, self.ids, k)
+        rows = [self._rows[pid] for pid in np.asarray(subset).tolist() if pid in self._rows]
+        return _search_rows(queries, self._vectors[rows], self._ids[rows], k)
+
+
+class FaissIVFIndex:
+    """
+    Approximate inner-product index backed by a faiss IVF index.
+
+    Meant for galleries past ~100k identities. Vectors are kept in an exact
+    buffer until ``train_size`` of them are available to train the coarse
+    quantizer; after that every search probes ``nprobe`` of ``nlist`` lists.
+    """
+
+    def __init__(self, dim, nlist=1024, nprobe=16, train_size=None):
+        import faiss  # Optional dependency, only needed for ANN mode
+
+        self._faiss = faiss
+        self.dim = dim
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_size = train_size or nlist * 39
+        self._buffer = BruteForceIndex(dim)
+        self._index = None
+
+    def __len__(self):
+        return len(self._buffer) if self._index is None else self._index.ntotal
+
+    def _train(self):
+        faiss = self._faiss
+        quantizer = faiss.IndexFlatIP(self.dim)
+        index = faiss.IndexIVFFlat(quantizer, self.dim, self.nlist, faiss.METRIC_INNER_PRODUCT)
+        index.train(np.ascontiguousarray(self._buffer.vectors))
+        index.set_direct_map_type(faiss.DirectMap.Hashtable)
+        index.nprobe = self.nprobe
+        index.add_with_ids(np.ascontiguousarray(self._buffer.vectors), self._buffer.ids.copy())
+        self._index = index
+        self._buffer = None
+
+    def add(self, ids, vectors):
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(len(ids), self.dim)
+        if self._index is None:
+            self._buffer.add(ids, vectors)
+            if len(self._buffer) >= self.train_size:
+                self._train()
+            return
+        self.remove(ids)
+        self._index.add_with_ids(vectors, ids)
+
+    def update(self, ids, vectors):
+        self.add(ids, vectors)
+
+    def get(self, ids):
+        if self._index is None:
+            return self._buffer.get(ids)
+        return np.stack([self._index.reconstruct(int(pid)) for pid in np.asarray(ids).reshape(-1)])
+
+    def remove(self, ids):
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        if self._index is None:
+            self._buffer.remove(ids)
+        else:
+            self._index.remove_ids(self._faiss.IDSelectorArray(ids))
+
+    def search(self, queries, k=1, subset=None):
+        if self._index is None:
+            return self._buffer.search(queries, k, subset)
+        if subset is not None:
+            # Gated candidate sets are small: reconstruct and search them exactly
+            subset = np.asarray(subset, dtype=np.int64)
+            vectors = self.get(subset) if len(subset) else np.empty((0, self.dim), dtype=np.float32)
+            return _search_rows(queries, vectors, subset, k)
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        sims, ids = self._index.search(queries, k)
+        sims[ids < 0] = -np.inf
+        return sims, ids
+
+
+# ------------- Gallery ---------------
+def _greedy_assignment(cost):
+    """
+    Greedy fallback for linear_sum_assignment when scipy is unavailable.
+    """
+    rows, cols = [], []
+    used_rows, used_cols = set(), set()
+    for flat in np.argsort(cost, axis=None):
+        r, c = np.unravel_index(flat, cost.shape)
+        if r in used_rows or c in used_cols:
+            continue
+        rows.append(r)
+        cols.append(c)
+        used_rows.add(r)
+        used_cols.add(c)
+    return np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64)
+
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    linear_sum_assignment = _greedy_assignment
+
+
+class ReIDGallery:
+    """
+    ReID identity gallery backed by a contiguous, L2-normalised embedding matrix.
+
+    Every identity keeps a single prototype embedding, updated as an EMA of
+    its confirmed matches, so the gallery holds one row per identity instead
+    of one row per sighting. Identities can be evicted by last-seen time,
+    by a max identity count (least recently seen first), or both.
+
+    Args:
+        threshold (float): Max euclidean distance between unit embeddings
+            for a query to match an identity.
+        index_factory (callable): ``index_factory(dim)`` builds the
+            nearest-neighbour index. Defaults to an exact BruteForceIndex.
+        top_k (int): Candidates fetched per query for joint assignment.
+        ema_momentum (float): Weight of the old prototype when folding in a
+            confirmed match. 1.0 freezes prototypes at their first sighting.
+        update_threshold (float): Max distance for a match to update the
+            prototype. Defaults to ``threshold``.
+        ttl_seconds (float): Evict identities not seen for this long. None
+            disables time based eviction.
+        max_identities (int): Evict least recently seen identities above
+            this count. None disables capacity based eviction.
+
+        gate: Optional camera_topology.TopologyGate. Queries that carry a
+            camera id are then only matched against identities last seen
+            on a camera that can reach it within the link's transit window.
+
+    Set ``journal`` (e.g. a gallery_store.GalleryStore) to have every
+    add, prototype update and removal recorded as it happens.
+    """
+
+    def __init__(self, threshold=0.6, index_factory=None, top_k=5, ema_momentum=0.9,
+                 update_threshold=None, ttl_seconds=None, max_identities=None, gate=None):
+        self.threshold = threshold
+        self.index_factory = index_factory or BruteForceIndex
+        self.top_k = top_k
+        self.ema_momentum = ema_momentum
+        self.update_threshold = threshold if update_threshold is None else update_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_identities = max_identities
+        self.index = None
+        self.next_id = 0
+        self.last_seen = OrderedDict()  # id -> last seen time, least recent first
+        self.last_camera = {}  # id -> camera it was last seen on (when known)
+        self.gate = gate
+        self.journal = None
+        self.counters = {
+            "matched": 0,
+            "created": 0,
+            "prototype_updates": 0,
+            "evicted_ttl": 0,
+            "evicted_capacity": 0,
+            "gated_searches": 0,
+            "gate_candidates": 0,
+        }
+
+    def __len__(self):
+        return 0 if self.index is None else len(self.index)
+
+    def __contains__(self, pid):
+        return int(pid) in self.last_seen
+
+    def _ensure_index(self, dim):
+        if self.index is None:
+            self.index = self.index_factory(dim)
+
+    def touch(self, ids, now=None, camera_id=None):
+        """
+        Mark identities as seen (on ``camera_id``, if given) without changing their prototypes.
+        """
+        now = time.time() if now is None else now
+        ids = [pid for pid in ids if int(pid) in self.last_seen]
+        self._touch(ids, now)
+        self._seen_on(ids, camera_id, now)
+        self._journal_touch(ids, now, camera_id)
+
+    def _touch(self, ids, now):
+        for pid in ids:
+            pid = int(pid)
+            self.last_seen[pid] = now
+            self.last_seen.move_to_end(pid)
+
+    def _journal_touch(self, ids, now, camera_id):
+        # Recency drives TTL eviction and topology gating, so it must survive restarts
+        if self.journal is not None and len(ids):
+            self.journal.record("touch", ids, None, now, None, camera_id)
+
+    def _seen_on(self, ids, camera_id, now):
+        if camera_id is None or len(ids) == 0:
+            return
+        camera_id = str(camera_id)
+        for pid in ids:
+            self.last_camera[int(pid)] = camera_id
+        if self.gate is not None:
+            self.gate.observe(ids, camera_id, now)
+
+    def add(self, features, now=None, camera_id=None):
+        """
+        Register each feature as a new identity and return the new ids.
+        """
+        now = time.time() if now is None else now
+        features = l2_normalize(features)
+        self._ensure_index(features.shape[1])
+        ids = np.arange(self.next_id, self.next_id + len(features), dtype=np.int64)
+        self.next_id += len(features)
+        self.index.add(ids, features)
+        self._touch(ids, now)
+        self._seen_on(ids, camera_id, now)
+        self.counters["created"] += len(ids)
+        if self.journal is not None:
+            self.journal.record("add", ids, features, now, self.next_id, camera_id)
+        return ids
+
+    def update_prototypes(self, ids, features):
+        """
+        Fold unit ``features`` into the prototypes of ``ids`` with an EMA.
+        """
+        if self.ema_momentum >= 1.0 or len(ids) == 0:
+            return
+        # Several queries may confirm the same identity in one batch
+        merged = {}
+        for pid, feature in zip(ids, features):
+            merged.setdefault(int(pid), []).append(feature)
+        uniq = np.fromiter(merged.keys(), dtype=np.int64, count=len(merged))
+        observed = np.stack([np.mean(merged[int(pid)], axis=0) for pid in uniq])
+        prototypes = self.ema_momentum * self.index.get(uniq) + (1.0 - self.ema_momentum) * observed
+        prototypes = l2_normalize(prototypes)
+        self.index.update(uniq, prototypes)
+        self.counters["prototype_updates"] += len(uniq)
+        if self.journal is not None:
+            self.journal.record("update", uniq, prototypes)
+
+    def remove(self, ids):
+        """
+        Drop identities from the gallery.
+        """
+        ids = [int(pid) for pid in ids if int(pid) in self.last_seen]
+        if ids:
+            self.index.remove(ids)
+            for pid in ids:
+                del self.last_seen[pid]
+                self.last_camera.pop(pid, None)
+            if self.gate is not None:
+                self.gate.forget(ids)
+            if self.journal is not None:
+                self.journal.record("remove", ids)
+        return ids
+
+    def evict(self, now=None, keep=()):
+        """
+        Apply the TTL and capacity eviction policies. Returns evicted ids.
+
+        Ids in ``keep`` (those a match just returned) are never evicted for
+        capacity, even if that leaves the gallery over max_identities until
+        a later call.
+        """
+        now = time.time() if now is None else now
+        expired = []
+        if self.ttl_seconds is not None:
+            cutoff = now - self.ttl_seconds
+            for pid, seen in self.last_seen.items():
+                if seen >= cutoff:
+                    break
+                expired.append(pid)
+            self.counters["evicted_ttl"] += len(self.remove(expired))
+        overflow = []
+        if self.max_identities is not None and len(self.last_seen) > self.max_identities:
+            excess = len(self.last_seen) - self.max_identities
+            keep = set(int(pid) for pid in keep)
+            overflow = list(islice((pid for pid in self.last_seen if pid not in keep), excess))
+            self.counters["evicted_capacity"] += len(self.remove(overflow))
+        return expired + overflow
+
+    def export_state(self):
+        """
+        Copy the identities out in least recently seen order.
+
+        Returns:
+            dict: ``ids`` (N,), unit ``vectors`` (N, D), ``last_seen`` (N,),
+            ``cameras`` (N, last camera or None), ``next_id``, ``dim``
+            (None while empty) and ``counters``.
+        """
+        ids = np.fromiter(self.last_seen.keys(), dtype=np.int64, count=len(self.last_seen))
+        last_seen = np.fromiter(self.last_seen.values(), dtype=np.float64, count=len(ids))
+        dim = None if self.index is None else self.index.dim
+        vectors = self.index.get(ids) if len(ids) else np.empty((0, dim or 0), dtype=np.float32)
+        cameras = [self.last_camera.get(pid) for pid in ids.tolist()]
+        return {"ids": ids, "vectors": np.asarray(vectors, dtype=np.float32), "last_seen": last_seen,
+                "cameras": cameras, "next_id": self.next_id, "dim": dim, "counters": dict(self.counters)}
+
+    def restore_state(self, ids, vectors, last_seen, next_id, dim, counters=None, cameras=None):
+        """
+        Replace the identities with saved ones (see export_state). A
+        BruteForceIndex adopts ``ids`` / ``vectors`` as they are, so
+        memory-mapped arrays are not read until used.
+        """
+        self.index = self.index_factory(dim) if dim else None
+        if len(ids):
+            if isinstance(self.index, BruteForceIndex):
+                self.index.load(ids, vectors)
+            else:
+                self.index.add(ids, vectors)
+        self.last_seen = OrderedDict(zip(np.asarray(ids).tolist(), np.asarray(last_seen).tolist()))
+        self.last_camera = {pid: camera for pid, camera in zip(self.last_seen, cameras or ()) if camera is not None}
+        self.next_id = max(self.next_id, int(next_id))
+        self.counters.update(counters or {})
+        if self.gate is not None:
+            # Replay sightings oldest first so each camera's list stays time ordered
+            for pid, seen in self.last_seen.items():
+                camera = self.last_camera.get(pid)
+                if camera is not None:
+                    self.gate.observe((pid,), camera, seen)
+
+    def apply_record(self, op, ids, vectors=None, now=None, next_id=None, camera_id=None):
+        """
+        Re-apply one journaled change ("add", "update", "touch" or "remove")
+        when replaying a log. Nothing is journaled again.
+        """
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        if op in ("add", "update"):
+            self._ensure_index(vectors.shape[1])
+            self.index.update(ids, vectors)
+            if op == "add":
+                now = time.time() if now is None else now
+                self._touch(ids, now)
+                self._seen_on(ids, camera_id, now)
+        elif op == "touch":
+            ids = [pid for pid in ids.tolist() if pid in self.last_seen]
+            now = time.time() if now is None else now
+            self._touch(ids, now)
+            self._seen_on(ids, camera_id, now)
+        elif op == "remove":
+            ids = [pid for pid in ids.tolist() if pid in self.last_seen]
+            if ids:
+                self.index.remove(ids)
+                for pid in ids:
+                    del self.last_seen[pid]
+                    self.last_camera.pop(pid, None)
+                if self.gate is not None:
+                    self.gate.forget(ids)
+        else:
+            raise ValueError(f"Unknown gallery record {op!r}")
+        if next_id is not None:
+            self.next_id = max(self.next_id, int(next_id))
+
+    def stats(self):
+        """
+        Return gallery size and lifetime counters.
+        """
+        stats = dict(self.counters)
+        stats["size"] = len(self)
+        stats["next_id"] = self.next_id
+        return stats
+
+    def search(self, features, k=1, candidates=None):
+        """
+        Return (ids, distances) of the ``k`` nearest identities of every query,
+        among ``candidates`` only if given.
+        """
+        features = l2_normalize(features)
+        if self.index is None or (candidates is not None and len(candidates) == 0):
+            return (np.full((len(features), k), -1, dtype=np.int64),
+                    np.full((len(features), k), np.inf, dtype=np.float32))
+        sims, ids = self.index.search(features, k, candidates)
+        return ids, similarity_to_distance(sims)
+
+    def match(self, features, joint=False, add_unmatched=True, now=None, camera_id=None):
+        """
+        Match a batch of features against the gallery with one search call.
+
+        Args:
+            features: (N, D) array of query embeddings.
+            joint (bool): Solve a one-to-one assignment so two queries can't
+                claim the same identity.
+            add_unmatched (bool): Register unmatched queries as new identities.
+            now (float): Observation time, defaults to ``time.time()``.
+            camera_id: Camera the queries were seen on. With a ``gate`` the
+                search is restricted to its topology candidates.
+
+        Returns:
+            (ids, distances): Matched or newly assigned ids (-1 if unmatched
+            and not added) and the match distance (inf for new identities).
+        """
+        now = time.time() if now is None else now
+        features = l2_normalize(features)
+        n = len(features)
+        ids = np.full(n, -1, dtype=np.int64)
+        distances = np.full(n, np.inf, dtype=np.float32)
+        if n == 0:
+            return ids, distances
+
+        candidates = None
+        if self.gate is not None and camera_id is not None:
+            candidates = self.gate.candidates(camera_id, now)
+            if candidates is not None:
+                self.counters["gated_searches"] += 1
+                self.counters["gate_candidates"] += len(candidates)
+
+        if len(self) > 0 and (candidates is None or len(candidates) > 0):
+            k = self.top_k if joint else 1
+            cand_ids, cand_dist = self.search(features, k, candidates)
+            if not joint:
+                hit = cand_dist[:, 0] < self.threshold
+                ids[hit] = cand_ids[hit, 0]
+                distances[hit] = cand_dist[hit, 0]
+            else:
+                columns = np.unique(cand_ids[cand_ids >= 0])
+                col_of = {int(pid): c for c, pid in enumerate(columns)}
+                cost = np.full((n, len(columns)), 1e6, dtype=np.float32)
+                for q in range(n):
+                    for pid, dist in zip(cand_ids[q], cand_dist[q]):
+                        if pid >= 0 and dist < self.threshold:
+                            cost[q, col_of[int(pid)]] = dist
+                rows, cols = linear_sum_assignment(cost)
+                for r, c in zip(rows, cols):
+                    if cost[r, c] < self.threshold:
+                        ids[r] = columns[c]
+                        distances[r] = cost[r, c]
+
+            matched = ids >= 0
+            self.counters["matched"] += int(matched.sum())
+            self._touch(ids[matched], now)
+            self._seen_on(ids[matched], camera_id, now)
+            self._journal_touch(ids[matched], now, camera_id)
+            confirmed = matched & (distances < self.update_threshold)
+            self.update_prototypes(ids[confirmed], features[confirmed])
+
+        unmatched = ids < 0
+        if add_unmatched and unmatched.any():
+            ids[unmatched] = self.add(features[unmatched], now=now, camera_id=camera_id)
+        # Never hand callers ids that are gone by the time they get them
+        self.evict(now, keep=ids[ids >= 0])
+        return ids, distances
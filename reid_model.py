@@ -1,3 +1,6 @@
+import os
+import glob
+import types
 import torch
 import torchvision.transforms as transforms
 import numpy as np
@@ -7,13 +10,17 @@ from fastreid.config import get_cfg
 from fastreid.engine import default_setup
 from fastreid.modeling import build_model
 from fastreid.utils.checkpoint import Checkpointer
+from metrics import REGISTRY as metrics_registry
+from model_registry import MODELS
+from reid_backend import build_backend, check_backend
+from reid_preprocess import REID_INPUT_SIZE, REID_PIXEL_MEAN, REID_PIXEL_STD, crop_box, preprocess_crops
 
 # ----------- Load FastReID Model --------------
-def load_fastreid_model(config_file, weight_path):
+def load_fastreid_model(config_file, weight_path, device=None):
     cfg = get_cfg()
     cfg.merge_from_file(config_file)
     cfg.MODEL.WEIGHTS = weight_path
-    cfg.MODEL.DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+    cfg.MODEL.DEVICE = device or ("cuda" if torch.cuda.is_available() else "cpu")
     cfg.freeze()
     
     model = build_model(cfg)
@@ -21,22 +28,38 @@ def load_fastreid_model(config_file, weight_path):
     model.eval()
     return model, cfg
 
-config_file = "configs/Market1501/bagtricks_R50-ibn.yml"  # or another dataset config
-#weights_path = "pretrained/bagtricks_R50-ibn.pth"         # download from FastReID Model Zoo
-
-# config_file = 'bagtricks_R50-ibn.yml'
-weights_path = 'market_bot_R50-ibn.pth'
-
-reid_model, reid_cfg = load_fastreid_model(config_file, weights_path)
+# Settings of the "reid" model in model_registry.MODELS. Each one can be set
+# in the MODELS_CONFIG file or with a REID_<SETTING> environment variable
+# (REID_WEIGHTS, REID_BACKEND, ...). Nothing is loaded at import time.
+REID_DEFAULTS = {
+    "config": "configs/Market1501/bagtricks_R50-ibn.yml",  # or another dataset config
+    "weights": "market_bot_R50-ibn.pth",  # download from FastReID Model Zoo
+    "device": None,              # None picks cuda when available
+    "backend": "eager",          # "eager", "torchscript" or "onnx" (see reid_backend.REID_BACKENDS)
+    "quantize": None,            # None, "dynamic" or "static" INT8 quantization (onnx backend only)
+    "fp16_output": False,        # float16 embeddings (half the memory in track caches / galleries)
+    "num_threads": 0,            # CPU threads for ReID inference, 0 for the library default
+    # Person crops for static INT8 calibration and the startup accuracy
+    # check; random input is used for the check when unset
+    "calibration_dir": None,
+    # Fall back to the eager model if the backend's embeddings drift further
+    # than this from eager ones (mean cosine similarity)
+    "min_cosine": 0.98,
+    "warmup_batches": 2,         # Dummy batches per warm-up batch size (0 disables warm-up)
+}
 
 # ------------- Image Transforms ---------------
 transform = transforms.Compose([
-    transforms.Resize((256, 128)),
+    transforms.Resize(REID_INPUT_SIZE),
     transforms.ToTensor(),
-    transforms.Normalize(mean=[0.485, 0.456, 0.406],
-                         std=[0.229, 0.224, 0.225])
+    transforms.Normalize(mean=list(REID_PIXEL_MEAN),
+                         std=list(REID_PIXEL_STD))
 ])
 
+# "cv2" resizes crops straight from the frame into one preallocated batch
+# (reid_preprocess); "torchvision" is the per-crop PIL + transform path
+REID_PREPROCESS = "cv2"
+
 # ------------- Feature Extractor ---------------
 def extract_reid_feature(frame, box):
     x1, y1, x2, y2 = map(int, box)
@@ -45,17 +68,178 @@ def extract_reid_feature(frame, box):
         return None
 
     try:
+        reid = get_reid_model()
         img = Image.fromarray(cv2.cvtColor(person_crop, cv2.COLOR_BGR2RGB))
-        img_tensor = transform(img).unsqueeze(0).to(reid_cfg.MODEL.DEVICE)
+        img_tensor = transform(img).unsqueeze(0).to(reid.cfg.MODEL.DEVICE)
 
         with torch.no_grad():
-            features = reid_model(img_tensor)
+            features = reid.model(img_tensor)
         return features.squeeze().cpu().numpy()
     except Exception as e:
         print(f"[ERROR] Failed to extract ReID feature: {e}")
         return None
 
 
+# Max number of crops sent through the ReID model in one forward pass
+REID_MAX_BATCH_SIZE = 32
+
+
+def load_calibration_batches(directory, batch_size=REID_MAX_BATCH_SIZE, limit=256):
+    """
+    Preprocess up to ``limit`` person crop images from ``directory`` into
+    (N, 3, H, W) float32 batches.
+    """
+    paths = sorted(glob.glob(os.path.join(directory, "*.jpg")) + glob.glob(os.path.join(directory, "*.png")))
+    batches, current = [], []
+    for path in paths[:limit]:
+        crop = cv2.imread(path)
+        if crop is None:
+            continue
+        batch, _ = preprocess_crops(crop, [(0, 0, crop.shape[1], crop.shape[0])])
+        current.append(batch[0].copy())
+        if len(current) == batch_size:
+            batches.append(np.stack(current))
+            current = []
+    if current:
+        batches.append(np.stack(current))
+    return batches
+
+
+def load_reid_backend(model, cfg, weights_path, settings):
+    """
+    Build the configured inference backend and check it against the eager
+    model, falling back to eager if its embeddings drift too far.
+    """
+    eager = build_backend(model, cfg.MODEL.DEVICE, weights_path, REID_INPUT_SIZE,
+                          num_threads=settings["num_threads"], fp16_output=settings["fp16_output"])
+    if settings["backend"] == "eager":
+        return eager
+    calibration = load_calibration_batches(settings["calibration_dir"]) if settings["calibration_dir"] else []
+    try:
+        backend = build_backend(model, cfg.MODEL.DEVICE, weights_path, REID_INPUT_SIZE,
+                                backend=settings["backend"], quantize=settings["quantize"],
+                                calibration=calibration, num_threads=settings["num_threads"],
+                                fp16_output=settings["fp16_output"])
+    except Exception as e:
+        print(f"[ERROR] Failed to build ReID backend {settings['backend']!r}, using eager: {e}")
+        return eager
+    check_batches = calibration or [np.random.default_rng(0).standard_normal(
+        (8, 3) + REID_INPUT_SIZE).astype(np.float32)]
+    accuracy = check_backend(backend, eager, check_batches)
+    print(f"[INFO] ReID backend {backend.describe()}: mean cosine {accuracy['mean_cosine']:.4f}, "
+          f"min {accuracy['min_cosine']:.4f}, top-1 agreement {accuracy['top1_agreement']:.3f}")
+    if accuracy["mean_cosine"] < settings["min_cosine"]:
+        print(f"[WARNING] ReID backend below min_cosine={settings['min_cosine']}, using eager")
+        return eager
+    return backend
+
+
+def load_reid(settings):
+    """
+    Model registry loader: the FastReID model, its cfg and the inference backend.
+    """
+    model, cfg = load_fastreid_model(settings["config"], settings["weights"], settings["device"])
+    backend = load_reid_backend(model, cfg, settings["weights"], settings)
+    return types.SimpleNamespace(model=model, cfg=cfg, backend=backend, weights_path=settings["weights"])
+
+
+def warmup_reid(reid, settings):
+    """
+    Run dummy single-crop and full batches through preprocessing and the
+    backend, which also grows the preprocessing buffers to the largest batch.
+    """
+    height, width = REID_INPUT_SIZE
+    frame = np.zeros((height * 2, width * 2, 3), dtype=np.uint8)
+    for batch_size in (1, REID_MAX_BATCH_SIZE):
+        crops, _ = _preprocess(frame, [(0, 0, width * 2, height * 2)] * batch_size)
+        for _ in range(settings["warmup_batches"]):
+            reid.backend(crops)
+
+
+MODELS.register("reid", load_reid, warmup_reid, REID_DEFAULTS)
+
+
+def get_reid_model():
+    """
+    The loaded ReID model (``.model``, ``.cfg``, ``.backend``, ``.weights_path``),
+    loading and warming it up on first use.
+    """
+    return MODELS.get("reid")
+
+# Embedding size, learned from the first successful forward pass
+_feature_dim = None
+
+
+def _preprocess_torchvision(frame, boxes):
+    """
+    Per-crop PIL + torchvision preprocessing; returns (batch tensor, indices).
+    """
+    tensors, indices = [], []
+    for i, box in enumerate(boxes):
+        person_crop = crop_box(frame, box)
+        if person_crop is None:
+            continue
+        try:
+            img = Image.fromarray(cv2.cvtColor(person_crop, cv2.COLOR_BGR2RGB))
+            tensors.append(transform(img))
+            indices.append(i)
+        except Exception as e:
+            print(f"[ERROR] Failed to preprocess ReID crop: {e}")
+    if not tensors:
+        return None, indices
+    return torch.stack(tensors), indices
+
+
+def _preprocess(frame, boxes):
+    if REID_PREPROCESS == "cv2":
+        batch, indices = preprocess_crops(frame, boxes)
+        # Shares memory with the preallocated buffer; valid until the next call
+        return torch.from_numpy(batch), indices
+    return _preprocess_torchvision(frame, boxes)
+
+
+def extract_reid_features(frame, boxes, max_batch_size=REID_MAX_BATCH_SIZE):
+    """
+    Extract ReID features for all boxes of a frame in batched forward passes.
+
+    Args:
+        frame: BGR frame (H, W, 3).
+        boxes: Iterable of (x1, y1, x2, y2) boxes.
+        max_batch_size (int): Max crops per forward pass.
+
+    Returns:
+        (features, valid): ``features`` is an (N, D) array of
+        ``reid_backend.output_dtype``, ``valid`` an (N,) bool mask. Rows of
+        invalid or empty crops are zero and masked out instead of raising.
+    """
+    global _feature_dim
+    reid_backend = get_reid_model().backend
+    boxes = list(boxes)
+    valid = np.zeros(len(boxes), dtype=bool)
+    with metrics_registry.timer("stage_latency_ms", stage="reid_preprocess"):
+        crops, indices = _preprocess(frame, boxes)
+    metrics_registry.inc("reid_crops_total", len(indices))
+    metrics_registry.inc("reid_crops_rejected_total", len(boxes) - len(indices))
+
+    chunks = []
+    batch_size = max(1, int(max_batch_size))
+    for start in range(0, len(indices), batch_size):
+        batch_indices = indices[start:start + batch_size]
+        try:
+            with metrics_registry.timer("stage_latency_ms", stage="reid_forward"):
+                chunks.append((batch_indices, reid_backend(crops[start:start + batch_size])))
+        except Exception as e:
+            print(f"[ERROR] Failed to extract ReID features for batch: {e}")
+
+    if chunks:
+        _feature_dim = chunks[0][1].shape[1]
+    features = np.zeros((len(boxes), _feature_dim or 0), dtype=reid_backend.output_dtype)
+    for batch_indices, out in chunks:
+        features[batch_indices] = out
+        valid[batch_indices] = True
+    return features, valid
+
+
 # def extract_reid_feature(frame, box):
 #     x1, y1, x2, y2 = map(int, box)
 #     person_crop = frame[y1:y2, x1:x2]
@@ -0,0 +1,81 @@
+import cv2
+import numpy as np
+
+# FastReID input size (height, width) and ImageNet normalisation, matching
+# transforms.Resize((256, 128)) + ToTensor() + Normalize(mean, std)
+REID_INPUT_SIZE = (256, 128)
+REID_PIXEL_MEAN = (0.485, 0.456, 0.406)
+REID_PIXEL_STD = (0.229, 0.224, 0.225)
+
+# (x / 255 - mean) / std folded into one multiply-add per RGB channel
+_SCALE = np.array([1.0 / (255.0 * s) for s in REID_PIXEL_STD], dtype=np.float32).reshape(1, 3, 1, 1)
+_OFFSET = np.array([-m / s for m, s in zip(REID_PIXEL_MEAN, REID_PIXEL_STD)], dtype=np.float32).reshape(1, 3, 1, 1)
+
+# Reused between calls, grown to the largest batch seen
+_resized = None
+_batch = None
+
+
+def crop_box(frame, box):
+    """
+    Return the clipped crop for ``box`` or None if it is empty / invalid.
+    """
+    try:
+        x1, y1, x2, y2 = map(int, box)
+    except (TypeError, ValueError):
+        return None
+    h, w = frame.shape[:2]
+    x1, y1 = max(0, x1), max(0, y1)
+    x2, y2 = min(w, x2), min(h, y2)
+    if x2 <= x1 or y2 <= y1:
+        return None
+    return frame[y1:y2, x1:x2]
+
+
+def _buffers(count, size):
+    global _resized, _batch
+    height, width = size
+    if _resized is None or _resized.shape[0] < count or _resized.shape[1:3] != (height, width):
+        capacity = max(count, 0 if _resized is None else _resized.shape[0])
+        _resized = np.empty((capacity, height, width, 3), dtype=np.uint8)
+        _batch = np.empty((capacity, 3, height, width), dtype=np.float32)
+    return _resized, _batch
+
+
+def preprocess_crops(frame, boxes, size=REID_INPUT_SIZE):
+    """
+    Build the normalised NCHW RGB batch for the boxes of one frame.
+
+    Crops are resized straight out of the BGR frame into a preallocated
+    uint8 buffer (INTER_AREA when shrinking, which approximates PIL's
+    antialiased bilinear; INTER_LINEAR when enlarging, which matches it),
+    then converted, channel-swapped and normalised in a single pass into a
+    preallocated float32 buffer.
+
+    Args:
+        frame: BGR frame (H, W, 3).
+        boxes: List of (x1, y1, x2, y2) boxes.
+        size: (height, width) of the model input.
+
+    Returns:
+        (batch, indices): ``batch`` is a (M, 3, H, W) float32 view of an
+        internal buffer that the next call overwrites; ``indices`` lists
+        which of the ``boxes`` its rows belong to (empty crops are skipped).
+    """
+    height, width = size
+    resized, batch = _buffers(len(boxes), size)
+    indices = []
+    for i, box in enumerate(boxes):
+        crop = crop_box(frame, box)
+        if crop is None:
+            continue
+        shrink = crop.shape[0] > height and crop.shape[1] > width
+        cv2.resize(crop, (width, height), dst=resized[len(indices)],
+                   interpolation=cv2.INTER_AREA if shrink else cv2.INTER_LINEAR)
+        indices.append(i)
+    count = len(indices)
+    out = batch[:count]
+    # NHWC BGR uint8 -> NCHW RGB float32; transpose and channel flip are strided views
+    np.multiply(resized[:count].transpose(0, 3, 1, 2)[:, ::-1], _SCALE, out=out)
+    out += _OFFSET
+    return out, indices
@@ -0,0 +1,176 @@
+import pika
+import cv2
+import time
+from collections import deque
+from frame_ring import FrameRingReader
+from frame_codec import decode_frame
+from metrics import REGISTRY as metrics_registry, start_metrics_server
+from wire_format import KIND_RESULT, unpack_frame, unpack_message
+from worker_sharding import SHARDED_FRAME_EXCHANGE, NUM_BUCKETS, bucket_routing_key, camera_routing_key
+
+# Show each camera at most this many times per second
+VIEWER_MAX_FPS = 5.0
+# Recent frames kept per camera to find the one a result belongs to
+VIEWER_FRAME_BUFFER = 30
+# Window size annotated frames are resized to
+VIEWER_WINDOW_SIZE = (900, 700)
+
+# /metrics listener of the viewer (0 disables it)
+VIEWER_METRICS_PORT = 0
+
+# Frames the detector has already moved past are useless to the viewer
+VIEWER_QUEUE_ARGUMENTS = {
+    "x-max-length": 50,
+    "x-overflow": "drop-head",
+}
+
+
+def draw_results(frame, record):
+    """
+    Draw the detections of a result record onto ``frame`` in place.
+    """
+    for detection in record["detections"]:
+        x1, y1, x2, y2 = detection["box"]
+        if detection["reid_id"] is not None:
+            label = f"{detection['class_name']} (ReID:{detection['reid_id']})"
+        else:
+            label = f"{detection['class_name']} (ID:{detection['track_id']})"
+
+        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        cv2.putText(frame, label, (x1, y1 + 10),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
+    return frame
+
+
+class ResultViewer:
+    """
+    Shows detect_person results drawn onto their camera frames.
+
+    Runs as its own process next to the frame and result exchanges, so
+    drawing and ``cv2.waitKey`` never slow down inference. Frame messages
+    are buffered undecoded per camera and only the frame a result refers
+    to (same stream and seq) is decoded, at most ``max_fps`` times per
+    second per camera.
+
+    Args:
+        cameras: Camera ids to show, or None for all.
+        max_fps (float): Per-camera display rate limit.
+        frame_buffer (int): Frame messages kept per camera.
+    """
+
+    def __init__(self, cameras=None, max_fps=VIEWER_MAX_FPS, frame_buffer=VIEWER_FRAME_BUFFER):
+        self.cameras = set(cameras) if cameras else None
+        self.min_interval = 1.0 / max_fps if max_fps else 0.0
+        self.frame_buffer = frame_buffer
+        self.frames = {}  # camera_id -> deque of ((stream, seq), body)
+        self.last_shown = {}
+        self.ring_reader = FrameRingReader()
+        self.counters = {"shown": 0, "rate_limited": 0, "frame_missing": 0}
+
+    def wants(self, camera_id):
+        return self.cameras is None or camera_id in self.cameras
+
+    def on_frame(self, ch, method, properties, body):
+        headers = properties.headers or {}
+        camera_id = headers.get("camera_id")
+        if camera_id is None or not self.wants(camera_id):
+            return
+        frames = self.frames.get(camera_id)
+        if frames is None:
+            frames = self.frames[camera_id] = deque(maxlen=self.frame_buffer)
+        frames.append(((headers.get("stream"), headers.get("seq")), body))
+
+    def on_result(self, ch, method, properties, body):
+        record = unpack_message(body, KIND_RESULT)
+        camera_id = record["camera_id"]
+        if not self.wants(camera_id):
+            return
+        now = time.monotonic()
+        if now - self.last_shown.get(camera_id, float("-inf")) < self.min_interval:
+            self.counters["rate_limited"] += 1
+            return
+        frame = self._frame_for(camera_id, (record.get("stream"), record.get("seq")))
+        if frame is None:
+            self.counters["frame_missing"] += 1
+            return
+        self.last_shown[camera_id] = now
+        self.counters["shown"] += 1
+        with metrics_registry.timer("stage_latency_ms", stage="display"):
+            frame = cv2.resize(draw_results(frame, record), VIEWER_WINDOW_SIZE)
+            cv2.imshow(f"camera {camera_id}", frame)
+
+    def _frame_for(self, camera_id, key):
+        for frame_key, body in reversed(self.frames.get(camera_id, ())):
+            if frame_key == key:
+                break
+        else:
+            return None
+        frame_data = unpack_frame(body)
+        frame = frame_data.get("frame")
+        if frame_data.get("transport") == "shm":
+            # By now the framer may have reused the slot
+            frame = self.ring_reader.read(camera_id, frame_data.get("shm"), copy=True)
+        if frame is None:
+            return None
+        frame = decode_frame(frame, frame_data.get("encoding", "raw"))
+        # decode_frame can hand back a read-only view of the message
+        return frame if frame.flags.writeable else frame.copy()
+
+
+def _bind_frames(channel, frame_exchange, sharded, cameras):
+    result = channel.queue_declare(queue="", exclusive=True, arguments=VIEWER_QUEUE_ARGUMENTS)
+    queue = result.method.queue
+    if sharded:
+        channel.exchange_declare(exchange=SHARDED_FRAME_EXCHANGE, exchange_type="direct")
+        if cameras:
+            keys = {camera_routing_key(camera_id) for camera_id in cameras}
+        else:
+            keys = {bucket_routing_key(bucket) for bucket in range(NUM_BUCKETS)}
+        for key in keys:
+            channel.queue_bind(exchange=SHARDED_FRAME_EXCHANGE, queue=queue, routing_key=key)
+    else:
+        channel.exchange_declare(exchange=frame_exchange, exchange_type="fanout")
+        channel.queue_bind(exchange=frame_exchange, queue=queue)
+    return queue
+
+
+def main(frame_exchange="all_frame", results_exchange="detect_person_object", rabbitmq_host="localhost",
+         cameras=None, max_fps=VIEWER_MAX_FPS, sharded=False):
+    """
+    Show annotated frames until 'q' is pressed.
+
+    Args:
+        frame_exchange (str): Framer exchange (fanout mode).
+        results_exchange (str): Exchange detect_person publishes results to.
+        cameras: Camera ids to show, or None for all.
+        max_fps (float): Per-camera display rate limit.
+        sharded (bool): The framer runs with FRAME_ROUTING = "sharded".
+    """
+    viewer = ResultViewer(cameras=cameras, max_fps=max_fps)
+    for name in viewer.counters:
+        metrics_registry.counter_fn("viewer_frames_total", lambda n=name: viewer.counters[n], event=name)
+    start_metrics_server(VIEWER_METRICS_PORT)
+    connection = pika.BlockingConnection(pika.ConnectionParameters(host=rabbitmq_host, heartbeat=600))
+    channel = connection.channel()
+    frame_queue = _bind_frames(channel, frame_exchange, sharded, cameras)
+    channel.exchange_declare(exchange=results_exchange, exchange_type="fanout")
+    result_queue = channel.queue_declare(queue="", exclusive=True).method.queue
+    channel.queue_bind(exchange=results_exchange, queue=result_queue)
+    channel.basic_consume(queue=frame_queue, on_message_callback=viewer.on_frame, auto_ack=True)
+    channel.basic_consume(queue=result_queue, on_message_callback=viewer.on_result, auto_ack=True)
+    print("[Viewer] Waiting for results, press 'q' to quit")
+    try:
+        while channel.is_open:
+            connection.process_data_events(time_limit=0.01)
+            if cv2.waitKey(1) & 0xFF == ord("q"):
+                break
+    finally:
+        print(f"[Viewer] {viewer.counters}")
+        cv2.destroyAllWindows()
+        viewer.ring_reader.close()
+        if connection.is_open:
+            connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+def box_iou(a, b):
+    """
+    IoU of two (x1, y1, x2, y2) boxes.
+    """
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, ix2 - ix1) * max(0, iy2 - iy1)
+    area_a = max(0, a[2] - a[0]) * max(0, a[3] - a[1])
+    area_b = max(0, b[2] - b[0]) * max(0, b[3] - b[1])
+    union = area_a + area_b - inter
+    return inter / union if union > 0 else 0.0
+
+
+class TrackEntry:
+    """
+    Cached ReID state of one tracker track.
+    """
+
+    __slots__ = ("reid_id", "feature", "box", "score", "distance", "refreshed_at", "last_seen")
+
+    def __init__(self, reid_id, feature, box, score, distance, frame_index):
+        self.reid_id = reid_id
+        self.feature = feature
+        self.box = box
+        self.score = score
+        self.distance = distance
+        self.refreshed_at = frame_index
+        self.last_seen = frame_index
+
+
+class TrackCache:
+    """
+    Per-camera cache mapping tracker ``track_id`` to its resolved ReID identity.
+
+    A track is re-embedded only when its refresh policy fires:
+    every ``refresh_interval`` frames, when the box moved or resized enough
+    that IoU with the cached box drops below ``min_iou``, when the detection
+    score changed by more than ``score_jump``, or when the cached match
+    distance was weaker than ``weak_distance``. Tracks not reported by the
+    tracker for ``max_missing_frames`` frames are dropped.
+    """
+
+    def __init__(self, refresh_interval=30, min_iou=0.5, score_jump=0.2,
+                 weak_distance=0.45, max_missing_frames=30):
+        self.refresh_interval = refresh_interval
+        self.min_iou = min_iou
+        self.score_jump = score_jump
+        self.weak_distance = weak_distance
+        self.max_missing_frames = max_missing_frames
+        self.entries = {}
+        self.frame_index = 0
+        self.counters = {"hits": 0, "refreshes": 0, "expired": 0}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, track_id):
+        return self.entries.get(track_id)
+
+    def step(self, active_track_ids):
+        """
+        Advance one frame and expire tracks the tracker has dropped.
+        """
+        self.frame_index += 1
+        for track_id in active_track_ids:
+            entry = self.entries.get(track_id)
+            if entry is not None:
+                entry.last_seen = self.frame_index
+        stale = [tid for tid, entry in self.entries.items()
+                 if self.frame_index - entry.last_seen > self.max_missing_frames]
+        for track_id in stale:
+            del self.entries[track_id]
+        self.counters["expired"] += len(stale)
+        return stale
+
+    def needs_refresh(self, track_id, box, score):
+        """
+        Return True if the track must be re-embedded this frame.
+        """
+        entry = self.entries.get(track_id)
+        refresh = (
+            entry is None
+            or self.frame_index - entry.refreshed_at >= self.refresh_interval
+            or box_iou(entry.box, box) < self.min_iou
+            or abs(score - entry.score) > self.score_jump
+            or entry.distance > self.weak_distance
+        )
+        self.counters["refreshes" if refresh else "hits"] += 1
+        return refresh
+
+    def update(self, track_id, reid_id, feature, box, score, distance):
+        """
+        Store a freshly resolved identity for ``track_id``.
+        """
+        entry = TrackEntry(reid_id, feature, box, score, distance, self.frame_index)
+        self.entries[track_id] = entry
+        return entry
+
+    def stats(self):
+        stats = dict(self.counters)
+        stats["size"] = len(self.entries)
+        return stats
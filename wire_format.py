@@ -0,0 +1,160 @@
+import json
+import struct
+
+import numpy as np
+
+# Every broker message is:
+#
+#   header   magic "MC", major, minor, kind, flags, meta length, payload length
+#   meta     compact UTF-8 JSON object (camera ids, stamps, settings, ...)
+#   padding  up to the next 8-byte boundary
+#   payload  optional raw bytes: a frame's pixels or its encoded image
+#
+# Readers accept any minor version of their own major: new minor versions
+# may only add meta fields, which older readers ignore. A new major means
+# the layout changed and old readers reject the message.
+WIRE_MAGIC = b"MC"
+WIRE_MAJOR = 1
+WIRE_MINOR = 0
+_HEADER = struct.Struct("<2sBBBBII")
+_ALIGN = 8
+
+# Message kinds
+KIND_CAMERA_COMMAND = 1   # comman_api -> framer
+KIND_FRAME = 2            # framer -> detect_person
+KIND_LOG = 3              # all services -> log queue
+KIND_RESULT = 4           # detect_person -> processed results exchange
+KIND_WORKER_HEARTBEAT = 5  # detect_person <-> detect_person (sharded mode)
+KIND_GALLERY_RECORD = 6   # detect_person gallery append log (on disk, see gallery_store)
+KIND_CAMERA_ACTIVITY = 7  # detect_person -> framer (adaptive frame rate, see frame_rate)
+KIND_NAMES = {
+    KIND_CAMERA_COMMAND: "camera_command",
+    KIND_FRAME: "frame",
+    KIND_LOG: "log",
+    KIND_RESULT: "result",
+    KIND_WORKER_HEARTBEAT: "worker_heartbeat",
+    KIND_GALLERY_RECORD: "gallery_record",
+    KIND_CAMERA_ACTIVITY: "camera_activity",
+}
+
+# Meta key describing an ndarray payload (dtype and shape)
+_ARRAY_KEY = "_array"
+
+
+class WireFormatError(ValueError):
+    """
+    A message is not in the wire format, or not in a version this side reads.
+    """
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    raise TypeError(f"{type(value).__name__} is not serializable in message meta")
+
+
+def _padding(length):
+    return -length % _ALIGN
+
+
+def pack(kind, meta, payload=None):
+    """
+    Serialize one message.
+
+    Args:
+        kind (int): One of the KIND_* constants.
+        meta (dict): Small JSON-serializable fields.
+        payload: Optional ndarray (sent as its raw bytes, dtype and shape
+            go into the meta) or bytes-like object.
+
+    Returns:
+        bytes: The message body.
+    """
+    if isinstance(payload, np.ndarray):
+        meta = dict(meta)
+        meta[_ARRAY_KEY] = {"dtype": payload.dtype.str, "shape": list(payload.shape)}
+        payload = memoryview(np.ascontiguousarray(payload)).cast("B")
+    elif payload is not None:
+        payload = memoryview(payload).cast("B")
+    meta_bytes = json.dumps(meta, separators=(",", ":"), default=_json_default).encode("utf-8")
+    payload_len = 0 if payload is None else payload.nbytes
+    header = _HEADER.pack(WIRE_MAGIC, WIRE_MAJOR, WIRE_MINOR, kind, 0, len(meta_bytes), payload_len)
+    parts = [header, meta_bytes]
+    if payload is not None:
+        parts.append(b"\0" * _padding(_HEADER.size + len(meta_bytes)))
+        parts.append(payload)
+    return b"".join(parts)
+
+
+def unpack(body, expect_kind=None):
+    """
+    Parse a message without copying its payload.
+
+    Returns:
+        (kind, meta, payload): ``payload`` is None, a read-only ndarray view
+        of ``body`` (array payloads) or a memoryview of ``body``.
+    """
+    if len(body) < _HEADER.size:
+        raise WireFormatError(f"Message of {len(body)} bytes is shorter than the header")
+    magic, major, minor, kind, _, meta_len, payload_len = _HEADER.unpack_from(body)
+    if magic != WIRE_MAGIC:
+        raise WireFormatError("Not a wire format message (bad magic)")
+    if major != WIRE_MAJOR:
+        raise WireFormatError(f"Unsupported wire format version {major}.{minor}, this side reads {WIRE_MAJOR}.x")
+    if expect_kind is not None and kind != expect_kind:
+        raise WireFormatError(f"Expected a {KIND_NAMES.get(expect_kind, expect_kind)} message, "
+                              f"got {KIND_NAMES.get(kind, kind)}")
+    meta_end = _HEADER.size + meta_len
+    payload_start = meta_end + (_padding(meta_end) if payload_len else 0)
+    if payload_start + payload_len > len(body):
+        raise WireFormatError("Truncated message")
+    try:
+        meta = json.loads(bytes(memoryview(body)[_HEADER.size:meta_end]))
+    except ValueError as e:
+        raise WireFormatError(f"Malformed message meta: {e}")
+    payload = None
+    if payload_len:
+        array = meta.pop(_ARRAY_KEY, None)
+        if array is not None:
+            dtype = np.dtype(array["dtype"])
+            payload = np.frombuffer(body, dtype=dtype, count=payload_len // dtype.itemsize,
+                                    offset=payload_start).reshape(array["shape"])
+        else:
+            payload = memoryview(body)[payload_start:payload_start + payload_len]
+    return kind, meta, payload
+
+
+def pack_message(kind, message):
+    """
+    Serialize a payload-less message (command, log record, result, ...).
+    """
+    return pack(kind, message)
+
+
+def unpack_message(body, expect_kind=None):
+    """
+    Parse a payload-less message back into a dict.
+    """
+    return unpack(body, expect_kind)[1]
+
+
+def pack_frame(frame_data):
+    """
+    Serialize a framer message; ``frame_data["frame"]`` becomes the payload.
+    """
+    meta = {key: value for key, value in frame_data.items() if key != "frame"}
+    return pack(KIND_FRAME, meta, frame_data.get("frame"))
+
+
+def unpack_frame(body):
+    """
+    Parse a framer message; ``"frame"`` is a zero-copy, read-only view into
+    ``body`` (or None when the pixels travel out of band, e.g. shm).
+    """
+    _, frame_data, payload = unpack(body, KIND_FRAME)
+    frame_data["frame"] = payload
+    return frame_data
@@ -0,0 +1,112 @@
+import hashlib
+import os
+import socket
+import time
+
+# Cameras are hashed into a fixed number of buckets; workers own buckets
+NUM_BUCKETS = 64
+
+# Direct exchange the framer publishes to in sharded mode, routing key "bucket.<n>"
+SHARDED_FRAME_EXCHANGE = "all_frame_sharded"
+# Fanout exchange detect_person workers announce themselves on
+WORKER_EXCHANGE = "detect_person_workers"
+
+
+def _stable_hash(text):
+    # Python's hash() is salted per process; workers must agree on buckets
+    return int.from_bytes(hashlib.md5(text.encode("utf-8")).digest()[:8], "big")
+
+
+def bucket_of(camera_id, num_buckets=NUM_BUCKETS):
+    """
+    Bucket a camera's frames are routed to.
+    """
+    return _stable_hash(str(camera_id)) % num_buckets
+
+
+def bucket_routing_key(bucket):
+    return f"bucket.{bucket}"
+
+
+def camera_routing_key(camera_id, num_buckets=NUM_BUCKETS):
+    return bucket_routing_key(bucket_of(camera_id, num_buckets))
+
+
+def bucket_owner(bucket, workers):
+    """
+    Rendezvous (highest random weight) hashing: the worker with the highest
+    score for a bucket owns it. When a worker joins or leaves only the
+    buckets it gains or loses move; every other assignment stays put.
+    """
+    if not workers:
+        return None
+    return max(workers, key=lambda worker: _stable_hash(f"{worker}:{bucket}"))
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class ShardMembership:
+    """
+    Tracks live detect_person workers from their heartbeats and derives the
+    buckets this worker owns.
+
+    Args:
+        worker_id (str): This worker's id.
+        heartbeat_interval (float): Seconds between announcements.
+        missed_heartbeats (int): A peer is gone after this many missed beats.
+        num_buckets (int): Number of camera buckets.
+    """
+
+    def __init__(self, worker_id=None, heartbeat_interval=5.0, missed_heartbeats=3, num_buckets=NUM_BUCKETS):
+        self.worker_id = worker_id or default_worker_id()
+        self.heartbeat_interval = heartbeat_interval
+        self.timeout = heartbeat_interval * missed_heartbeats
+        self.num_buckets = num_buckets
+        self.started = time.monotonic()
+        self.last_heartbeat = None
+        self._peers = {}  # worker_id -> last seen (monotonic)
+
+    def heartbeat_due(self, now=None):
+        now = time.monotonic() if now is None else now
+        return self.last_heartbeat is None or now - self.last_heartbeat >= self.heartbeat_interval
+
+    def heartbeat_message(self, leaving=False, now=None):
+        self.last_heartbeat = time.monotonic() if now is None else now
+        return {"worker_id": self.worker_id, "leaving": leaving, "time": time.time()}
+
+    def observe(self, message, now=None):
+        """
+        Record a peer heartbeat (or its goodbye).
+        """
+        now = time.monotonic() if now is None else now
+        worker_id = message.get("worker_id")
+        if not worker_id or worker_id == self.worker_id:
+            return
+        if message.get("leaving"):
+            self._peers.pop(worker_id, None)
+        else:
+            self._peers[worker_id] = now
+
+    def live_workers(self, now=None):
+        now = time.monotonic() if now is None else now
+        for worker_id, seen in list(self._peers.items()):
+            if now - seen > self.timeout:
+                del self._peers[worker_id]
+        return sorted(self._peers) + [self.worker_id]
+
+    def ready(self, now=None):
+        """
+        A new worker listens for two heartbeat intervals before claiming
+        buckets, so it doesn't grab buckets its peers still own.
+        """
+        now = time.monotonic() if now is None else now
+        return now - self.started >= 2 * self.heartbeat_interval
+
+    def owned_buckets(self, now=None):
+        workers = self.live_workers(now)
+        return {b for b in range(self.num_buckets) if bucket_owner(b, workers) == self.worker_id}
+
+    def owns_camera(self, camera_id, buckets):
+        return bucket_of(camera_id, self.num_buckets) in buckets